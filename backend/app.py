@@ -1,21 +1,55 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, has_request_context, request, jsonify, make_response, send_file, url_for
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import and_, case, event, func, insert, inspect, literal, or_, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.serving import is_running_from_reloader
 from jwt import encode as jwt_encode, decode as jwt_decode
 import time
-import random
+import base64
+import hashlib
+import contextlib
+import json
 import datetime
+import logging
 import os
-import threading
+import random
+import tempfile
 from dotenv import load_dotenv
 from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
+from blob_store import create_blob_store, decode_data_url, is_valid_hash
+from scheduler import Scheduler
+from pricing import base_price, build_schedule, price_at_step, step_at, tier_boundaries, DECAY_INTERVAL
+from recommendations import RecommendationCache, RECENT_PURCHASE_DAYS, score_candidates, top_k
+from principal_cache import Principal, PrincipalCache
+from events import create_broker, format_sse
+from ids import new_id, new_ids
+from notifications import NotificationService
+from cache import create_cache
+from db_pool import check_pool, engine_options_from_env, pool_metrics
+from query_profiler import QueryProfiler
+from structured_logging import configure_logging
+from geohash import covering_prefixes, encode as geohash_encode, nearest_within
+from image_pipeline import OUTPUT_CONTENT_TYPE, VARIANT_SIZES, ImagePipelineUnavailable, create_pipeline
 
 # Load environment variables
 load_dotenv()
 
+# JSON logs written off the request thread, with per-route levels (see structured_logging.py)
+log_control = configure_logging(route=lambda: request.endpoint if has_request_context() else None)
+logger = logging.getLogger('f2c')
+access_logger = logging.getLogger('f2c.access')
+# Share of successful, fast requests that get an access log line (errors and slow requests always do)
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv('LOG_REQUEST_SAMPLE_RATE', '1.0'))
+LOG_SLOW_REQUEST_MS = int(os.getenv('LOG_SLOW_REQUEST_MS', '1000'))
+
 app = Flask(__name__)
+# Trust the proxy's scheme/host headers so generated image URLs match what clients see
+app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 CORS(app)
 
 # Database configuration
@@ -28,10 +62,99 @@ if app.config['SQLALCHEMY_DATABASE_URI'] and app.config['SQLALCHEMY_DATABASE_URI
     app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace("postgres://", "postgresql://", 1)
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool size, overflow, timeout, recycle and pre-ping come from DB_POOL_* (see db_pool.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI'])
+DB_POOL_STARTUP_CHECK = os.getenv('DB_POOL_STARTUP_CHECK', 'true').lower() == 'true'
 app.config['SECRET_KEY'] = os.getenv('JWT_SECRET', 'your-secret-key')
 
 db = SQLAlchemy(app)
 
+# Background jobs (see scheduler.py)
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+SCHEDULER_POLL_SECONDS = int(os.getenv('SCHEDULER_POLL_SECONDS', '30'))
+EXPIRY_SWEEP_INTERVAL_SECONDS = int(os.getenv('EXPIRY_SWEEP_INTERVAL_SECONDS', '300'))
+LOW_STOCK_WINDOW_HOURS = 24
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = 3600
+NOTIFICATION_ARCHIVE_INTERVAL_SECONDS = 24 * 3600
+# Read notifications older than this move to notifications_archive
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+
+# Orders of at least this many kg count towards the large-order review streak
+LARGE_ORDER_KG = 15
+
+# Idempotency-Key handling for retried writes
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = 10  # How long a duplicate waits for the in-flight request
+IDEMPOTENCY_LOCK_SECONDS = 60  # In-progress claims older than this were abandoned by a dead worker
+
+# Per-request statement counting (see query_profiler.py); requests over either limit are logged
+QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'true').lower() == 'true'
+query_profiler = QueryProfiler(
+    max_queries=int(os.getenv('QUERY_PROFILER_MAX_QUERIES', '25')),
+    slow_request_ms=int(os.getenv('QUERY_PROFILER_SLOW_MS', '500')),
+    sample_rate=float(os.getenv('QUERY_PROFILER_SAMPLE_RATE', '0'))  # Share of requests whose statement fingerprints are captured
+)
+if QUERY_PROFILER_ENABLED:
+    with app.app_context():
+        query_profiler.install(db.engine)
+
+# Content-addressed storage for product images (see blob_store.py)
+blob_store = create_blob_store()
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Uploads are re-encoded as WebP with smaller variants for lists (see image_pipeline.py)
+image_pipeline = create_pipeline()
+LIST_IMAGE_VARIANT = 'card'  # Catalog and recommendation cards
+LINE_IMAGE_VARIANT = 'thumb'  # Cart and order lines
+
+# Streaming uploads (POST/PUT /api/images): hard size limit; bodies go to a temp file that image workers read by path
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MULTIPART_OVERHEAD_BYTES = 16 * 1024  # Boundaries and part headers around the file
+# Products need a photo with an EXIF GPS position (the dashboard used to check this in the browser)
+REQUIRE_GEOTAGGED_IMAGES = os.getenv('REQUIRE_GEOTAGGED_IMAGES', 'true').lower() == 'true'
+
+
+class UploadLimitRequest(Request):
+    """Werkzeug stops reading the body of an image upload once it passes the upload limit"""
+    
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'upload_image':
+            return IMAGE_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # The multipart parser writes image uploads straight to a named file, which is handed to the pipeline as is
+        if self.endpoint == 'upload_image':
+            return tempfile.NamedTemporaryFile()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+app.request_class = UploadLimitRequest
+
+# Authenticated principals (see principal_cache.py)
+principal_cache = PrincipalCache(
+    ttl=int(os.getenv('PRINCIPAL_CACHE_TTL_SECONDS', '60')),
+    max_entries=int(os.getenv('PRINCIPAL_CACHE_MAX_ENTRIES', '10000'))
+)
+
+# Live updates pushed over /api/stream (see events.py)
+event_broker = create_broker(dsn=app.config['SQLALCHEMY_DATABASE_URI'])
+STREAM_HEARTBEAT_SECONDS = 15
+# Streams are closed periodically so the token is re-checked when the browser reconnects
+STREAM_MAX_SECONDS = int(os.getenv('STREAM_MAX_SECONDS', '300'))
+
+# Recommendations (see recommendations.py)
+RECOMMENDATION_LIMIT = 12
+recommendation_cache = RecommendationCache(
+    ttl=int(os.getenv('RECOMMENDATION_CACHE_TTL_SECONDS', '300')),
+    max_users=int(os.getenv('RECOMMENDATION_CACHE_MAX_USERS', '10000'))
+)
+
+# Cached responses for hot read endpoints (see cache.py)
+response_cache = create_cache()
+
 # Database Models
 class User(db.Model):
     __tablename__ = 'users'
@@ -49,9 +172,53 @@ class User(db.Model):
     underReview = db.Column(db.Boolean, default=False)
     reviewReason = db.Column(db.Text)
     reviewDate = db.Column(db.DateTime)
+    # Consecutive large orders among the user's most recent delivered orders
+    largeOrderStreak = db.Column(db.Integer, nullable=False, default=0)
+    # Maintained alongside every notification insert and read (see adjust_unread_counts)
+    unreadNotifications = db.Column(db.Integer, nullable=False, default=0)
+    # Saved location; also stands in for a farmer's products whose photo has no GPS position
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    createdAt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class Image(db.Model):
+    __tablename__ = 'images'
+    
+    hash = db.Column(db.String(64), primary_key=True)
+    contentType = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer)  # Unknown for images stored before the pipeline
+    height = db.Column(db.Integer)
+    createdAt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class ImageUpload(db.Model):
+    """Who uploaded an image; images are shared by hash, so each uploader keeps the geotag of their own copy"""
+    __tablename__ = 'image_uploads'
+    
+    imageHash = db.Column(db.String(64), db.ForeignKey('images.hash'), primary_key=True)
+    userId = db.Column(db.String(255), db.ForeignKey('users.id'), primary_key=True)
+    # From the upload's EXIF block (see exif_gps.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    takenAt = db.Column(db.DateTime)
     createdAt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
 
+class ImageVariant(db.Model):
+    """A smaller rendition of an image (see image_pipeline.VARIANT_SIZES)"""
+    __tablename__ = 'image_variants'
+    
+    imageHash = db.Column(db.String(64), db.ForeignKey('images.hash'), primary_key=True)
+    variant = db.Column(db.String(20), primary_key=True)
+    blobHash = db.Column(db.String(64), nullable=False)
+    contentType = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+
+
 class Product(db.Model):
     __tablename__ = 'products'
     
@@ -65,11 +232,21 @@ class Product(db.Model):
     cropName = db.Column(db.String(255), nullable=False)
     pricePerKg = db.Column(db.Numeric(10, 2), nullable=False)
     availableQuantity = db.Column(db.Integer, nullable=False)
-    image = db.Column(db.Text(length=4294967295), nullable=False)
+    imageHash = db.Column(db.String(64), db.ForeignKey('images.hash'), nullable=False)
+    # Where and when the product photo was taken, copied from its image
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))  # Of latitude/longitude, for /api/products/nearby (see geohash.py)
+    photoTakenAt = db.Column(db.DateTime)
     # Seasonal availability fields
     seasonalMonths = db.Column(db.String(50), nullable=True)  # e.g., "1,2,3,4" for Jan-Apr
     isSeasonal = db.Column(db.Boolean, default=True)
     createdAt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Precomputed price decay schedule (see pricing.py)
+    priceStep = db.Column(db.Integer)
+    currentPrice = db.Column(db.Numeric(10, 2))
+    nextPriceChangeAt = db.Column(db.DateTime)
+    expiresAt = db.Column(db.DateTime)
 
 class Order(db.Model):
     __tablename__ = 'orders'
@@ -81,6 +258,7 @@ class Order(db.Model):
     deliveryType = db.Column(db.Enum('self', 'partner', name='delivery_type'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     status = db.Column(db.String(50), default='placed')
+    totalQuantity = db.Column(db.Integer)  # Sum of line quantities (kg); NULL for orders placed before it existed
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
@@ -91,7 +269,7 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     pricePerKg = db.Column(db.Numeric(10, 2), nullable=False)
     cropName = db.Column(db.String(255), nullable=False)
-    image = db.Column(db.Text(length=4294967295), nullable=False)
+    imageHash = db.Column(db.String(64), db.ForeignKey('images.hash'), nullable=False)
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -101,6 +279,26 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     read = db.Column(db.Boolean, default=False)
+    # Structured de-duplication key for system alerts: (userId, kind, productId, dedupeWindow)
+    kind = db.Column(db.String(50))
+    productId = db.Column(db.String(255))
+    dedupeWindow = db.Column(db.Integer)
+    
+    __table_args__ = (db.UniqueConstraint('userId', 'kind', 'productId', 'dedupeWindow', name='unique_notification_dedupe'),)
+
+class NotificationArchive(db.Model):
+    __tablename__ = 'notifications_archive'
+    
+    # Read notifications past the retention window (see archive_read_notifications)
+    id = db.Column(db.String(255), primary_key=True)
+    userId = db.Column(db.String(255), nullable=False, index=True)
+    message = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime)
+    read = db.Column(db.Boolean, default=True)
+    kind = db.Column(db.String(50))
+    productId = db.Column(db.String(255))
+    dedupeWindow = db.Column(db.Integer)
+    archivedAt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
 class Cart(db.Model):
     __tablename__ = 'cart'
@@ -111,7 +309,7 @@ class Cart(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     pricePerKg = db.Column(db.Numeric(10, 2), nullable=False)
     cropName = db.Column(db.String(255), nullable=False)
-    image = db.Column(db.Text(length=4294967295), nullable=False)
+    imageHash = db.Column(db.String(64), db.ForeignKey('images.hash'), nullable=False)
 
 class SearchHistory(db.Model):
     __tablename__ = 'search_history'
@@ -148,108 +346,667 @@ class CustomerNote(db.Model):
     # Ensure one note per farmer-customer pair
     __table_args__ = (db.UniqueConstraint('farmerId', 'customerId', name='unique_farmer_customer_note'),)
 
+class JobLease(db.Model):
+    __tablename__ = 'job_leases'
+    
+    # One row per scheduled job; whoever holds an unexpired lease runs the job
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(255))
+    leaseExpiresAt = db.Column(db.DateTime)
+    lastRunAt = db.Column(db.DateTime)
+    lastDurationMs = db.Column(db.Integer)
+    lastStatus = db.Column(db.String(20))
+    lastError = db.Column(db.Text)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    # First response per (user, endpoint, Idempotency-Key), replayed to retries until it expires
+    userId = db.Column(db.String(255), primary_key=True)
+    endpoint = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    requestHash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress | completed
+    responseStatus = db.Column(db.Integer)
+    responseBody = db.Column(db.Text)
+    createdAt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    expiresAt = db.Column(db.DateTime, nullable=False)
+
+class ResourceVersion(db.Model):
+    __tablename__ = 'resource_versions'
+    
+    # Bumped after every commit that changes the resource (see bump_resource_versions); the source of list ETags
+    resource = db.Column(db.String(255), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updatedAt = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class FarmerCustomerStats(db.Model):
+    __tablename__ = 'farmer_customer_stats'
+    
+    # Rollup behind the Customer Contact Center, maintained as orders are placed or cancelled
+    farmerId = db.Column(db.String(255), db.ForeignKey('users.id'), primary_key=True)
+    customerId = db.Column(db.String(255), db.ForeignKey('users.id'), primary_key=True)
+    totalOrders = db.Column(db.Integer, nullable=False, default=0)
+    totalSpent = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    totalQuantity = db.Column(db.Integer, nullable=False, default=0)
+    lastOrderDate = db.Column(db.DateTime)
+    isRepeatCustomer = db.Column(db.Boolean, nullable=False, default=False)
+
+# Live update events
+def queue_invalidation(*tags, session=None):
+    """Bump these resources' versions and invalidate their cached responses once the current transaction commits"""
+    session = session or db.session
+    session.info.setdefault('pending_invalidations', set()).update(tags)
+
+def bump_resource_versions(resources):
+    """Increment resource_versions rows in their own short transaction, creating missing ones"""
+    with db.engine.begin() as connection:
+        for resource in sorted(resources):  # Fixed order so concurrent bumps can't deadlock
+            bumped = connection.execute(
+                update(ResourceVersion)
+                .where(ResourceVersion.resource == resource)
+                .values(version=ResourceVersion.version + 1, updatedAt=datetime.datetime.utcnow())
+            ).rowcount
+            if bumped:
+                continue
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(ResourceVersion).values(resource=resource, version=1, updatedAt=datetime.datetime.utcnow()))
+            except IntegrityError:
+                # Another writer created it first
+                connection.execute(
+                    update(ResourceVersion)
+                    .where(ResourceVersion.resource == resource)
+                    .values(version=ResourceVersion.version + 1, updatedAt=datetime.datetime.utcnow())
+                )
+
+def queue_event(user_id, event_type, data, session=None):
+    """Publish an event to a user's stream once the current transaction commits"""
+    session = session or db.session
+    session.info.setdefault('pending_events', []).append((user_id, event_type, data))
+
+def notification_event(notification):
+    return {
+        'id': notification.id,
+        'userId': notification.userId,
+        'message': notification.message,
+        'timestamp': notification.timestamp.isoformat() if notification.timestamp else None,
+        'read': bool(notification.read)
+    }
+
+def product_event(product, deleted=False):
+    return {
+        'id': product.id,
+        'availableQuantity': 0 if deleted else product.availableQuantity,
+        'expiresAt': product.expiresAt.isoformat() if product.expiresAt else None,
+        'deleted': deleted
+    }
+
+@event.listens_for(db.session, 'after_flush')
+def queue_model_events(session, flush_context):
+    """Turn flushed notification and stock changes into stream events"""
+    unread_changes = {}
+    for obj in session.new:
+        if isinstance(obj, Notification):
+            queue_event(obj.userId, 'notification', notification_event(obj), session)
+            queue_invalidation(f"notifications:{obj.userId}", session=session)
+            if not obj.read:
+                unread_changes[obj.userId] = unread_changes.get(obj.userId, 0) + 1
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            state = inspect(obj)
+            if state.attrs.availableQuantity.history.has_changes() or state.attrs.expiresAt.history.has_changes():
+                queue_event(obj.farmerId, 'product', product_event(obj), session)
+        elif isinstance(obj, Notification):
+            history = inspect(obj).attrs.read.history
+            if history.has_changes() and bool(history.deleted and history.deleted[0]) != bool(obj.read):
+                queue_invalidation(f"notifications:{obj.userId}", session=session)
+                unread_changes[obj.userId] = unread_changes.get(obj.userId, 0) + (-1 if obj.read else 1)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            queue_event(obj.farmerId, 'product', product_event(obj, deleted=True), session)
+        elif isinstance(obj, Notification):
+            queue_invalidation(f"notifications:{obj.userId}", session=session)
+            if not obj.read:
+                unread_changes[obj.userId] = unread_changes.get(obj.userId, 0) - 1
+    if unread_changes:
+        adjust_unread_counts(unread_changes, session.connection())
+
+@event.listens_for(db.session, 'after_commit')
+def publish_pending_events(session):
+    invalidations = session.info.pop('pending_invalidations', None)
+    if invalidations:
+        response_cache.invalidate(*invalidations)
+        try:
+            bump_resource_versions(invalidations)
+        except Exception as e:
+            logger.warning("Failed to bump resource versions: %s", e)
+    for user_id, event_type, data in session.info.pop('pending_events', []):
+        try:
+            event_broker.publish(f"user:{user_id}", event_type, data)
+        except Exception as e:
+            logger.warning("Failed to publish %s event: %s", event_type, e)
+    notifications = session.info.pop('pending_notifications', None)
+    if notifications:
+        notification_service.enqueue_many(notifications)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_pending_events(session):
+    session.info.pop('pending_events', None)
+    session.info.pop('pending_notifications', None)
+    session.info.pop('pending_invalidations', None)
+
+def adjust_unread_counts(changes, connection=None):
+    """Apply {userId: delta} to the users' unread notification counters"""
+    execute = connection.execute if connection is not None else db.session.execute
+    for user_id, delta in changes.items():
+        if delta:
+            execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(unreadNotifications=case(
+                    (User.unreadNotifications + delta < 0, 0),
+                    else_=User.unreadNotifications + delta
+                ))
+                .execution_options(synchronize_session=False)
+            )
+
+def count_by_user(rows):
+    counts = {}
+    for row in rows:
+        counts[row['userId']] = counts.get(row['userId'], 0) + 1
+    return counts
+
+# Notifications (see notifications.py)
+def queue_notification(user_id, kind, payload):
+    """Hand a notification to the fan-out service once the current transaction commits"""
+    db.session.info.setdefault('pending_notifications', []).append((user_id, kind, payload))
+
+def write_notification_rows(rows):
+    """Bulk-insert a batch of rendered notifications (runs on the service's worker)"""
+    try:
+        for row, notification_id in zip(rows, new_ids('notif', len(rows))):
+            row.update(id=notification_id, read=False)
+        db.session.execute(insert(Notification), rows)
+        adjust_unread_counts(count_by_user(rows))
+        queue_invalidation(*{f"notifications:{row['userId']}" for row in rows})
+        for row in rows:
+            queue_event(row['userId'], 'notification', notification_event(Notification(**row)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+notification_service = NotificationService(write_notification_rows, context=app.app_context)
+
 # Helper Functions
-def calculate_effective_price(product):
+def calculate_effective_price(product, now=None):
     """Calculate effective price with 20% discount every 20 hours"""
     if not product or not product.createdAt:
-        return (float(product.pricePerKg) * 1.02 if product else 0, 0)
-    
-    # Calculate time since product was created
-    created_time = product.createdAt
-    if isinstance(created_time, str):
-        try:
-            created_time = datetime.datetime.fromisoformat(created_time.replace('Z', '+00:00'))
-        except:
-            created_time = datetime.datetime.utcnow()
-    
-    current_time = datetime.datetime.utcnow()
-    if isinstance(created_time, datetime.datetime):
-        time_diff = current_time - created_time
-        hours_since = time_diff.total_seconds() / 3600
-    else:
-        hours_since = 0
+        return (base_price(product.pricePerKg) if product else 0, 0)
     
-    # Calculate discount: 20% off every 20 hours
-    intervals = max(0, int(hours_since / 20))
-    multiplier = (0.8 ** intervals)  # 20% off per 20h interval
+    now = now or datetime.datetime.utcnow()
     
-    # Base price with 2% commission
-    base_with_commission = float(product.pricePerKg) * 1.02
-    effective_price = max(0, round(base_with_commission * multiplier, 2))
+    # The stored schedule holds until the next price boundary
+    if product.currentPrice is not None and product.nextPriceChangeAt and now < product.nextPriceChangeAt:
+        return float(product.currentPrice), product.priceStep
     
-    return effective_price, intervals
+    intervals = step_at(product.createdAt, now)
+    return price_at_step(product.pricePerKg, intervals), intervals
+
+def next_price_boundary(product, now):
+    """When a listing's effective price next changes (its price drops or it expires)"""
+    if product.nextPriceChangeAt and product.nextPriceChangeAt > now:
+        return product.nextPriceChangeAt
+    if product.createdAt:
+        return product.createdAt + DECAY_INTERVAL * (step_at(product.createdAt, now) + 1)
+    return None
+
+def low_stock_window(now):
+    """Index of the de-duplication window a low-stock alert falls into"""
+    return int((now - datetime.datetime(1970, 1, 1)).total_seconds() // (LOW_STOCK_WINDOW_HOURS * 3600))
+
+def advance_price_schedules(now):
+    """Recompute stored price schedules that are missing or have crossed a price boundary"""
+    stale = db.session.execute(
+        db.select(Product.id, Product.pricePerKg, Product.createdAt)
+        .where(
+            Product.availableQuantity > 0,
+            or_(
+                Product.currentPrice.is_(None),
+                Product.expiresAt.is_(None),
+                Product.nextPriceChangeAt <= now
+            )
+        )
+    ).all()
+    if stale:
+        db.session.execute(update(Product), [
+            dict(build_schedule(row.pricePerKg, row.createdAt or now, now), id=row.id)
+            for row in stale
+        ])
+        queue_invalidation('catalog')
+    return len(stale)
 
 def check_and_remove_expired_products():
     """Check for products with zero or negative effective price and remove them"""
     try:
-        products = Product.query.filter(Product.availableQuantity > 0).all()
+        now = datetime.datetime.utcnow()
+        
+        advance_price_schedules(now)
+        
+        notifications = []
+        
+        # Low-stock notification (<= 3kg), at most one per product per window
+        window = low_stock_window(now)
+        already_notified = db.select(Notification.id).where(
+            Notification.kind == 'low_stock',
+            Notification.productId == Product.id,
+            Notification.dedupeWindow == window
+        ).exists()
+        low_stock = db.session.execute(
+            db.select(Product.id, Product.farmerId, Product.cropName, Product.availableQuantity)
+            .where(Product.availableQuantity > 0, Product.availableQuantity <= 3, ~already_notified)
+        ).all()
+        for product in low_stock:
+            notifications.append({
+                'userId': product.farmerId,
+                'kind': 'low_stock',
+                'productId': product.id,
+                'dedupeWindow': window,
+                'message': f"⚠️ Low stock alert! You only have {product.availableQuantity}kg of {product.cropName} remaining. Update your stock if more is available."
+            })
+        
+        # Listings whose price has decayed to zero
+        expired = db.session.execute(
+            db.select(Product.id, Product.farmerId, Product.cropName, Product.createdAt, Product.expiresAt)
+            .where(Product.availableQuantity > 0, Product.expiresAt <= now)
+        ).all()
+        for product in expired:
+            intervals = max(0, int((now - product.createdAt).total_seconds() / 3600 / 20))
+            notifications.append({
+                'userId': product.farmerId,
+                'kind': 'product_expired',
+                'productId': product.id,
+                'message': f"🗑️ Your {product.cropName} has been automatically removed because the price decreased to zero after {intervals * 20} hours. Please add a new listing if you still have stock available."
+            })
+        
         removed_count = 0
-        notifications_added = False
-
-        for product in products:
-            # Low-stock notification (<= 3kg)
-            try:
-                if product.availableQuantity <= 3:
-                    # Avoid duplicate low-stock notifications in a short window (24h)
-                    twenty_four_hours_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=24)
-                    existing = Notification.query.filter(
-                        Notification.userId == product.farmerId,
-                        Notification.message.contains('Low stock'),
-                        Notification.message.contains(product.cropName),
-                        Notification.timestamp > twenty_four_hours_ago
-                    ).first()
-                    if not existing:
-                        notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                        low_stock_notification = Notification(
-                            id=notification_id,
-                            userId=product.farmerId,
-                            message=f"⚠️ Low stock alert! You only have {product.availableQuantity}kg of {product.cropName} remaining. Update your stock if more is available."
-                        )
-                        db.session.add(low_stock_notification)
-                        notifications_added = True
-            except Exception:
-                # If the notification check fails for a product, continue
-                pass
-
-            effective_price, intervals = calculate_effective_price(product)
-
-            # If price is zero or negative, remove the product
-            if effective_price <= 0:
-                crop_name = product.cropName
-                farmer_id = product.farmerId
-
-                # Notify farmer about auto-removal
-                notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                removal_notification = Notification(
-                    id=notification_id,
-                    userId=farmer_id,
-                    message=f"🗑️ Your {crop_name} has been automatically removed because the price decreased to zero after {intervals * 20} hours. Please add a new listing if you still have stock available."
+        if expired:
+            # Mark products as unavailable (set quantity to 0)
+            removed_count = db.session.execute(
+                update(Product)
+                .where(Product.id.in_([product.id for product in expired]), Product.availableQuantity > 0)
+                .values(availableQuantity=0)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            queue_invalidation('catalog')
+        
+        if notifications:
+            for notification, notification_id in zip(notifications, new_ids('notif', len(notifications))):
+                notification.update(id=notification_id, timestamp=now, read=False)
+            db.session.execute(insert(Notification), notifications)
+            # Bulk statements bypass the flush hooks, so update counters and queue events here
+            adjust_unread_counts(count_by_user(notifications))
+            queue_invalidation(*{f"notifications:{notification['userId']}" for notification in notifications})
+            for notification in notifications:
+                queue_event(notification['userId'], 'notification', notification_event(Notification(**notification)))
+        for product in expired:
+            queue_event(product.farmerId, 'product', {
+                'id': product.id,
+                'availableQuantity': 0,
+                'expiresAt': product.expiresAt.isoformat(),
+                'deleted': False
+            })
+        
+        db.session.commit()
+        if removed_count > 0:
+            recommendation_cache.invalidate_catalog()
+            logger.info("Removed %d expired products", removed_count)
+        if low_stock:
+            logger.info("Low-stock notifications created for %d products", len(low_stock))
+        
+        return removed_count
+    except Exception:
+        logger.exception("Error in check_and_remove_expired_products")
+        db.session.rollback()
+        raise
+
+def order_totals_by_farmer(order_id):
+    """{farmerId: (amount, quantity)} for the lines of one order"""
+    rows = db.session.execute(
+        db.select(
+            Product.farmerId,
+            func.sum(OrderItem.pricePerKg * OrderItem.quantity),
+            func.sum(OrderItem.quantity)
+        )
+        .join(Product, Product.id == OrderItem.productId)
+        .where(OrderItem.orderId == order_id)
+        .group_by(Product.farmerId)
+    ).all()
+    return {farmer_id: (float(amount or 0), int(quantity or 0)) for farmer_id, amount, quantity in rows}
+
+def apply_order_to_customer_stats(customer_id, totals_by_farmer, order_timestamp, sign=1):
+    """Add (sign=1) or remove (sign=-1) one order's totals from farmer_customer_stats"""
+    for farmer_id, (amount, quantity) in totals_by_farmer.items():
+        values = {
+            'totalOrders': FarmerCustomerStats.totalOrders + sign,
+            'totalSpent': FarmerCustomerStats.totalSpent + sign * amount,
+            'totalQuantity': FarmerCustomerStats.totalQuantity + sign * quantity,
+            'isRepeatCustomer': FarmerCustomerStats.totalOrders + sign > 1
+        }
+        if sign > 0:
+            values['lastOrderDate'] = case(
+                (FarmerCustomerStats.lastOrderDate > order_timestamp, FarmerCustomerStats.lastOrderDate),
+                else_=order_timestamp
+            )
+        updated = FarmerCustomerStats.query.filter_by(
+            farmerId=farmer_id, customerId=customer_id
+        ).update(values, synchronize_session=False)
+        
+        if not updated and sign > 0:
+            db.session.add(FarmerCustomerStats(
+                farmerId=farmer_id,
+                customerId=customer_id,
+                totalOrders=1,
+                totalSpent=amount,
+                totalQuantity=quantity,
+                lastOrderDate=order_timestamp,
+                isRepeatCustomer=False
+            ))
+        elif sign < 0:
+            # The removed order may have been the latest one
+            last_order_date = db.session.execute(
+                db.select(func.max(Order.timestamp))
+                .join(OrderItem, OrderItem.orderId == Order.id)
+                .join(Product, Product.id == OrderItem.productId)
+                .where(
+                    Order.userId == customer_id,
+                    Product.farmerId == farmer_id,
+                    Order.status != 'cancelled'
+                )
+            ).scalar()
+            FarmerCustomerStats.query.filter_by(
+                farmerId=farmer_id, customerId=customer_id
+            ).update({'lastOrderDate': last_order_date}, synchronize_session=False)
+
+def rebuild_farmer_customer_stats(farmer_id=None):
+    """Recompute farmer_customer_stats (one farmer's rows, or all) from order history; the caller commits"""
+    query = (
+        db.select(
+            Product.farmerId,
+            Order.userId,
+            func.count(func.distinct(Order.id)),
+            func.sum(OrderItem.pricePerKg * OrderItem.quantity),
+            func.sum(OrderItem.quantity),
+            func.max(Order.timestamp)
+        )
+        .select_from(OrderItem)
+        .join(Order, Order.id == OrderItem.orderId)
+        .join(Product, Product.id == OrderItem.productId)
+        .where(Order.status != 'cancelled')
+        .group_by(Product.farmerId, Order.userId)
+    )
+    delete = db.delete(FarmerCustomerStats)
+    if farmer_id is not None:
+        query = query.where(Product.farmerId == farmer_id)
+        delete = delete.where(FarmerCustomerStats.farmerId == farmer_id)
+    rows = db.session.execute(query).all()
+    
+    db.session.execute(delete)
+    if rows:
+        db.session.execute(insert(FarmerCustomerStats), [{
+            'farmerId': row_farmer_id,
+            'customerId': customer_id,
+            'totalOrders': total_orders,
+            'totalSpent': total_spent or 0,
+            'totalQuantity': total_quantity or 0,
+            'lastOrderDate': last_order_date,
+            'isRepeatCustomer': total_orders > 1
+        } for row_farmer_id, customer_id, total_orders, total_spent, total_quantity, last_order_date in rows])
+    return len(rows)
+
+def get_or_insert(model, key, make_rows):
+    """The model row for primary key `key`, inserting make_rows() (that row first, then rows that belong to it) if missing
+
+    Requests racing to insert the same key don't fail: the loser's savepoint rolls
+    back and it reads the winner's row instead.
+    """
+    row = db.session.get(model, key)
+    if row is not None:
+        return row
+    rows = make_rows()
+    try:
+        with db.session.begin_nested():
+            db.session.add_all(rows)
+        return rows[0]
+    except IntegrityError:
+        # A locking read sees the other transaction's row even inside a repeatable-read snapshot
+        row = db.session.get(model, key, populate_existing=True, with_for_update={'read': True})
+        if row is None:
+            raise  # Not a duplicate key after all
+        return row
+
+def store_image(source, content_type, user_id):
+    """Store an image uploaded by user_id, as bytes or a file path (and its variants, when Pillow is available)
+
+    Returns the (Image, ImageUpload) rows.
+    """
+    variants, geotag = image_pipeline.process(source)
+    if variants:
+        full, width, height = variants.pop('full')
+        content_type = OUTPUT_CONTENT_TYPE
+    elif isinstance(source, bytes):
+        full, width, height = source, None, None  # No Pillow: keep the upload as it is
+    else:
+        with open(source, 'rb') as upload:
+            full, width, height = upload.read(), None, None
+    image_hash = blob_store.put(full)
+    image = get_or_insert(Image, image_hash, lambda: [
+        Image(hash=image_hash, contentType=content_type, size=len(full), width=width, height=height),
+        *[ImageVariant(
+            imageHash=image_hash, variant=name, blobHash=blob_store.put(variant_data),
+            contentType=OUTPUT_CONTENT_TYPE, size=len(variant_data),
+            width=variant_width, height=variant_height
+        ) for name, (variant_data, variant_width, variant_height) in (variants or {}).items()]
+    ])
+    upload = get_or_insert(ImageUpload, (image_hash, user_id), lambda: [ImageUpload(imageHash=image_hash, userId=user_id)])
+    # A repeat upload of the same pixels may carry the location the earlier one lacked
+    if geotag and (geotag.has_location or upload.latitude is None):
+        upload.latitude, upload.longitude, upload.takenAt = geotag.latitude, geotag.longitude, geotag.taken_at
+    return image, upload
+
+def spool_upload(stream):
+    """Copy an upload into a named temp file in fixed-size chunks; RequestEntityTooLarge past the limit"""
+    spool = tempfile.NamedTemporaryFile()
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > IMAGE_MAX_UPLOAD_BYTES:
+                raise RequestEntityTooLarge()
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    if not size:
+        spool.close()
+        raise ValueError('Image data is empty')
+    spool.flush()
+    return spool
+
+def spooled_file(upload):
+    """The named temp file a multipart upload was parsed into (see UploadLimitRequest), checked like spool_upload()"""
+    spool = upload.stream
+    spool.seek(0, os.SEEK_END)
+    size = spool.tell()
+    if size > IMAGE_MAX_UPLOAD_BYTES:
+        raise RequestEntityTooLarge()
+    if not size:
+        raise ValueError('Image data is empty')
+    spool.flush()
+    return spool
+
+def image_url(image_hash, variant=None):
+    """Public URL for an image stored in the blob store, or for one of its smaller variants"""
+    if not image_hash:
+        return None
+    if variant:
+        return url_for('get_image_variant', image_hash=image_hash, variant=variant, _external=True)
+    return url_for('get_image', image_hash=image_hash, _external=True)
+
+def acquire_job_lease(job_name, owner, ttl_seconds):
+    """Take the lease for a scheduled job if it is free; True means this worker runs it"""
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(seconds=ttl_seconds)
+    try:
+        taken = JobLease.query.filter(
+            JobLease.name == job_name,
+            or_(JobLease.leaseExpiresAt.is_(None), JobLease.leaseExpiresAt <= now)
+        ).update({'owner': owner, 'leaseExpiresAt': expires_at}, synchronize_session=False)
+        
+        if not taken:
+            if db.session.get(JobLease, job_name):
+                db.session.rollback()
+                return False  # Another worker holds the lease
+            db.session.add(JobLease(name=job_name, owner=owner, leaseExpiresAt=expires_at))
+        
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Another worker created the lease row first
+        db.session.rollback()
+        return False
+
+def record_job_run(job_name, started_at, duration, error):
+    """Persist the outcome of a scheduled job run so every worker can report it"""
+    db.session.rollback()  # Discard anything a failed job left behind
+    JobLease.query.filter_by(name=job_name).update({
+        'lastRunAt': started_at,
+        'lastDurationMs': int(duration * 1000),
+        'lastStatus': 'error' if error else 'ok',
+        'lastError': str(error) if error else None
+    }, synchronize_session=False)
+    db.session.commit()
+    logger.log(
+        logging.ERROR if error else logging.INFO,
+        "Job %s %s in %.0fms", job_name, 'failed' if error else 'finished', duration * 1000,
+        extra={'job': job_name, 'durationMs': round(duration * 1000)}
+    )
+
+@contextlib.contextmanager
+def timed_stage(name):
+    """Record how long a stage of the current request took (reported in Server-Timing)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.setdefault('server_timings', []).append((name, (time.perf_counter() - started) * 1000))
+
+def claim_idempotency_key(user_id, endpoint, key, request_hash):
+    """Claim a key for this request; returns None once claimed, otherwise the existing record"""
+    now = datetime.datetime.utcnow()
+    claim = {
+        'requestHash': request_hash,
+        'status': 'in_progress',
+        'responseStatus': None,
+        'responseBody': None,
+        'createdAt': now,
+        'expiresAt': now + datetime.timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    }
+    # Claims run on their own connection so they are visible to other workers immediately
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(IdempotencyKey).values(userId=user_id, endpoint=endpoint, key=key, **claim))
+        return None
+    except IntegrityError:
+        pass
+    
+    record_filter = and_(IdempotencyKey.userId == user_id, IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+    with db.engine.begin() as conn:
+        # Take over expired records and claims abandoned by a crashed worker
+        reclaimed = conn.execute(
+            update(IdempotencyKey)
+            .where(record_filter, or_(
+                IdempotencyKey.expiresAt <= now,
+                and_(
+                    IdempotencyKey.status == 'in_progress',
+                    IdempotencyKey.createdAt <= now - datetime.timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
                 )
-                db.session.add(removal_notification)
+            ))
+            .values(**claim)
+        ).rowcount
+        if reclaimed:
+            return None
+        return conn.execute(
+            db.select(IdempotencyKey.requestHash, IdempotencyKey.status, IdempotencyKey.responseStatus, IdempotencyKey.responseBody)
+            .where(record_filter)
+        ).first()
 
-                # Mark product as unavailable (set quantity to 0)
-                product.availableQuantity = 0
-                removed_count += 1
+def finish_idempotency_key(user_id, endpoint, key, response=None):
+    """Store the response for replay, or release the claim (response=None) so a retry runs again"""
+    record_filter = and_(IdempotencyKey.userId == user_id, IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+    with db.engine.begin() as conn:
+        if response is None:
+            conn.execute(db.delete(IdempotencyKey).where(record_filter))
+        else:
+            conn.execute(
+                update(IdempotencyKey)
+                .where(record_filter)
+                .values(status='completed', responseStatus=response.status_code, responseBody=response.get_data(as_text=True))
+            )
 
-        # Commit if we removed expired products or added notifications
-        if removed_count > 0 or notifications_added:
+def archive_read_notifications(batch_size=1000):
+    """Move read notifications past the retention window into notifications_archive (scheduled job)"""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    columns = ['id', 'userId', 'message', 'timestamp', 'read', 'kind', 'productId', 'dedupeWindow']
+    archived = 0
+    try:
+        while True:
+            rows = db.session.execute(
+                db.select(Notification.id, Notification.userId)
+                .where(Notification.read.is_(True), Notification.timestamp < cutoff)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            db.session.execute(
+                insert(NotificationArchive).from_select(
+                    columns,
+                    db.select(*[getattr(Notification, column) for column in columns]).where(Notification.id.in_(ids))
+                )
+            )
+            db.session.execute(db.delete(Notification).where(Notification.id.in_(ids)))
+            queue_invalidation(*{f"notifications:{row.userId}" for row in rows})
             db.session.commit()
-            if removed_count > 0:
-                print(f"Removed {removed_count} expired products")
-            if notifications_added:
-                print("Low-stock notifications created for products with low quantity")
+            archived += len(ids)
+        return archived
+    except Exception:
+        db.session.rollback()
+        raise
 
-        return removed_count
-    except Exception as e:
-        print(f"Error in check_and_remove_expired_products: {e}")
+def purge_idempotency_keys():
+    """Delete expired Idempotency-Key records (scheduled job)"""
+    try:
+        removed = db.session.execute(
+            db.delete(IdempotencyKey).where(IdempotencyKey.expiresAt <= datetime.datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return removed
+    except Exception:
         db.session.rollback()
-        return 0
+        raise
 
 def generate_token(user_id, role):
+    now = datetime.datetime.utcnow()
     payload = {
         'user_id': user_id,
         'role': role,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+        'iat': now,
+        'exp': now + datetime.timedelta(hours=24)
     }
     return jwt_encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
@@ -264,38 +1021,121 @@ def is_seasonal_product(product, current_month=None):
     seasonal_months = [int(x.strip()) for x in product.seasonalMonths.split(',')]
     return current_month in seasonal_months
 
-def get_seasonal_boost(product, current_month=None):
-    """Get seasonal boost score for recommendations"""
-    if not product.isSeasonal:
-        return 1.0  # No boost for non-seasonal products
-    
-    if is_seasonal_product(product, current_month):
-        return 1.5  # 50% boost for in-season products
-    else:
-        return 0.3  # 70% penalty for out-of-season products
-
-def get_purchase_preference_score(user_id, crop_name, crop_category):
-    """Calculate purchase preference score based on user's purchase history"""
-    # Get user's purchase history for this crop
-    purchases = PurchaseHistory.query.filter_by(
-        userId=user_id,
-        cropName=crop_name
-    ).all()
-    
-    if not purchases:
-        return 1.0  # No preference data
-    
-    # Calculate frequency and recency
-    total_quantity = sum(p.quantity for p in purchases)
-    recent_purchases = [p for p in purchases if p.purchaseDate > datetime.datetime.utcnow() - datetime.timedelta(days=90)]
-    
-    # Base score on quantity purchased
-    quantity_score = min(total_quantity / 10, 2.0)  # Cap at 2x boost
-    
-    # Recency boost
-    recency_score = 1.0 + (len(recent_purchases) * 0.2)  # 20% boost per recent purchase
-    
-    return min(quantity_score * recency_score, 3.0)  # Cap at 3x boost
+# Product listing helpers
+PRODUCT_PAGE_DEFAULT_LIMIT = 50
+PRODUCT_PAGE_MAX_LIMIT = 200
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 200
+
+# Columns each listing field needs, so a fields= projection also trims the SELECT
+PRODUCT_FIELD_COLUMNS = {
+    'id': ('id',),
+    'farmerId': ('farmerId',),
+    'farmerName': ('farmerName',),
+    'farmerPhone': ('farmerPhone',),
+    'farmerWhatsapp': ('farmerWhatsapp',),
+    'farmerAddress': ('farmerAddress',),
+    'cropCategory': ('cropCategory',),
+    'cropName': ('cropName',),
+    'pricePerKg': ('pricePerKg',),
+    'consumerPricePerKg': ('pricePerKg',),
+    'effectivePrice': ('pricePerKg', 'createdAt', 'priceStep', 'currentPrice', 'nextPriceChangeAt'),
+    'availableQuantity': ('availableQuantity',),
+    'image': ('imageHash',),
+    'latitude': ('latitude',),
+    'longitude': ('longitude',),
+    'photoTakenAt': ('photoTakenAt',),
+    'isSeasonal': ('isSeasonal',),
+    'seasonalMonths': ('seasonalMonths',),
+    'inSeason': ('isSeasonal', 'seasonalMonths'),
+    'createdAt': ('createdAt',),
+}
+
+def parse_product_fields(value):
+    """Parse a fields= projection; None means every field"""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in PRODUCT_FIELD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+def product_columns_for(fields):
+    """Product columns to load for a projection (keyset and price columns are always needed)"""
+    names = {'id'} | set(PRODUCT_FIELD_COLUMNS['effectivePrice'])
+    for field in fields or PRODUCT_FIELD_COLUMNS:
+        names.update(PRODUCT_FIELD_COLUMNS[field])
+    return [getattr(Product, name) for name in sorted(names)]
+
+def encode_cursor(created_at, row_id, *extra):
+    """Opaque keyset cursor for (createdAt, id), optionally preceded by extra sort keys"""
+    raw = json.dumps([*extra, created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, extra=0):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != extra + 2:
+            raise ValueError
+        *leading, created_at, row_id = values
+        return (*leading, datetime.datetime.fromisoformat(created_at), str(row_id))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def in_season_clause(current_month):
+    """SQL equivalent of is_seasonal_product()"""
+    months = func.replace(func.coalesce(Product.seasonalMonths, ''), ' ', '')
+    return or_(
+        Product.isSeasonal.is_(None),
+        Product.isSeasonal.is_(False),
+        months == '',
+        literal(',', db.String).concat(months).concat(',').like(f'%,{current_month},%')
+    )
+
+def serialize_product(product, fields=None, effective_price=None, current_month=None):
+    """Catalog representation of a product, optionally limited to a fields= projection"""
+    if effective_price is None:
+        effective_price, _ = calculate_effective_price(product)
+    getters = {
+        'id': lambda: product.id,
+        'farmerId': lambda: product.farmerId,
+        'farmerName': lambda: product.farmerName,
+        'farmerPhone': lambda: product.farmerPhone,
+        'farmerWhatsapp': lambda: product.farmerWhatsapp,
+        'farmerAddress': lambda: product.farmerAddress,
+        'cropCategory': lambda: product.cropCategory,
+        'cropName': lambda: product.cropName,
+        'pricePerKg': lambda: float(product.pricePerKg),
+        'consumerPricePerKg': lambda: round(base_price(product.pricePerKg), 2),
+        'effectivePrice': lambda: effective_price,
+        'availableQuantity': lambda: product.availableQuantity,
+        'image': lambda: image_url(product.imageHash, LIST_IMAGE_VARIANT),
+        'latitude': lambda: product.latitude,
+        'longitude': lambda: product.longitude,
+        'photoTakenAt': lambda: product.photoTakenAt.isoformat() if product.photoTakenAt else None,
+        'isSeasonal': lambda: product.isSeasonal,
+        'seasonalMonths': lambda: product.seasonalMonths,
+        'inSeason': lambda: is_seasonal_product(product, current_month),
+        'createdAt': lambda: product.createdAt.isoformat(),
+    }
+    return {field: getters[field]() for field in (fields or PRODUCT_FIELD_COLUMNS)}
+
+def load_principal(token):
+    """Verify a JWT and return its (cached) Principal, or None if the user is gone"""
+    data = jwt_decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    principal = principal_cache.get(data['user_id'], data.get('iat'))
+    if principal is None:
+        user = User.query.get(data['user_id'])
+        if not user:
+            return None
+        principal = Principal.from_user(user)
+        principal_cache.set(data['user_id'], data.get('iat'), principal)
+    return principal
 
 def token_required(f):
     @wraps(f)
@@ -307,14 +1147,16 @@ def token_required(f):
         try:
             if token.startswith('Bearer '):
                 token = token.split(' ')[1]
-            data = jwt_decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
-            if not current_user:
+            current_user = load_principal(token)
+            if current_user is None:
                 return jsonify({'message': 'Invalid token'}), 401
-            
-            return f(current_user, *args, **kwargs)
         except:
             return jsonify({'message': 'Invalid token'}), 401
+
+        if current_user.blocked:
+            return jsonify({'message': 'Account is blocked'}), 403
+
+        return f(current_user, *args, **kwargs)
         
     return decorated_function
 
@@ -338,10 +1180,258 @@ def admin_required(f):
     
     return decorated_function
 
+@app.before_request
+def start_query_profile():
+    g.request_started = time.perf_counter()
+    if QUERY_PROFILER_ENABLED:
+        query_profiler.start()
+
+# Registered before add_server_timing so it runs after it (Flask runs after_request hooks in reverse)
+@app.after_request
+def log_request(response):
+    duration_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+    if response.status_code >= 500 or duration_ms >= LOG_SLOW_REQUEST_MS or random.random() < LOG_REQUEST_SAMPLE_RATE:
+        queries, db_ms = g.get('query_profile') or (None, None)
+        access_logger.log(
+            logging.WARNING if response.status_code >= 500 else logging.INFO,
+            "%s %s %d", request.method, request.path, response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'durationMs': round(duration_ms, 1),
+                'queries': queries,
+                'dbMs': round(db_ms, 1) if db_ms is not None else None,
+                # Measuring a streamed body would buffer it (and hold back every event on /api/stream)
+                'bytes': response.content_length if response.is_streamed else response.calculate_content_length()
+            }
+        )
+    return response
+
+@app.after_request
+def add_server_timing(response):
+    profile = query_profiler.finish(request.endpoint or request.path) if QUERY_PROFILER_ENABLED else None
+    if profile:
+        g.query_profile = profile
+        count, duration = profile
+        g.setdefault('server_timings', []).append((f'db;desc="{count} queries"', duration))
+    timings = g.get('server_timings')
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(f"{name};dur={duration:.1f}" for name, duration in timings)
+    return response
+
+def catalog_etag_parts():
+    """Catalog state that changes without a write: listings past a price boundary, and the month (inSeason)"""
+    due = db.session.execute(
+        db.select(func.count())
+        .select_from(Product)
+        .where(Product.availableQuantity > 0, Product.nextPriceChangeAt <= datetime.datetime.utcnow())
+    ).scalar()
+    return [due, datetime.datetime.now().month]
+
+def conditional_get(*resource_templates, extra=None):
+    """Weak ETag for a GET route from resource versions; If-None-Match gets a 304 before the view runs
+
+    Resources are formatted with the view arguments; extra() may add state that
+    changes without bumping a version.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            resources = [template.format(**kwargs) for template in resource_templates]
+            try:
+                with timed_stage('etag'):
+                    versions = dict(db.session.execute(
+                        db.select(ResourceVersion.resource, ResourceVersion.version)
+                        .where(ResourceVersion.resource.in_(resources))
+                    ).all())
+                    parts = [request.full_path, [versions.get(resource, 0) for resource in resources], extra() if extra else None]
+                    g.etag = hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:32]
+            except Exception as e:
+                db.session.rollback()
+                logger.warning("ETag lookup failed, serving without one: %s", e)
+                return f(*args, **kwargs)
+            if request.if_none_match.contains_weak(g.etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(g.etag, weak=True)
+            # Let browsers keep the body but revalidate on every poll
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated
+    return decorator
+
+def cached_response(*tag_templates):
+    """Serve a GET route from response_cache; tags are formatted with the view arguments
+
+    The view may set g.cache_ttl (seconds) when its data goes stale on a schedule.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            tags = [template.format(**kwargs) for template in tag_templates]
+            key = request.path + '?' + '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            if g.get('etag'):
+                # Resource versions are shared by every worker; a per-process entry must not outlive them
+                key += '#' + g.etag
+            
+            def compute():
+                g.cache_ttl = None
+                response = make_response(f(*args, **kwargs))
+                return response.get_data(as_text=True), response.status_code, g.cache_ttl
+            
+            with timed_stage('cache'):
+                body, status, state = response_cache.fetch(key, tags, compute)
+            response = app.response_class(body, status=status, mimetype='application/json')
+            response.headers['X-Cache'] = state
+            return response
+        return decorated
+    return decorator
+
+def idempotent(f):
+    """Honour an Idempotency-Key header: the first response per key is stored and replayed to retries"""
+    @wraps(f)
+    def decorated_function(current_user, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(current_user, *args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'success': False, 'message': 'Idempotency-Key is too long'}), 400
+        
+        endpoint = request.endpoint
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            existing = claim_idempotency_key(current_user.id, endpoint, key, request_hash)
+            if existing is None:
+                break
+            if existing.requestHash != request_hash:
+                return jsonify({'success': False, 'message': 'Idempotency-Key was already used for a different request'}), 422
+            if existing.status == 'completed':
+                response = Response(existing.responseBody, status=existing.responseStatus, mimetype='application/json')
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            # Another request with this key is in flight; wait for its result instead of racing it
+            if time.monotonic() >= deadline:
+                return jsonify({'success': False, 'message': 'A request with this Idempotency-Key is still in progress'}), 409
+            time.sleep(0.05)
+        
+        try:
+            response = app.make_response(f(current_user, *args, **kwargs))
+        except Exception:
+            finish_idempotency_key(current_user.id, endpoint, key)
+            raise
+        # Server errors are not stored, so the client's retry gets a fresh attempt
+        finish_idempotency_key(current_user.id, endpoint, key, response if response.status_code < 500 else None)
+        return response
+    
+    return decorated_function
+
 # Routes
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'OK', 'message': 'Flask server is running'})
+    jobs = {}
+    try:
+        for lease in JobLease.query.all():
+            jobs[lease.name] = {
+                'lastRunAt': lease.lastRunAt.isoformat() if lease.lastRunAt else None,
+                'lastDurationMs': lease.lastDurationMs,
+                'lastStatus': lease.lastStatus
+            }
+    except Exception as e:
+        db.session.rollback()
+        jobs = {'error': str(e)}
+    
+    return jsonify({'status': 'OK', 'message': 'Flask server is running', 'jobs': jobs})
+
+# Image Routes
+@app.route('/api/images/<image_hash>', methods=['GET'])
+def get_image(image_hash):
+    if not is_valid_hash(image_hash):
+        return jsonify({'success': False, 'message': 'Image not found'}), 404
+    return send_image(image_hash, etag=image_hash)
+
+@app.route('/api/images/<image_hash>/<variant>', methods=['GET'])
+def get_image_variant(image_hash, variant):
+    if not is_valid_hash(image_hash) or variant not in VARIANT_SIZES or variant == 'full':
+        return jsonify({'success': False, 'message': 'Image not found'}), 404
+    return send_image(image_hash, etag=f"{image_hash}-{variant}", variant=variant)
+
+@app.route('/api/images', methods=['POST', 'PUT'])
+@token_required
+def upload_image(current_user):
+    """Upload an image as the multipart field 'image' (POST) or the raw request body (PUT)
+
+    Returns a handle whose id is passed to POST /api/products as imageId.
+    """
+    too_large = jsonify({'success': False, 'message': f"Images must be smaller than {IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)}MB"}), 413
+    if request.content_length is not None and request.content_length > IMAGE_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        return too_large  # Rejected before any of the body is read
+    try:
+        if request.method == 'POST':
+            upload = request.files.get('image')
+            if not upload:
+                return jsonify({'success': False, 'message': "Send the image as the multipart field 'image'"}), 400
+            spool, content_type = spooled_file(upload), upload.mimetype
+        else:
+            spool, content_type = spool_upload(request.stream), request.mimetype
+        with spool:
+            # Workers read the file by path, so the upload never has to be held in memory here
+            image, upload = store_image(spool.name, content_type or 'application/octet-stream', current_user.id)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'image': {
+                'id': image.hash,
+                'url': image_url(image.hash, LIST_IMAGE_VARIANT),
+                'width': image.width,
+                'height': image.height,
+                'geotag': {
+                    'latitude': upload.latitude,
+                    'longitude': upload.longitude,
+                    'takenAt': upload.takenAt.isoformat() if upload.takenAt else None
+                }
+            }
+        })
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        return too_large
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except ImagePipelineUnavailable as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def send_image(image_hash, etag, variant=None):
+    """Immutable response for an image, or its variant (the image itself if it has none)"""
+    # Content never changes for a given hash, so a matching ETag needs no lookup
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        image = db.session.get(Image, image_hash)
+        blob_key, content_type = image_hash, image.contentType if image else None
+        if image and variant:
+            rendition = db.session.get(ImageVariant, (image_hash, variant))
+            if rendition:
+                blob_key, content_type = rendition.blobHash, rendition.contentType
+        blob = blob_store.open(blob_key) if image else None
+        if not blob:
+            return jsonify({'success': False, 'message': 'Image not found'}), 404
+        response = send_file(blob, mimetype=content_type, conditional=False,
+                             etag=False, max_age=IMAGE_CACHE_MAX_AGE)
+    
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
 
 # Authentication Routes
 @app.route('/api/auth/register', methods=['POST'])
@@ -363,7 +1453,7 @@ def register():
             return jsonify({'success': False, 'message': 'Password is required'}), 400
 
         new_user = User(
-            id=f"user-{int(datetime.datetime.utcnow().timestamp())}",
+            id=new_id('user'),
             role=role,
             name=data.get('name'),
             fullName=data.get('fullName'),
@@ -445,6 +1535,8 @@ def login():
             'phone': user.phone,
             'whatsapp': user.whatsapp,
             'address': user.address,
+            'latitude': user.latitude,
+            'longitude': user.longitude,
             'blocked': user.blocked,
             'createdAt': user.createdAt.isoformat()
         }
@@ -526,8 +1618,21 @@ def update_user_profile(current_user, user_id):
             user.whatsapp = data['whatsapp'].strip()
         if 'address' in data:
             user.address = data['address'].strip()
+        if 'latitude' in data or 'longitude' in data:
+            # Both together; nulls clear the saved location
+            latitude, longitude = data.get('latitude'), data.get('longitude')
+            if (latitude is None) != (longitude is None):
+                return jsonify({'success': False, 'message': 'latitude and longitude must be set together'}), 400
+            if latitude is not None:
+                try:
+                    geohash_encode(float(latitude), float(longitude))
+                except (TypeError, ValueError):
+                    return jsonify({'success': False, 'message': 'Invalid coordinates'}), 400
+                latitude, longitude = float(latitude), float(longitude)
+            user.latitude, user.longitude = latitude, longitude
         
         db.session.commit()
+        principal_cache.invalidate_user(user_id)
         
         # Return updated user data
         user_response = {
@@ -539,6 +1644,8 @@ def update_user_profile(current_user, user_id):
             'phone': user.phone,
             'whatsapp': user.whatsapp,
             'address': user.address,
+            'latitude': user.latitude,
+            'longitude': user.longitude,
             'blocked': user.blocked,
             'createdAt': user.createdAt.isoformat()
         }
@@ -551,46 +1658,190 @@ def update_user_profile(current_user, user_id):
 
 # Product Routes
 @app.route('/api/products', methods=['GET'])
+@conditional_get('catalog', extra=catalog_etag_parts)
+@cached_response('catalog')
 def get_products():
     try:
-        # Check and remove expired products first
-        check_and_remove_expired_products()
+        try:
+            limit = request.args.get('limit', PRODUCT_PAGE_DEFAULT_LIMIT, type=int)
+            if limit is None or limit < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = min(limit, PRODUCT_PAGE_MAX_LIMIT)
+            fields = parse_product_fields(request.args.get('fields'))
+            cursor = request.args.get('cursor')
+            cursor_values = decode_cursor(cursor) if cursor else None
+            min_price = request.args.get('minPrice', type=float)
+            max_price = request.args.get('maxPrice', type=float)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        now = datetime.datetime.utcnow()
         
         # Only return products that are still available (quantity > 0 and price > 0)
-        products = Product.query.filter(Product.availableQuantity > 0).order_by(Product.createdAt.desc()).all()
-        products_list = []
+        query = Product.query.filter(
+            Product.availableQuantity > 0,
+            or_(Product.expiresAt.is_(None), Product.expiresAt > now)
+        )
+        
+        if request.args.get('cropCategory'):
+            query = query.filter(Product.cropCategory == request.args['cropCategory'])
+        if request.args.get('farmerId'):
+            query = query.filter(Product.farmerId == request.args['farmerId'])
+        if request.args.get('inSeason') is not None:
+            in_season = in_season_clause(datetime.datetime.now().month)
+            if request.args['inSeason'].lower() in ('1', 'true', 'yes'):
+                query = query.filter(in_season)
+            else:
+                query = query.filter(~in_season)
+        if min_price is not None:
+            query = query.filter(Product.pricePerKg >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.pricePerKg <= max_price)
+        
+        # Keyset pagination on (createdAt, id), newest first
+        if cursor_values:
+            query = query.filter(tuple_(Product.createdAt, Product.id) < tuple(cursor_values))
+        
+        products = (
+            query
+            .options(load_only(*product_columns_for(fields)))
+            .order_by(Product.createdAt.desc(), Product.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        
+        next_cursor = None
+        if len(products) > limit:
+            products = products[:limit]
+            last = products[-1]
+            next_cursor = encode_cursor(last.createdAt, last.id)
+        
+        # Cache the page until the first of its listings changes price
+        boundaries = [b for b in (next_price_boundary(product, now) for product in products) if b]
+        if boundaries:
+            g.cache_ttl = max(1, int((min(boundaries) - now).total_seconds()))
         
+        current_month = datetime.datetime.now().month
+        products_list = []
         for product in products:
             # Check effective price - exclude products with zero price
-            effective_price, intervals = calculate_effective_price(product)
+            effective_price, intervals = calculate_effective_price(product, now)
             if effective_price <= 0:
                 continue  # Skip products with zero price
             
-            products_list.append({
-                'id': product.id,
-                'farmerId': product.farmerId,
-                'farmerName': product.farmerName,
-                'farmerPhone': product.farmerPhone,
-                'farmerWhatsapp': product.farmerWhatsapp,
-                'farmerAddress': product.farmerAddress,
-                'cropCategory': product.cropCategory,
-                'cropName': product.cropName,
-                'pricePerKg': float(product.pricePerKg),
-                'consumerPricePerKg': round(float(product.pricePerKg) * 1.02, 2),
-                'effectivePrice': effective_price,  # Add effective price for frontend
-                'availableQuantity': product.availableQuantity,
-                'image': product.image,
-                'isSeasonal': product.isSeasonal,
-                'seasonalMonths': product.seasonalMonths,
-                'inSeason': is_seasonal_product(product),
-                'createdAt': product.createdAt.isoformat()
-            })
+            products_list.append(serialize_product(product, fields, effective_price, current_month))
+        
+        return jsonify({'success': True, 'products': products_list, 'nextCursor': next_cursor})
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/products/nearby', methods=['GET'])
+def get_nearby_products():
+    """Available products within radius_km of lat/lon, nearest first"""
+    try:
+        try:
+            latitude = request.args.get('lat', type=float)
+            longitude = request.args.get('lon', type=float)
+            if latitude is None or longitude is None or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+                raise ValueError('lat and lon must be valid coordinates')
+            radius_km = request.args.get('radius_km', NEARBY_DEFAULT_RADIUS_KM, type=float)
+            if radius_km is None or not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+                raise ValueError(f"radius_km must be greater than 0 and at most {NEARBY_MAX_RADIUS_KM}")
+            limit = request.args.get('limit', PRODUCT_PAGE_DEFAULT_LIMIT, type=int)
+            if limit is None or limit < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = min(limit, PRODUCT_PAGE_MAX_LIMIT)
+            fields = parse_product_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        now = datetime.datetime.utcnow()
+        
+        # Candidates: the geohash cells around the point, with the catalog's availability filters
+        query = db.session.query(Product.id, Product.latitude, Product.longitude).filter(
+            Product.availableQuantity > 0,
+            or_(Product.expiresAt.is_(None), Product.expiresAt > now),
+            Product.geohash.isnot(None)
+        )
+        prefixes = covering_prefixes(latitude, longitude, radius_km)
+        if prefixes:
+            query = query.filter(or_(*[Product.geohash.like(f"{prefix}%") for prefix in prefixes]))
+        if request.args.get('cropCategory'):
+            query = query.filter(Product.cropCategory == request.args['cropCategory'])
+        candidates = query.all()
+        
+        if not candidates:
+            return jsonify({'success': True, 'products': []})
+        
+        # Exact distances for every candidate in one pass, then full rows for the nearest only
+        ids, latitudes, longitudes = zip(*candidates)
+        nearest, distances = nearest_within(latitude, longitude, latitudes, longitudes, radius_km, limit)
+        products = {
+            product.id: product
+            for product in Product.query.filter(Product.id.in_([ids[index] for index in nearest]))
+            .options(load_only(*product_columns_for(fields)))
+        } if nearest else {}
+        
+        current_month = datetime.datetime.now().month
+        products_list = []
+        for index, distance in zip(nearest, distances):
+            product = products.get(ids[index])
+            if product is None:
+                continue
+            effective_price, _ = calculate_effective_price(product, now)
+            if effective_price <= 0:
+                continue
+            product_dict = serialize_product(product, fields, effective_price, current_month)
+            product_dict['distanceKm'] = round(distance, 3)
+            products_list.append(product_dict)
         
         return jsonify({'success': True, 'products': products_list})
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/products/price-changes', methods=['GET'])
+def get_upcoming_price_changes():
+    """Listings whose price drops within the next `withinMinutes` (default 60), with every drop in that window"""
+    try:
+        within_minutes = request.args.get('withinMinutes', 60, type=int)
+        if within_minutes is None or within_minutes < 1:
+            return jsonify({'success': False, 'message': 'withinMinutes must be a positive integer'}), 400
+        
+        now = datetime.datetime.utcnow()
+        horizon = now + datetime.timedelta(minutes=within_minutes)
+        rows = db.session.execute(
+            db.select(Product.id, Product.pricePerKg, Product.createdAt)
+            .where(
+                Product.availableQuantity > 0,
+                Product.nextPriceChangeAt.isnot(None),
+                Product.nextPriceChangeAt <= horizon
+            )
+            .order_by(Product.nextPriceChangeAt)
+        ).all()
+        
+        changes = []
+        for row in rows:
+            # Stored boundaries may lag behind until the next sweep advances them, so tiers are placed against now
+            tiers = tier_boundaries(row.createdAt, row.pricePerKg)
+            current_price = next((price for starts_at, price in reversed(tiers) if starts_at <= now), tiers[0][1])
+            upcoming = [(starts_at, price) for starts_at, price in tiers if now < starts_at <= horizon]
+            if not upcoming:
+                continue
+            changes.append({
+                'id': row.id,
+                'currentPrice': current_price,
+                'nextPrice': upcoming[0][1],
+                'changesAt': upcoming[0][0].isoformat(),
+                'upcoming': [{'price': price, 'at': starts_at.isoformat()} for starts_at, price in upcoming]
+            })
+        
+        return jsonify({'success': True, 'changes': changes})
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # New endpoint to update product quantity
 @app.route('/api/products/<product_id>/quantity', methods=['PUT'])
 @token_required
@@ -614,7 +1865,7 @@ def update_product_quantity(current_user, product_id):
         
         # If stock was low and is now updated to a higher value
         if old_quantity <= 3 and product.availableQuantity > 3:
-            notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
+            notification_id = new_id('notif')
             stock_update_notification = Notification(
                 id=notification_id,
                 userId=product.farmerId,
@@ -622,7 +1873,9 @@ def update_product_quantity(current_user, product_id):
             )
             db.session.add(stock_update_notification)
         
+        queue_invalidation('catalog')
         db.session.commit()
+        recommendation_cache.invalidate_catalog()
         
         return jsonify({
             'success': True,
@@ -638,13 +1891,37 @@ def update_product_quantity(current_user, product_id):
 @token_required
 def add_product(current_user):
     try:
-        print(f"Content-Type: {request.content_type}")
-        print(f"Request data: {request.get_data()}")
         data = request.get_json()
-        print(f"Parsed JSON data: {data}")
+        log_control.log_request_body(logger, data, request.content_type)
+        
+        try:
+            if data.get('imageId'):
+                # Uploaded beforehand through POST/PUT /api/images, by this user: image hashes are public,
+                # and someone else's upload would lend the listing their photo's location
+                upload = db.session.get(ImageUpload, (data['imageId'], current_user.id)) if is_valid_hash(data['imageId']) else None
+                if not upload:
+                    return jsonify({'success': False, 'message': 'Unknown imageId; upload the image first'}), 400
+            else:
+                _, upload = store_image(*decode_data_url(data['image']), current_user.id)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except ImagePipelineUnavailable as e:
+            return jsonify({'success': False, 'message': str(e)}), 503, {'Retry-After': '5'}
+        
+        if REQUIRE_GEOTAGGED_IMAGES and upload.latitude is None:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'No GPS location data found in image. Please upload a photo taken with location enabled on your camera.'}), 400
+        
+        latitude, longitude = upload.latitude, upload.longitude
+        if latitude is None:
+            # Fall back to the farmer's saved location
+            farmer = db.session.get(User, data['farmerId'])
+            if farmer:
+                latitude, longitude = farmer.latitude, farmer.longitude
         
+        created_at = datetime.datetime.utcnow()
         new_product = Product(
-            id=f"prod-{int(datetime.datetime.utcnow().timestamp())}",
+            id=new_id('prod'),
             farmerId=data['farmerId'],
             farmerName=data['farmerName'],
             farmerPhone=data['farmerPhone'],
@@ -654,13 +1931,21 @@ def add_product(current_user):
             cropName=data['cropName'],
             pricePerKg=data['pricePerKg'],
             availableQuantity=data['availableQuantity'],
-            image=data['image'],
+            imageHash=upload.imageHash,
+            latitude=latitude,
+            longitude=longitude,
+            geohash=geohash_encode(latitude, longitude) if latitude is not None else None,
+            photoTakenAt=upload.takenAt,
             seasonalMonths=data.get('seasonalMonths', '1,2,3,4,5,6,7,8,9,10,11,12'),  # Default to year-round
-            isSeasonal=data.get('isSeasonal', True)  # Default to seasonal
+            isSeasonal=data.get('isSeasonal', True),  # Default to seasonal
+            createdAt=created_at,
+            **build_schedule(data['pricePerKg'], created_at, created_at)
         )
         
         db.session.add(new_product)
+        queue_invalidation('catalog')
         db.session.commit()
+        recommendation_cache.invalidate_catalog()
         
         product_response = {
             'id': new_product.id,
@@ -673,7 +1958,10 @@ def add_product(current_user):
             'cropName': new_product.cropName,
             'pricePerKg': new_product.pricePerKg,
             'availableQuantity': new_product.availableQuantity,
-            'image': new_product.image,
+            'image': image_url(new_product.imageHash, LIST_IMAGE_VARIANT),
+            'latitude': new_product.latitude,
+            'longitude': new_product.longitude,
+            'photoTakenAt': new_product.photoTakenAt.isoformat() if new_product.photoTakenAt else None,
             'isSeasonal': new_product.isSeasonal,
             'seasonalMonths': new_product.seasonalMonths,
             'inSeason': is_seasonal_product(new_product),
@@ -701,16 +1989,27 @@ def delete_product(current_user, product_id):
         # Only owner farmer or admin can delete
         if current_user.role != 'admin' and product.farmerId != current_user.id:
             return jsonify({'success': False, 'message': 'Forbidden'}), 403
+        # Carts and order histories that list the product change along with the catalog
+        cart_users = db.session.execute(db.select(Cart.userId).where(Cart.productId == product_id).distinct()).scalars()
+        order_users = db.session.execute(
+            db.select(Order.userId).join(OrderItem, OrderItem.orderId == Order.id).where(OrderItem.productId == product_id).distinct()
+        ).scalars()
+        queue_invalidation(
+            'catalog', f"farmer-orders:{product.farmerId}",
+            *[f"cart:{user_id}" for user_id in cart_users], *[f"orders:{user_id}" for user_id in order_users]
+        )
         # Remove related records to avoid foreign key constraint errors
         # Delete cart items
         Cart.query.filter_by(productId=product_id).delete()
-        # Delete order items
+        # Delete order items, and take them out of the farmer's customer rollup
         OrderItem.query.filter_by(productId=product_id).delete()
+        rebuild_farmer_customer_stats(product.farmerId)
         # Delete purchase history
         PurchaseHistory.query.filter_by(productId=product_id).delete()
         # Now delete the product
         db.session.delete(product)
         db.session.commit()
+        recommendation_cache.invalidate_catalog()
         return jsonify({'success': True, 'message': 'Product deleted'})
     except Exception as e:
         db.session.rollback()
@@ -718,6 +2017,8 @@ def delete_product(current_user, product_id):
 
 # Cart Routes
 @app.route('/api/cart/<user_id>', methods=['GET'])
+@conditional_get('cart:{user_id}')
+@cached_response('cart:{user_id}')
 def get_cart(user_id):
     try:
         cart_items = Cart.query.filter_by(userId=user_id).all()
@@ -730,7 +2031,7 @@ def get_cart(user_id):
                 'quantity': item.quantity,
                 'pricePerKg': float(item.pricePerKg),
                 'cropName': item.cropName,
-                'image': item.image
+                'image': image_url(item.imageHash, LINE_IMAGE_VARIANT)
             })
         
         return jsonify({'success': True, 'cart': cart_list})
@@ -740,17 +2041,16 @@ def get_cart(user_id):
 
 @app.route('/api/cart/add', methods=['POST'])
 @token_required
+@idempotent
 def add_to_cart(current_user):
     try:
-        print(f"Cart add - Content-Type: {request.content_type}")
-        print(f"Cart add - Request data: {request.get_data()}")
         data = request.get_json()
-        print(f"Cart add - Parsed data: {data}")
+        log_control.log_request_body(logger, data, request.content_type)
         
         # Get product details
         product = Product.query.filter_by(id=data['productId']).first()
         if not product:
-            print(f"Product not found: {data['productId']}")
+            logger.info("Cart add for unknown product %s", data['productId'])
             return jsonify({'success': False, 'message': 'Product not found'}), 404
         
         # Check if product is still available (quantity > 0 and price > 0)
@@ -778,10 +2078,11 @@ def add_to_cart(current_user):
                 quantity=data['quantity'],
                 pricePerKg=effective_price,  # Use discounted price
                 cropName=product.cropName,
-                image=product.image
+                imageHash=product.imageHash
             )
             db.session.add(new_cart_item)
         
+        queue_invalidation(f"cart:{data['userId']}")
         db.session.commit()
         return jsonify({'success': True, 'message': 'Item added to cart'})
     
@@ -798,6 +2099,7 @@ def update_cart(current_user):
         
         if cart_item:
             cart_item.quantity = data['quantity']
+            queue_invalidation(f"cart:{data['userId']}")
             db.session.commit()
             return jsonify({'success': True, 'message': 'Cart updated'})
         else:
@@ -816,6 +2118,7 @@ def remove_from_cart(current_user):
         
         if cart_item:
             db.session.delete(cart_item)
+            queue_invalidation(f"cart:{data['userId']}")
             db.session.commit()
             return jsonify({'success': True, 'message': 'Item removed from cart'})
         else:
@@ -826,33 +2129,61 @@ def remove_from_cart(current_user):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Helper function to check if next order would trigger review
+def order_quantity_expression():
+    """Order.totalQuantity, falling back to summing the lines of legacy orders"""
+    line_total = (
+        db.select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.orderId == Order.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(Order.totalQuantity, line_total)
+
+def recompute_large_order_streak(user_id):
+    """Recount a user's streak from their delivered orders, newest first"""
+    quantities = db.session.execute(
+        db.select(order_quantity_expression())
+        .where(Order.userId == user_id, Order.status == 'delivered')
+        .order_by(Order.timestamp.desc())
+    ).scalars()
+    streak = 0
+    for quantity in quantities:
+        if quantity < LARGE_ORDER_KG:
+            break
+        streak += 1
+    db.session.execute(update(User).where(User.id == user_id).values(largeOrderStreak=streak))
+
+def update_large_order_streak(order):
+    """Keep User.largeOrderStreak current when an order enters or leaves 'delivered'"""
+    newest_other = db.session.execute(
+        db.select(Order.timestamp)
+        .where(Order.userId == order.userId, Order.status == 'delivered', Order.id != order.id)
+        .order_by(Order.timestamp.desc())
+        .limit(1)
+    ).scalar()
+    if order.status == 'delivered' and (newest_other is None or order.timestamp >= newest_other):
+        # Usual case: the newest delivered order extends or breaks the streak
+        quantity = order.totalQuantity
+        if quantity is None:
+            quantity = db.session.execute(db.select(order_quantity_expression()).where(Order.id == order.id)).scalar()
+        db.session.execute(
+            update(User)
+            .where(User.id == order.userId)
+            .values(largeOrderStreak=User.largeOrderStreak + 1 if quantity >= LARGE_ORDER_KG else 0)
+        )
+    else:
+        # Delivered out of order, or moved out of 'delivered': the streak has to be recounted
+        recompute_large_order_streak(order.userId)
+
 def check_if_next_order_triggers_review(user_id, current_order_quantity):
     """Check if placing this order would trigger review (3 consecutive large orders)"""
     try:
-        # Get user's recent orders (last 10 orders)
-        recent_orders = (
-            Order.query
-            .filter_by(userId=user_id, status='delivered')
-            .order_by(Order.timestamp.desc())
-            .limit(10)
-            .all()
-        )
-        
         # Check if current order quantity is 15kg+
-        if current_order_quantity < 15:
+        if current_order_quantity < LARGE_ORDER_KG:
             return False, "Order quantity is not large enough to trigger review"
         
-        # Count consecutive large orders
-        consecutive_large_orders = 0
-        for order in recent_orders:
-            # Calculate total quantity for this order
-            order_items = OrderItem.query.filter_by(orderId=order.id).all()
-            total_quantity = sum(item.quantity for item in order_items)
-            
-            if total_quantity >= 15:
-                consecutive_large_orders += 1
-            else:
-                break  # Reset counter if order is not large
+        consecutive_large_orders = db.session.execute(
+            db.select(User.largeOrderStreak).where(User.id == user_id)
+        ).scalar() or 0
         
         # If this would be the 3rd consecutive large order, block it
         if consecutive_large_orders >= 2:  # 2 previous + 1 current = 3 total
@@ -860,26 +2191,25 @@ def check_if_next_order_triggers_review(user_id, current_order_quantity):
         
         return False, "Order can be placed"
         
-    except Exception as e:
-        print(f"Error in check_if_next_order_triggers_review: {e}")
+    except Exception:
+        logger.exception("Error in check_if_next_order_triggers_review")
         return False, "Error checking order history"
 
 
 # Order Routes
 @app.route('/api/orders', methods=['POST'])
 @token_required
+@idempotent
 def place_order(current_user):
     try:
-        print(f"Place order - Content-Type: {request.content_type}")
-        print(f"Place order - Request data: {request.get_data()}")
-        data = request.get_json()
-        print(f"Place order - Parsed data: {data}")
-        
-        # Calculate total quantity for this order
-        total_quantity = sum(item['quantity'] for item in data['items'])
-        
-        # Check if this order would trigger review (block 4th consecutive large order)
-        would_trigger_review, review_message = check_if_next_order_triggers_review(data['userId'], total_quantity)
+        with timed_stage('validate'):
+            data = request.get_json()
+            
+            # Calculate total quantity for this order
+            total_quantity = sum(item['quantity'] for item in data['items'])
+            
+            # Check if this order would trigger review (block 4th consecutive large order)
+            would_trigger_review, review_message = check_if_next_order_triggers_review(data['userId'], total_quantity)
         
         if would_trigger_review:
             return jsonify({
@@ -889,125 +2219,143 @@ def place_order(current_user):
                 'redirect_to_login': True
             }), 403
         
-        # Check and remove expired products before processing order
-        check_and_remove_expired_products()
-        
         # Recalculate total amount using discounted prices from items
         # Items already have discounted prices from cart
         calculated_total = sum(item['pricePerKg'] * item['quantity'] for item in data['items'])
+        now = datetime.datetime.utcnow()
+        
+        with timed_stage('lock'):
+            # Lock every line's product in one statement, in id order so concurrent checkouts can't deadlock
+            product_ids = sorted({item['productId'] for item in data['items']})
+            products = {
+                product.id: product
+                for product in Product.query.filter(Product.id.in_(product_ids)).order_by(Product.id).with_for_update()
+            } if product_ids else {}
         
         new_order = Order(
-            id=f"order-{int(datetime.datetime.utcnow().timestamp())}",
+            id=new_id('order'),
             userId=data['userId'],
             totalAmount=calculated_total,  # Use recalculated total with discounted prices
             deliveryAddress=data['deliveryAddress'],
-            deliveryType=data['deliveryType']
+            deliveryType=data['deliveryType'],
+            timestamp=now
         )
         
-        db.session.add(new_order)
-        db.session.flush()
-        
-        for item in data['items']:
-            # Get product to verify it exists and check price
-            product = Product.query.get(item['productId'])
-            if not product:
-                continue  # Skip if product doesn't exist
-            
-            # Verify the product is still available and price is valid
-            effective_price, intervals = calculate_effective_price(product)
-            if effective_price <= 0:
-                # Product expired - skip this item and notify
-                notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                user_notification = Notification(
-                    id=notification_id,
-                    userId=data['userId'],
-                    message=f"⚠️ {product.cropName} was removed from your order because the price expired. It has been removed from the marketplace."
-                )
-                db.session.add(user_notification)
-                continue
-            
-            if product.availableQuantity <= 0:
-                continue  # Skip out of stock items
-            
-            # Use the discounted price from cart (which should match effective price)
-            # The cart already has the discounted price, so use item['pricePerKg'] directly
-            discounted_price = item['pricePerKg']
-            
-            order_item = OrderItem(
-                orderId=new_order.id,
-                productId=item['productId'],
-                quantity=item['quantity'],
-                pricePerKg=discounted_price,  # Use discounted price from cart
-                cropName=item['cropName'],
-                image=item['image']
-            )
-            db.session.add(order_item)
-            
-            # Store product data before potential deletion
-            crop_name = product.cropName
-            crop_category = product.cropCategory
-            farmer_id = product.farmerId
-            
-            # Reduce available quantity
-            product.availableQuantity = max(0, product.availableQuantity - item['quantity'])
-            
-            # Track purchase history with discounted price
-            purchase_history = PurchaseHistory(
-                userId=data['userId'],
-                productId=item['productId'],
-                cropName=crop_name,
-                cropCategory=crop_category,
-                quantity=item['quantity'],
-                pricePerKg=discounted_price,  # Use discounted price
-                totalAmount=discounted_price * item['quantity'],  # Use discounted price
-                orderId=new_order.id
-            )
-            db.session.add(purchase_history)
+        with timed_stage('stock'):
+            order_items = []
+            purchase_rows = []
+            ordered = {}  # productId -> kg ordered across this order's lines
+            for item in data['items']:
+                product = products.get(item['productId'])
+                if not product:
+                    continue  # Skip if product doesn't exist
                 
-            # If quantity reaches 0, notify farmer and mark product as sold out
-            if product.availableQuantity <= 0:
-                # Notify farmer about product being sold out
-                notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                removal_notification = Notification(
-                    id=notification_id,
-                    userId=farmer_id,
-                    message=f"📦 Your {crop_name} has been sold out! All available quantity has been ordered by customers."
-                )
-                db.session.add(removal_notification)
+                # Verify the product is still available and price is valid
+                effective_price, _ = calculate_effective_price(product, now)
+                if effective_price <= 0:
+                    # Product expired - skip this item and notify
+                    queue_notification(data['userId'], 'order_item_expired', {'productId': product.id, 'cropName': product.cropName})
+                    continue
                 
-                # Mark product as sold out instead of deleting it to preserve purchase history
-                # We'll keep the product in the database for historical purposes
-                # The product will be filtered out from active listings by checking availableQuantity > 0
+                if product.availableQuantity <= 0:
+                    continue  # Skip out of stock items
+                
+                ordered[product.id] = ordered.get(product.id, 0) + item['quantity']
+                if ordered[product.id] > product.availableQuantity:
+                    db.session.rollback()
+                    return jsonify({
+                        'success': False,
+                        'message': f"Only {product.availableQuantity}kg of {product.cropName} is left. Please update your cart.",
+                        'productId': product.id,
+                        'availableQuantity': product.availableQuantity
+                    }), 409
+                
+                # Use the discounted price from cart (which should match effective price)
+                discounted_price = item['pricePerKg']
+                order_items.append({
+                    'orderId': new_order.id,
+                    'productId': product.id,
+                    'quantity': item['quantity'],
+                    'pricePerKg': discounted_price,  # Use discounted price from cart
+                    'cropName': item['cropName'],
+                    'imageHash': product.imageHash
+                })
+                # Track purchase history with discounted price
+                purchase_rows.append({
+                    'userId': data['userId'],
+                    'productId': product.id,
+                    'cropName': product.cropName,
+                    'cropCategory': product.cropCategory,
+                    'quantity': item['quantity'],
+                    'pricePerKg': discounted_price,
+                    'totalAmount': discounted_price * item['quantity'],
+                    'purchaseDate': now,
+                    'orderId': new_order.id
+                })
+                queue_notification(product.farmerId, 'order_placed', {
+                    'orderId': new_order.id,
+                    'cropName': item['cropName'],
+                    'quantity': item['quantity']
+                })
             
-            # Check if product price expired during order processing
-            if effective_price <= 0:
-                # Additional check: if price becomes zero, set quantity to 0
-                product.availableQuantity = 0
-                notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                price_expiry_notification = Notification(
-                    id=notification_id,
-                    userId=farmer_id,
-                    message=f"🗑️ Your {crop_name} has been automatically removed because the price decreased to zero after {intervals * 20} hours."
-                )
-                db.session.add(price_expiry_notification)
-        
-        Cart.query.filter_by(userId=data['userId']).delete()
-        
-        # Send notifications to farmers for new orders (only for products that still exist)
-        for item in data['items']:
-            product = Product.query.get(item['productId'])
-            if product:
-                # Generate unique notification ID using timestamp + random number
-                notification_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                notification = Notification(
-                    id=notification_id,
-                    userId=product.farmerId,
-                    message=f"Your {item['cropName']} has been ordered. Quantity: {item['quantity']}kg"
-                )
-                db.session.add(notification)
+            if ordered:
+                # One conditional decrement for every line; any shortfall means another order got there first
+                decrement = case(ordered, value=Product.id)
+                updated = db.session.execute(
+                    update(Product)
+                    .where(Product.id.in_(list(ordered)), Product.availableQuantity >= decrement)
+                    .values(availableQuantity=Product.availableQuantity - decrement)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if updated != len(ordered):
+                    db.session.rollback()
+                    return jsonify({'success': False, 'message': 'Some items are no longer available in the requested quantity. Please update your cart.'}), 409
+            
+            sold_out = False
+            for product_id, quantity in ordered.items():
+                product = products[product_id]
+                remaining = product.availableQuantity - quantity
+                queue_event(product.farmerId, 'product', {
+                    'id': product.id,
+                    'availableQuantity': remaining,
+                    'expiresAt': product.expiresAt.isoformat() if product.expiresAt else None,
+                    'deleted': False
+                })
+                if remaining <= 0:
+                    sold_out = True
+                    # Sold-out products stay in the database for purchase history; listings filter on availableQuantity > 0
+                    queue_notification(product.farmerId, 'product_sold_out', {'productId': product.id, 'cropName': product.cropName})
+        
+        with timed_stage('insert'):
+            new_order.totalQuantity = sum(line['quantity'] for line in order_items)
+            db.session.add(new_order)
+            db.session.flush()
+            if order_items:
+                db.session.execute(insert(OrderItem), order_items)
+                db.session.execute(insert(PurchaseHistory), purchase_rows)
+            Cart.query.filter_by(userId=data['userId']).delete()
+            queue_invalidation(
+                'catalog', f"cart:{data['userId']}", f"orders:{data['userId']}",
+                *{f"farmer-orders:{products[line['productId']].farmerId}" for line in order_items}
+            )
         
+        with timed_stage('stats'):
+            # Keep the Customer Contact Center rollup current
+            totals_by_farmer = {}
+            for line in order_items:
+                farmer_id = products[line['productId']].farmerId
+                amount, quantity = totals_by_farmer.get(farmer_id, (0.0, 0))
+                totals_by_farmer[farmer_id] = (amount + float(line['pricePerKg']) * line['quantity'], quantity + line['quantity'])
+            apply_order_to_customer_stats(new_order.userId, totals_by_farmer, new_order.timestamp)
         
-        db.session.commit()
+        with timed_stage('commit'):
+            db.session.commit()
+        # The buyer's purchase history changed; other users' top-K only goes stale when a listing
+        # sold out (smaller stock changes are left to the cache TTL)
+        if sold_out:
+            recommendation_cache.invalidate_catalog()
+        else:
+            recommendation_cache.invalidate_user(new_order.userId)
         
         order_response = {
             'id': new_order.id,
@@ -1030,6 +2378,8 @@ def place_order(current_user):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/orders/<user_id>', methods=['GET'])
+@conditional_get('orders:{user_id}')
+@cached_response('orders:{user_id}')
 def get_user_orders(user_id):
     try:
         orders = Order.query.filter_by(userId=user_id).order_by(Order.timestamp.desc()).all()
@@ -1055,7 +2405,7 @@ def get_user_orders(user_id):
                     'quantity': item.quantity,
                     'pricePerKg': float(item.pricePerKg),
                     'cropName': item.cropName,
-                    'image': item.image
+                    'image': image_url(item.imageHash, LINE_IMAGE_VARIANT)
                 })
             
             orders_list.append(order_dict)
@@ -1066,6 +2416,8 @@ def get_user_orders(user_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/orders/status/<order_id>', methods=['GET'])
+@conditional_get('order:{order_id}')
+@cached_response('order:{order_id}')
 def get_order_status(order_id):
     try:
         order = Order.query.get(order_id)
@@ -1088,140 +2440,140 @@ def update_order_status(current_user, order_id):
         if not order:
             return jsonify({'success': False, 'message': 'Order not found'}), 404
 
+        previous_status = order.status
         order.status = new_status
+        # Cancelled orders drop out of the farmer-customer rollup (and come back if reinstated);
+        # flushed first so the lastOrderDate recompute no longer counts a cancelled order
+        if (previous_status == 'cancelled') != (new_status == 'cancelled'):
+            db.session.flush()
+            apply_order_to_customer_stats(
+                order.userId,
+                order_totals_by_farmer(order.id),
+                order.timestamp,
+                sign=-1 if new_status == 'cancelled' else 1
+            )
+        
+        if (previous_status == 'delivered') != (new_status == 'delivered'):
+            update_large_order_streak(order)
+        
+        # One query for the order's lines and their farmers serves both the events and the notifications
+        lines = db.session.execute(
+            db.select(Product.farmerId, Product.pricePerKg, OrderItem.cropName, OrderItem.quantity)
+            .join(Product, Product.id == OrderItem.productId)
+            .where(OrderItem.orderId == order.id)
+            .order_by(OrderItem.id)
+        ).all()
+        status_event = {'orderId': order.id, 'status': new_status, 'previousStatus': previous_status}
+        queue_event(order.userId, 'order_status', status_event)
+        for farmer_id in dict.fromkeys(line.farmerId for line in lines):
+            queue_event(farmer_id, 'order_status', status_event)
+        
+        # Tell each farmer about their lines (the notification service coalesces them per order)
+        if new_status in ('processing', 'shipped', 'delivered'):
+            consumer_name = None
+            if new_status == 'delivered':
+                consumer_name = db.session.execute(db.select(User.name).where(User.id == order.userId)).scalar() or "Customer"
+            for line in lines:
+                payload = {'orderId': order.id, 'cropName': line.cropName, 'quantity': line.quantity}
+                if new_status == 'delivered':
+                    # Farmers see their own price, without commission
+                    payload.update(amount=float(line.pricePerKg) * line.quantity, consumerName=consumer_name)
+                queue_notification(line.farmerId, f"order_{new_status}", payload)
+        
+        queue_invalidation(
+            f"order:{order.id}", f"orders:{order.userId}",
+            *{f"farmer-orders:{line.farmerId}" for line in lines}
+        )
         db.session.commit()
 
-        # Send notifications for different status changes
-        if new_status == 'processing':
-            # Notify farmers when order is being processed
-            order_items = OrderItem.query.filter_by(orderId=order.id).all()
-            product_ids = [item.productId for item in order_items]
-            products = Product.query.filter(Product.id.in_(product_ids)).all()
-            
-            for item in order_items:
-                product = next((p for p in products if p.id == item.productId), None)
-                if product:
-                    notif_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                    message = f"⚙️ NEW ORDER! Please prepare {item.quantity}kg of {item.cropName} for delivery"
-                    db.session.add(Notification(id=notif_id, userId=product.farmerId, message=message))
-            db.session.commit()
-            
-        elif new_status == 'shipped':
-            # Notify farmers when order is shipped
-            order_items = OrderItem.query.filter_by(orderId=order.id).all()
-            product_ids = [item.productId for item in order_items]
-            products = Product.query.filter(Product.id.in_(product_ids)).all()
-            
-            for item in order_items:
-                product = next((p for p in products if p.id == item.productId), None)
-                if product:
-                    notif_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                    message = f"🚚 ORDER SHIPPED! Your {item.cropName} is on the way to the customer"
-                    db.session.add(Notification(id=notif_id, userId=product.farmerId, message=message))
-            db.session.commit()
-            
-        elif new_status == 'delivered':
-            # Notify all farmers involved in this order with detailed information
-            order_items = OrderItem.query.filter_by(orderId=order.id).all()
-            product_ids = [item.productId for item in order_items]
-            products = Product.query.filter(Product.id.in_(product_ids)).all()
-            
-            # Get order details for better notification
-            order_user = User.query.get(order.userId)
-            consumer_name = order_user.name if order_user else "Customer"
-            
-            for item in order_items:
-                product = next((p for p in products if p.id == item.productId), None)
-                if product:
-                    notif_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                    # Use the original product price without commission
-                    original_price = float(product.pricePerKg)
-                    total_amount = original_price * item.quantity
-                    message = f"🎉 DELIVERY SUCCESS! Your {item.cropName} has been delivered to {consumer_name}. Quantity: {item.quantity}kg, Amount: ₹{total_amount:.2f}"
-                    db.session.add(Notification(id=notif_id, userId=product.farmerId, message=message))
-            
-            # Also send a general delivery notification
-            notif_id = f"notif-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-            general_message = f"📦 Order #{order.id[-8:]} has been successfully delivered to {consumer_name}!"
-            # Send to all farmers involved
-            farmer_ids = list(set([p.farmerId for p in products]))
-            for farmer_id in farmer_ids:
-                db.session.add(Notification(id=f"{notif_id}-{farmer_id}", userId=farmer_id, message=general_message))
-            
-            db.session.commit()
-
         return jsonify({'success': True, 'message': 'Order status updated', 'status': order.status})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+FARMER_ORDER_PAGE_DEFAULT_LIMIT = 50
+FARMER_ORDER_PAGE_MAX_LIMIT = 200
+
 @app.route('/api/orders/farmer/<farmer_id>', methods=['GET'])
+@conditional_get('farmer-orders:{farmer_id}')
 def get_farmer_orders(farmer_id):
     try:
-        # Get all products by this farmer
-        farmer_products = Product.query.filter_by(farmerId=farmer_id).all()
-        farmer_product_ids = [p.id for p in farmer_products]
-        
-        if not farmer_product_ids:
-            return jsonify({'success': True, 'orders': []})
-        
-        # Get all order items for this farmer's products
-        order_items = OrderItem.query.filter(OrderItem.productId.in_(farmer_product_ids)).all()
-        
-        # Group by order ID
-        orders_dict = {}
-        for item in order_items:
-            order_id = item.orderId
-            if order_id not in orders_dict:
-                # Get order details
-                order = Order.query.get(order_id)
-                if order:
-                    orders_dict[order_id] = {
-                        'id': order.id,
-                        'userId': order.userId,
-                        'totalAmount': float(order.totalAmount),
-                        'deliveryAddress': order.deliveryAddress,
-                        'deliveryType': order.deliveryType,
-                        'timestamp': order.timestamp.isoformat(),
-                        'status': order.status,
-                        'items': [],
-                        'farmerOrders': []
-                    }
-            
-            # Add this item to the order
-            orders_dict[order_id]['items'].append({
+        try:
+            limit = request.args.get('limit', FARMER_ORDER_PAGE_DEFAULT_LIMIT, type=int)
+            if limit is None or limit < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = min(limit, FARMER_ORDER_PAGE_MAX_LIMIT)
+            cursor = request.args.get('cursor')
+            cursor_values = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        status = request.args.get('status')
+        
+        # Orders that contain at least one of this farmer's products
+        farmer_order_ids = (
+            db.select(OrderItem.orderId)
+            .join(Product, Product.id == OrderItem.productId)
+            .where(Product.farmerId == farmer_id)
+        )
+        query = Order.query.filter(Order.id.in_(farmer_order_ids))
+        if status:
+            query = query.filter(Order.status == status)
+        if cursor_values:
+            query = query.filter(tuple_(Order.timestamp, Order.id) < tuple(cursor_values))
+        orders = query.order_by(Order.timestamp.desc(), Order.id.desc()).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = encode_cursor(orders[-1].timestamp, orders[-1].id)
+        
+        if not orders:
+            return jsonify({'success': True, 'orders': [], 'nextCursor': None})
+        
+        # This farmer's lines for the page of orders, in one joined query
+        lines = db.session.execute(
+            db.select(OrderItem, Product.farmerName, Product.farmerPhone, Product.farmerWhatsapp)
+            .join(Product, Product.id == OrderItem.productId)
+            .where(Product.farmerId == farmer_id, OrderItem.orderId.in_([order.id for order in orders]))
+            .order_by(OrderItem.id)
+        ).all()
+        
+        items_by_order = {}
+        farmer_info = None
+        for item, farmer_name, farmer_phone, farmer_whatsapp in lines:
+            if farmer_info is None:
+                farmer_info = {'farmerName': farmer_name, 'farmerPhone': farmer_phone, 'farmerWhatsapp': farmer_whatsapp}
+            items_by_order.setdefault(item.orderId, []).append({
                 'id': item.id,
                 'productId': item.productId,
                 'quantity': item.quantity,
                 'pricePerKg': float(item.pricePerKg),
                 'cropName': item.cropName,
-                'image': item.image
+                'image': image_url(item.imageHash, LINE_IMAGE_VARIANT)
             })
         
-        # Create farmer-specific order data
         orders_list = []
-        for order_data in orders_dict.values():
-            # Calculate farmer's portion of the order
-            farmer_items = []
-            farmer_total = 0
-            
-            for item in order_data['items']:
-                if item['productId'] in farmer_product_ids:
-                    farmer_items.append(item)
-                    farmer_total += item['pricePerKg'] * item['quantity']
-            
-            if farmer_items:  # Only include orders that have items from this farmer
-                order_data['farmerOrders'] = [{
-                    'farmerId': farmer_id,
-                    'farmerName': farmer_products[0].farmerName if farmer_products else 'Unknown',
-                    'farmerPhone': farmer_products[0].farmerPhone if farmer_products else '',
-                    'farmerWhatsapp': farmer_products[0].farmerWhatsapp if farmer_products else '',
-                    'items': farmer_items,
-                    'totalAmount': farmer_total
-                }]
-                orders_list.append(order_data)
+        for order in orders:
+            farmer_items = items_by_order.get(order.id, [])
+            orders_list.append({
+                'id': order.id,
+                'userId': order.userId,
+                'totalAmount': float(order.totalAmount),
+                'deliveryAddress': order.deliveryAddress,
+                'deliveryType': order.deliveryType,
+                'timestamp': order.timestamp.isoformat(),
+                'status': order.status,
+                'items': farmer_items,
+                # Farmer's portion of the order
+                'farmerOrders': [dict(
+                    farmer_info,
+                    farmerId=farmer_id,
+                    items=farmer_items,
+                    totalAmount=sum(item['pricePerKg'] * item['quantity'] for item in farmer_items)
+                )]
+            })
         
-        return jsonify({'success': True, 'orders': orders_list})
+        return jsonify({'success': True, 'orders': orders_list, 'nextCursor': next_cursor})
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1236,48 +2588,36 @@ def get_farmer_customers(current_user, farmer_id):
         if current_user.id != farmer_id and current_user.role != 'admin':
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
-        # Get all products by this farmer
-        farmer_products = Product.query.filter_by(farmerId=farmer_id).all()
-        farmer_product_ids = [p.id for p in farmer_products]
-        
-        if not farmer_product_ids:
-            return jsonify({'success': True, 'customers': []})
-        
-        # Get all order items for this farmer's products
-        order_items = OrderItem.query.filter(OrderItem.productId.in_(farmer_product_ids)).all()
-        
-        # Get unique customer IDs from orders
-        order_ids = list(set([item.orderId for item in order_items]))
-        orders = Order.query.filter(Order.id.in_(order_ids)).all()
-        customer_ids = list(set([order.userId for order in orders]))
+        sort_columns = {
+            'lastOrderDate': FarmerCustomerStats.lastOrderDate,
+            'totalSpent': FarmerCustomerStats.totalSpent,
+            'totalOrders': FarmerCustomerStats.totalOrders,
+            'totalQuantity': FarmerCustomerStats.totalQuantity
+        }
+        sort = request.args.get('sort', 'lastOrderDate')
+        if sort not in sort_columns:
+            return jsonify({'success': False, 'message': f"sort must be one of: {', '.join(sort_columns)}"}), 400
+        sort_column = sort_columns[sort]
+        ordering = sort_column.asc() if request.args.get('order') == 'asc' else sort_column.desc()
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        
+        query = (
+            db.select(FarmerCustomerStats, User, CustomerNote)
+            .join(User, User.id == FarmerCustomerStats.customerId)
+            .outerjoin(CustomerNote, and_(
+                CustomerNote.farmerId == FarmerCustomerStats.farmerId,
+                CustomerNote.customerId == FarmerCustomerStats.customerId
+            ))
+            .where(FarmerCustomerStats.farmerId == farmer_id, FarmerCustomerStats.totalOrders > 0)
+            .order_by(ordering, FarmerCustomerStats.customerId)
+            .offset(offset)
+        )
+        if limit:
+            query = query.limit(limit)
         
-        # Build customer list with order statistics
         customers_list = []
-        for customer_id in customer_ids:
-            customer = User.query.get(customer_id)
-            if not customer:
-                continue
-            
-            # Get customer's orders from this farmer
-            customer_order_ids = [o.id for o in orders if o.userId == customer_id]
-            customer_order_items = [item for item in order_items if item.orderId in customer_order_ids]
-            
-            # Calculate statistics
-            total_orders = len(set([item.orderId for item in customer_order_items]))
-            total_spent = sum([float(item.pricePerKg) * item.quantity for item in customer_order_items])
-            total_quantity = sum([item.quantity for item in customer_order_items])
-            last_order_date = None
-            if customer_order_ids:
-                last_order = Order.query.filter(Order.id.in_(customer_order_ids)).order_by(Order.timestamp.desc()).first()
-                if last_order:
-                    last_order_date = last_order.timestamp.isoformat()
-            
-            # Check if repeat customer (more than 1 order)
-            is_repeat_customer = total_orders > 1
-            
-            # Get customer note if exists
-            customer_note = CustomerNote.query.filter_by(farmerId=farmer_id, customerId=customer_id).first()
-            
+        for stats, customer, customer_note in db.session.execute(query).all():
             customers_list.append({
                 'id': customer.id,
                 'name': customer.name or customer.fullName or 'Unknown',
@@ -1286,18 +2626,15 @@ def get_farmer_customers(current_user, farmer_id):
                 'phone': customer.phone,
                 'whatsapp': customer.whatsapp,
                 'address': customer.address,
-                'totalOrders': total_orders,
-                'totalSpent': round(total_spent, 2),
-                'totalQuantity': total_quantity,
-                'lastOrderDate': last_order_date,
-                'isRepeatCustomer': is_repeat_customer,
+                'totalOrders': stats.totalOrders,
+                'totalSpent': round(float(stats.totalSpent), 2),
+                'totalQuantity': stats.totalQuantity,
+                'lastOrderDate': stats.lastOrderDate.isoformat() if stats.lastOrderDate else None,
+                'isRepeatCustomer': stats.isRepeatCustomer,
                 'note': customer_note.note if customer_note else None,
                 'noteUpdatedAt': customer_note.updatedAt.isoformat() if customer_note else None
             })
         
-        # Sort by last order date (most recent first)
-        customers_list.sort(key=lambda x: x['lastOrderDate'] or '', reverse=True)
-        
         return jsonify({'success': True, 'customers': customers_list})
     
     except Exception as e:
@@ -1343,7 +2680,7 @@ def get_customer_orders(current_user, farmer_id, customer_id):
                         'quantity': item.quantity,
                         'pricePerKg': float(item.pricePerKg),
                         'cropName': item.cropName,
-                        'image': item.image
+                        'image': image_url(item.imageHash, LINE_IMAGE_VARIANT)
                     } for item in farmer_items]
                 })
         
@@ -1410,27 +2747,168 @@ def delete_customer_note(current_user, farmer_id, customer_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# Live updates
+@app.route('/api/stream/<user_id>', methods=['GET'])
+def stream_events(user_id):
+    """Server-Sent Events: notifications, order status and stock changes for one user"""
+    # EventSource cannot set headers, so the token may also come as ?token=
+    token = request.args.get('token') or request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        token = token.split(' ')[1]
+    if not token:
+        return jsonify({'message': 'Token is missing'}), 401
+    try:
+        current_user = load_principal(token)
+    except Exception:
+        current_user = None
+    if current_user is None:
+        return jsonify({'message': 'Invalid token'}), 401
+    if current_user.blocked:
+        return jsonify({'message': 'Account is blocked'}), 403
+    if current_user.id != user_id and current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+
+    subscription = event_broker.subscribe(f"user:{user_id}")
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            yield format_sse('ready', {'userId': user_id})
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                message = subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield format_sse(*message)
+        finally:
+            subscription.close()
+
+    # Each open stream holds a worker thread; gunicorn.conf.py runs gthread workers for this
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 # Notification Routes
+NOTIFICATION_PAGE_DEFAULT_LIMIT = 50
+NOTIFICATION_PAGE_MAX_LIMIT = 200
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'userId': notification.userId,
+        'message': notification.message,
+        'timestamp': notification.timestamp.isoformat(),
+        'read': notification.read
+    }
+
+def parse_since(value):
+    """ISO timestamp from ?since= as naive UTC, or None"""
+    if not value:
+        return None
+    try:
+        since = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('since must be an ISO timestamp')
+    if since.tzinfo:
+        since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return since
+
+def unread_count(user_id):
+    return db.session.execute(db.select(User.unreadNotifications).where(User.id == user_id)).scalar() or 0
+
 @app.route('/api/notifications/<user_id>', methods=['GET'])
+@conditional_get('notifications:{user_id}')
 def get_notifications(user_id):
+    """Newest first, or unread first with ?unreadFirst=true; ?since= returns only newer ones"""
     try:
-        notifications = Notification.query.filter_by(userId=user_id).order_by(Notification.timestamp.desc()).all()
-        notifications_list = []
-        
-        for notification in notifications:
-            notifications_list.append({
-                'id': notification.id,
-                'userId': notification.userId,
-                'message': notification.message,
-                'timestamp': notification.timestamp.isoformat(),
-                'read': notification.read
-            })
+        try:
+            limit = request.args.get('limit', NOTIFICATION_PAGE_DEFAULT_LIMIT, type=int)
+            if limit is None or limit < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = min(limit, NOTIFICATION_PAGE_MAX_LIMIT)
+            unread_first = request.args.get('unreadFirst', 'false').lower() == 'true'
+            cursor = request.args.get('cursor')
+            cursor_values = decode_cursor(cursor, extra=1 if unread_first else 0) if cursor else None
+            since = parse_since(request.args.get('since'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        is_read = func.coalesce(Notification.read, False)
+        query = Notification.query.filter(Notification.userId == user_id)
+        if since:
+            query = query.filter(Notification.timestamp > since)
+        if unread_first:
+            if cursor_values:
+                read, timestamp, row_id = cursor_values
+                older = tuple_(Notification.timestamp, Notification.id) < (timestamp, row_id)
+                if read:
+                    query = query.filter(is_read.is_(True), older)
+                else:
+                    # Past the rest of the unread ones, then every read one
+                    query = query.filter(or_(is_read.is_(True), and_(is_read.is_(False), older)))
+            query = query.order_by(is_read, Notification.timestamp.desc(), Notification.id.desc())
+        else:
+            if cursor_values:
+                query = query.filter(tuple_(Notification.timestamp, Notification.id) < tuple(cursor_values))
+            query = query.order_by(Notification.timestamp.desc(), Notification.id.desc())
+        notifications = query.limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(notifications) > limit:
+            notifications = notifications[:limit]
+            last = notifications[-1]
+            extra = (bool(last.read),) if unread_first else ()
+            next_cursor = encode_cursor(last.timestamp, last.id, *extra)
         
-        return jsonify({'success': True, 'notifications': notifications_list})
+        return jsonify({
+            'success': True,
+            'notifications': [serialize_notification(n) for n in notifications],
+            'nextCursor': next_cursor,
+            'unreadCount': unread_count(user_id)
+        })
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/notifications/<user_id>/unread-count', methods=['GET'])
+@token_required
+def get_unread_notification_count(current_user, user_id):
+    if current_user.id != user_id and current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    try:
+        return jsonify({'success': True, 'unreadCount': unread_count(user_id)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/notifications/<user_id>/read-all', methods=['PUT'])
+@token_required
+def mark_notifications_read(current_user, user_id):
+    """Mark every notification up to and including {'upTo': <notification id>} as read (all if omitted)"""
+    if current_user.id != user_id and current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    try:
+        data = request.get_json(silent=True) or {}
+        query = update(Notification).where(
+            Notification.userId == user_id,
+            or_(Notification.read.is_(False), Notification.read.is_(None))
+        )
+        if data.get('upTo'):
+            boundary = Notification.query.filter_by(id=data['upTo'], userId=user_id).first()
+            if not boundary:
+                return jsonify({'success': False, 'message': 'Notification not found'}), 404
+            query = query.where(tuple_(Notification.timestamp, Notification.id) <= (boundary.timestamp, boundary.id))
+        marked = db.session.execute(query.values(read=True).execution_options(synchronize_session=False)).rowcount
+        adjust_unread_counts({user_id: -marked})
+        if marked:
+            queue_invalidation(f"notifications:{user_id}")
+        db.session.commit()
+        return jsonify({'success': True, 'marked': marked, 'unreadCount': unread_count(user_id)})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/notifications/<notification_id>/read', methods=['PUT'])
 def mark_notification_read(notification_id):
     try:
@@ -1459,6 +2937,7 @@ def add_search_history(current_user):
         entry = SearchHistory(userId=current_user.id, searchTerm=search_term)
         db.session.add(entry)
         db.session.commit()
+        recommendation_cache.invalidate_user(current_user.id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -1472,7 +2951,11 @@ def get_recommendations(current_user, user_id):
             return jsonify({'success': False, 'message': 'Forbidden'}), 403
 
         current_month = datetime.datetime.now().month
-        
+        cached = recommendation_cache.get(user_id, current_month)
+        if cached is not None:
+            return jsonify({'success': True, 'recommendations': cached})
+        catalog_version = recommendation_cache.catalog_version
+
         # Get user's search history
         recent_terms = (
             SearchHistory.query
@@ -1483,60 +2966,47 @@ def get_recommendations(current_user, user_id):
         )
         terms = [t.searchTerm.lower() for t in recent_terms]
 
-        # Get user's purchase history for preference scoring
-        purchase_history = (
-            PurchaseHistory.query
-            .filter_by(userId=user_id)
-            .order_by(PurchaseHistory.purchaseDate.desc())
-            .limit(50)
+        # Purchase profile: total quantity and recent purchase count per crop, in one query
+        now = datetime.datetime.utcnow()
+        recent_cutoff = now - datetime.timedelta(days=RECENT_PURCHASE_DAYS)
+        profile_rows = (
+            db.session.query(
+                PurchaseHistory.cropName,
+                func.sum(PurchaseHistory.quantity),
+                func.sum(case((PurchaseHistory.purchaseDate > recent_cutoff, 1), else_=0))
+            )
+            .filter(PurchaseHistory.userId == user_id)
+            .group_by(PurchaseHistory.cropName)
             .all()
         )
-
-        # Get all available products (exclude sold-out products)
-        all_products = Product.query.filter(Product.availableQuantity > 0).order_by(Product.createdAt.desc()).all()
-        
-        # Score products based on multiple factors
-        scored_products = []
-        
-        for product in all_products:
-            score = 1.0  # Base score
-            
-            # 1. Search-based scoring (existing logic)
-            if terms:
-                crop = (product.cropName or '').lower()
-                cat = (product.cropCategory or '').lower()
-                if any(term in crop or term in cat for term in terms):
-                    score *= 2.0  # 2x boost for search matches
-            
-            # 2. Purchase history-based scoring
-            purchase_score = get_purchase_preference_score(
-                user_id, 
-                product.cropName, 
-                product.cropCategory
+        profile = {crop: (float(total or 0), int(recent or 0)) for crop, total, recent in profile_rows}
+
+        # Score every available product from just the columns the boosts need
+        candidates = (
+            db.session.query(
+                Product.id,
+                Product.cropName,
+                Product.cropCategory,
+                Product.isSeasonal,
+                in_season_clause(current_month).label('inSeason'),
+                Product.createdAt,
+                Product.availableQuantity
             )
-            score *= purchase_score
-            
-            # 3. Seasonal availability scoring
-            seasonal_score = get_seasonal_boost(product, current_month)
-            score *= seasonal_score
-            
-            # 4. Recency boost (newer products get slight boost)
-            days_old = (datetime.datetime.utcnow() - product.createdAt).days
-            recency_boost = max(0.8, 1.0 - (days_old / 365.0))  # Decay over a year
-            score *= recency_boost
-            
-            # 5. Availability boost (products with more stock get slight boost)
-            availability_boost = min(1.2, 1.0 + (product.availableQuantity / 100.0))
-            score *= availability_boost
-            
-            scored_products.append((product, score))
-        
-        # Sort by score and take top 12
-        scored_products.sort(key=lambda x: x[1], reverse=True)
-        top_products = scored_products[:12]
+            .filter(Product.availableQuantity > 0)
+            .order_by(Product.createdAt.desc())
+            .all()
+        )
+        scores = score_candidates(candidates, terms, profile, now)
+        top = [(candidates[i].id, float(scores[i])) for i in top_k(scores, RECOMMENDATION_LIMIT)]
+
+        # Load full rows for the top-K only
+        products = {p.id: p for p in Product.query.filter(Product.id.in_([pid for pid, _ in top])).all()} if top else {}
 
         recs = []
-        for product, score in top_products:
+        for product_id, score in top:
+            product = products.get(product_id)
+            if product is None:
+                continue
             recs.append({
                 'id': product.id,
                 'farmerId': product.farmerId,
@@ -1548,7 +3018,7 @@ def get_recommendations(current_user, user_id):
                 'cropName': product.cropName,
                 'pricePerKg': float(product.pricePerKg),
                 'availableQuantity': product.availableQuantity,
-                'image': product.image,
+                'image': image_url(product.imageHash, LIST_IMAGE_VARIANT),
                 'isSeasonal': product.isSeasonal,
                 'seasonalMonths': product.seasonalMonths,
                 'inSeason': is_seasonal_product(product, current_month),
@@ -1556,6 +3026,7 @@ def get_recommendations(current_user, user_id):
                 'createdAt': product.createdAt.isoformat()
             })
 
+        recommendation_cache.set(user_id, current_month, recs, catalog_version)
         return jsonify({'success': True, 'recommendations': recs})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1595,6 +3066,7 @@ def block_user(user_id):
         if user:
             user.blocked = True
             db.session.commit()
+            principal_cache.invalidate_user(user_id)
             return jsonify({'success': True, 'message': 'User blocked successfully'})
         else:
             return jsonify({'success': False, 'message': 'User not found'}), 404
@@ -1611,6 +3083,7 @@ def unblock_user(user_id):
         if user:
             user.blocked = False
             db.session.commit()
+            principal_cache.invalidate_user(user_id)
             return jsonify({'success': True, 'message': 'User unblocked successfully'})
         else:
             return jsonify({'success': False, 'message': 'User not found'}), 404
@@ -1619,6 +3092,52 @@ def unblock_user(user_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/admin/metrics', methods=['GET'])
+@admin_required
+def get_admin_metrics():
+    return jsonify({
+        'success': True,
+        'metrics': {
+            'principalCache': principal_cache.stats(),
+            'recommendationCache': recommendation_cache.stats(),
+            'responseCache': response_cache.stats(),
+            'imagePipeline': image_pipeline.stats(),
+            'notificationService': notification_service.stats(),
+            'dbPool': pool_metrics(db.engine),
+            'queryProfiler': query_profiler.stats(),
+            'logging': log_control.stats(),
+            'dbPoolStartupCheck': pool_startup_check
+        }
+    })
+
+@app.route('/api/admin/log-levels', methods=['GET', 'PUT'])
+@admin_required
+def admin_log_levels():
+    """Read or change this worker's log levels: {'level': 'INFO', 'routes': {'place_order': 'DEBUG', 'get_cart': None}}"""
+    if request.method == 'PUT':
+        data = request.get_json() or {}
+        try:
+            if data.get('level'):
+                log_control.set_default_level(data['level'])
+            for route, level in (data.get('routes') or {}).items():
+                if route not in app.view_functions:
+                    raise ValueError(f"Unknown route: {route}")
+                log_control.set_route_level(route, level)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'logging': log_control.stats()})
+
+@app.route('/api/admin/farmer-customer-stats/rebuild', methods=['POST'])
+@admin_required
+def rebuild_customer_stats():
+    try:
+        pairs = rebuild_farmer_customer_stats()
+        db.session.commit()
+        return jsonify({'success': True, 'message': f'Rebuilt statistics for {pairs} farmer-customer pairs'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/admin/blocked-users', methods=['GET'])
 @admin_required
 def get_blocked_users():
@@ -1666,7 +3185,7 @@ def get_all_products_admin():
                 'category': product.cropCategory,
                 'price': product.pricePerKg,
                 'stock': product.availableQuantity,
-                'image': product.image,
+                'image': image_url(product.imageHash, LIST_IMAGE_VARIANT),
                 'location': product.farmerAddress,  # Use farmerAddress as location
                 'farmerId': product.farmerId,
                 'farmerName': farmer_name,
@@ -1709,7 +3228,7 @@ def get_all_orders_admin():
                     'quantity': item.quantity,
                     'pricePerKg': float(item.pricePerKg),
                     'cropName': item.cropName,
-                    'image': item.image
+                    'image': image_url(item.imageHash, LINE_IMAGE_VARIANT)
                 })
             
             orders_list.append({
@@ -1762,23 +3281,47 @@ def initialize_database():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# Expired-product sweep runs off the request path on every worker; the job lease
+# makes sure only one of them runs it per interval. The thread is started per
+# process (gunicorn.conf.py, or the first request), never at import: with
+# --preload it would only live in the master, and the reloader would start two
+scheduler = Scheduler(
+    acquire_lease=acquire_job_lease,
+    record_run=record_job_run,
+    context=app.app_context,
+    poll_interval=SCHEDULER_POLL_SECONDS
+)
+scheduler.add_job('expiry_sweep', check_and_remove_expired_products, EXPIRY_SWEEP_INTERVAL_SECONDS)
+scheduler.add_job('idempotency_purge', purge_idempotency_keys, IDEMPOTENCY_PURGE_INTERVAL_SECONDS)
+scheduler.add_job('notification_archive', archive_read_notifications, NOTIFICATION_ARCHIVE_INTERVAL_SECONDS)
+
+# Fail loudly in the logs, not in the first request, if the database or pool settings are off
+pool_startup_check = None
+if DB_POOL_STARTUP_CHECK:
+    with app.app_context():
+        pool_startup_check = check_pool(db.engine)
+        logger.log(
+            logging.INFO if pool_startup_check['ok'] else logging.ERROR,
+            "Database pool check %s", 'passed' if pool_startup_check['ok'] else 'FAILED',
+            extra={'check': pool_startup_check}
+        )
+        # Don't hand this connection to forked workers (gunicorn --preload)
+        db.engine.dispose()
+
+def start_background_jobs():
+    """Start this process's scheduler (if enabled)"""
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.before_request
+def ensure_background_jobs():
+    # Covers servers without a gunicorn.conf.py hook; cheap once the thread runs
+    start_background_jobs()
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
-        # Run initial check for expired products
-        check_and_remove_expired_products()
-    
-    # Schedule periodic check for expired products (every 1 hour)
-    def periodic_cleanup():
-        while True:
-            time.sleep(3600)  # Check every hour
-            with app.app_context():
-                try:
-                    check_and_remove_expired_products()
-                except Exception as e:
-                    print(f"Error in periodic cleanup: {e}")
-    
-    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
-    cleanup_thread.start()
     
+    if is_running_from_reloader():
+        start_background_jobs()  # The reloader's child serves requests; the parent only watches files
     app.run(debug=True, host='0.0.0.0', port=5000)
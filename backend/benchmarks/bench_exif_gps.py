@@ -0,0 +1,111 @@
+"""
+Throughput benchmark for exif_gps.py.
+
+    python benchmarks/bench_exif_gps.py [--corpus DIR] [--files 30] [--repeat 5] [--workers 4]
+
+Loads every .jpg/.jpeg under --corpus into memory (without --corpus, generates
+--files geotagged phone-camera-sized JPEGs with Pillow), then measures
+read_geotag() in one process, a full Pillow decode of the same files for
+comparison, and read_geotag() fanned out over a process pool the way the
+image pipeline runs it (each job receives the whole upload).
+"""
+
+import argparse
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exif_gps import read_geotag  # noqa: E402
+
+SIZES = ((2000, 1500), (3000, 2250), (4000, 3000))
+
+
+def load_corpus(directory):
+    corpus = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(('.jpg', '.jpeg')):
+                with open(os.path.join(root, name), 'rb') as jpeg:
+                    corpus.append(jpeg.read())
+    return corpus
+
+
+def generate_corpus(count):
+    from PIL import Image
+
+    corpus = []
+    for index in range(count):
+        width, height = SIZES[index % len(SIZES)]
+        # Noise compresses badly, so file sizes are at the large end of real photos
+        image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+        exif = Image.Exif()
+        exif[0x010F] = 'Benchmark'
+        exif.get_ifd(0x8769)[0x9003] = '2024:05:01 10:30:00'
+        gps = exif.get_ifd(0x8825)
+        gps[1], gps[2] = 'N', (float(random.randint(8, 30)), float(random.randint(0, 59)), 12.5)
+        gps[3], gps[4] = 'E', (float(random.randint(68, 90)), float(random.randint(0, 59)), 40.25)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85, exif=exif.tobytes())
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+def has_location(data):
+    geotag = read_geotag(io.BytesIO(data))
+    return bool(geotag and geotag.has_location)
+
+
+def pillow_decode(data):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+
+
+def timed(label, corpus, repeat, func):
+    total_bytes = sum(len(data) for data in corpus) * repeat
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    files = len(corpus) * repeat
+    print(f"{label:<30} {files:>6} files  {elapsed:7.3f}s  {files / elapsed:10,.0f} files/s  "
+          f"{total_bytes / elapsed / 1e6:9,.0f} MB/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='directory of sample JPEGs (default: generate them)')
+    parser.add_argument('--files', type=int, default=30, help='JPEGs to generate without --corpus')
+    parser.add_argument('--repeat', type=int, default=5, help='passes over the corpus per measurement')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.files)
+    if not corpus:
+        sys.exit('No JPEGs found')
+    print(f"{len(corpus)} files, {sum(len(data) for data in corpus) / len(corpus) / 1e6:.1f} MB average")
+
+    tagged = timed('read_geotag()', corpus, args.repeat,
+                   lambda: [has_location(data) for _ in range(args.repeat) for data in corpus])
+    print(f"{sum(tagged) // args.repeat} of {len(corpus)} files have a GPS position")
+    try:
+        timed('Pillow full decode', corpus, 1, lambda: [pillow_decode(data) for data in corpus])
+    except ImportError:
+        print('Pillow is not installed; skipping the decode comparison')
+
+    context = multiprocessing.get_context('fork') if hasattr(os, 'fork') else multiprocessing.get_context()
+    with concurrent.futures.ProcessPoolExecutor(args.workers, mp_context=context) as pool:
+        list(pool.map(has_location, corpus[:args.workers]))  # Start the workers outside the measurement
+        timed(f'read_geotag() x{args.workers} workers', corpus, args.repeat,
+              lambda: list(pool.map(has_location, corpus * args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
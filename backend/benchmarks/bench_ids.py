@@ -0,0 +1,90 @@
+"""
+Throughput and collision benchmark for ids.py.
+
+    python benchmarks/bench_ids.py [--count 2000000] [--workers 8] [--threads 4]
+
+Measures single-call and batch throughput in one process, then forks
+several workers that each generate --count IDs at full speed from
+--threads threads and checks that the union has no duplicates and that
+each thread's IDs are strictly increasing.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ids import new_id, new_ids  # noqa: E402
+
+
+def timed(label, count, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {count:>10,} ids  {elapsed:7.3f}s  {count / elapsed:12,.0f} ids/s")
+
+
+def generate(count, batch):
+    ids = []
+    if batch:
+        for _ in range(count // batch):
+            ids.extend(new_ids('order', batch))
+    else:
+        ids = [new_id('order') for _ in range(count)]
+    return ids
+
+
+def worker(count, batch, threads, queue):
+    # Half the threads call new_id() one at a time, the rest take batches, all sharing this process's generator
+    per_thread = [[] for _ in range(threads)]
+
+    def run(index):
+        per_thread[index] = generate(count // threads, batch if index % 2 else 0)
+
+    pool = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    monotonic = all(a < b for ids in per_thread for a, b in zip(ids, ids[1:]))
+    queue.put((os.getpid(), monotonic, [i for ids in per_thread for i in ids]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=2_000_000, help='IDs per measurement / per worker')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker process')
+    parser.add_argument('--batch', type=int, default=1000, help='batch size for new_ids()')
+    args = parser.parse_args()
+
+    timed('new_id()', args.count, lambda: [new_id('order') for _ in range(args.count)])
+    timed(f'new_ids(batch={args.batch})', args.count,
+          lambda: [new_ids('order', args.batch) for _ in range(args.count // args.batch)])
+
+    context = multiprocessing.get_context('fork') if hasattr(os, 'fork') else multiprocessing.get_context()
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(args.count, args.batch, args.threads, queue)) for _ in range(args.workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    total = sum(len(ids) for _, _, ids in results)
+    unique = len(set().union(*(ids for _, _, ids in results)))
+    label = f'{args.workers} workers x {args.threads} threads'
+    print(f"{label:<28} {total:>10,} ids  {elapsed:7.3f}s  {total / elapsed:12,.0f} ids/s (incl. transfer)")
+    print(f"collisions: {total - unique}")
+    print(f"monotonic per thread: {all(monotonic for _, monotonic, _ in results)}")
+    return 0 if total == unique else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
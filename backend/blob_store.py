@@ -0,0 +1,130 @@
+"""
+Content-addressed blob storage for product images.
+
+Blobs are keyed by the SHA-256 of their bytes, so an image is written once no
+matter how many products, cart rows or order lines reference it. Backends
+implement the small BlobStore interface; the local filesystem backend is the
+default and others can be registered with register_backend().
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+DATA_URL_PATTERN = re.compile(r'^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?P<params>(;[^;,]*)*?);base64,(?P<payload>.*)$', re.DOTALL)
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blobs')
+
+
+def blob_hash(data):
+    """Return the content hash used as a blob key"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_valid_hash(value):
+    """Check that a value looks like a blob key before it touches the filesystem"""
+    return bool(value) and bool(HASH_PATTERN.match(value))
+
+
+def decode_data_url(value):
+    """Decode a base64 data URL into (bytes, content_type)"""
+    if not isinstance(value, str):
+        raise ValueError('Image must be a base64 data URL')
+    match = DATA_URL_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError('Image must be a base64 data URL')
+    try:
+        data = base64.b64decode(match.group('payload'), validate=False)
+    except (binascii.Error, ValueError):
+        raise ValueError('Image data is not valid base64')
+    if not data:
+        raise ValueError('Image data is empty')
+    return data, match.group('mime') or 'application/octet-stream'
+
+
+class BlobStore:
+    """Interface implemented by every blob backend"""
+
+    def put(self, data):
+        """Store bytes and return their hash; storing existing content is a no-op"""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Return a readable binary file object for a blob, or None if missing"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Stores blobs on the local filesystem, fanned out by hash prefix"""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, data):
+        key = blob_hash(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def open(self, key):
+        if not is_valid_hash(key):
+            return None
+        try:
+            return open(self._path(key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return is_valid_hash(key) and os.path.exists(self._path(key))
+
+    def delete(self, key):
+        if self.exists(key):
+            os.remove(self._path(key))
+
+
+BACKENDS = {
+    'local': LocalBlobStore,
+}
+
+
+def register_backend(name, backend_class):
+    """Make a BlobStore implementation selectable through BLOB_STORE_BACKEND"""
+    BACKENDS[name] = backend_class
+
+
+def create_blob_store(backend=None, **options):
+    """Build the configured blob store (defaults come from the environment)"""
+    backend = backend or os.getenv('BLOB_STORE_BACKEND', 'local')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown blob store backend: {backend}")
+    if backend == 'local' and 'root' not in options:
+        options['root'] = os.getenv('BLOB_STORE_PATH', DEFAULT_ROOT)
+    return BACKENDS[backend](**options)
@@ -0,0 +1,247 @@
+"""
+Response cache for hot read endpoints.
+
+Responses are stored under the endpoint path plus its query parameters,
+together with the current versions of the tags they depend on ("catalog",
+"cart:<user_id>", ...). Write paths invalidate by bumping a tag's version:
+nothing is deleted, but every entry stored under an older version stops
+matching. Tag versions are read before the response is computed, so a
+response built from data that a concurrent write has just changed is stored
+under the old version and never served.
+
+Entries expire after their own TTL (the catalog uses the next price-decay
+boundary) and are then kept for a short stale window. While one request
+recomputes an expired entry, concurrent requests for it are served the stale
+copy instead of piling onto the database, and a stale copy also stands in
+when recomputing fails.
+
+The lru backend is per process: an invalidation reaches the worker that made
+the write, while other workers catch up when their entries expire. The redis
+backend (any server speaking the Redis protocol) shares entries and tag
+versions between every worker.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LOCK_SECONDS = 10  # Recompute locks held by a crashed worker expire after this
+
+
+class LRUBackend:
+    """In-process entries with LRU eviction"""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (deadline, entry)
+        self._versions = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, entry, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def try_lock(self, key, ttl=LOCK_SECONDS):
+        now = time.time()
+        with self._lock:
+            if self._locks.get(key, 0) > now:
+                return False
+            self._locks[key] = now + ttl
+            return True
+
+    def unlock(self, key):
+        with self._lock:
+            self._locks.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'lru', 'entries': len(self._entries), 'evictions': self.evictions}
+
+
+class RedisBackend:
+    """Entries and tag versions shared through a Redis-protocol server"""
+
+    def __init__(self, url=None, prefix='f2c:cache:'):
+        import redis  # Only needed for this backend
+        self._redis = redis.Redis.from_url(url or os.getenv('RESPONSE_CACHE_URL', 'redis://localhost:6379/0'))
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(f"{self.prefix}entry:{key}")
+        return json.loads(raw) if raw else None
+
+    def set(self, key, entry, ttl):
+        self._redis.set(f"{self.prefix}entry:{key}", json.dumps(entry), ex=max(1, int(ttl + 0.999)))
+
+    def tag_versions(self, tags):
+        if not tags:
+            return []
+        return [int(value or 0) for value in self._redis.mget([f"{self.prefix}tag:{tag}" for tag in tags])]
+
+    def bump(self, tags):
+        pipeline = self._redis.pipeline(transaction=False)
+        for tag in tags:
+            pipeline.incr(f"{self.prefix}tag:{tag}")
+        pipeline.execute()
+
+    def try_lock(self, key, ttl=LOCK_SECONDS):
+        return bool(self._redis.set(f"{self.prefix}lock:{key}", 1, nx=True, ex=ttl))
+
+    def unlock(self, key):
+        self._redis.delete(f"{self.prefix}lock:{key}")
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+BACKENDS = {
+    'lru': LRUBackend,
+    'redis': RedisBackend,
+}
+
+
+class ResponseCache:
+    """Tag-versioned response cache with stale serving; see the module docstring"""
+
+    def __init__(self, backend, ttl=300, stale_ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_serves = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def fetch(self, key, tags, compute):
+        """Cached (body, status, state) for key, calling compute() -> (body, status, ttl) on a miss
+
+        state is 'HIT', 'MISS', 'STALE' or 'BYPASS' (backend unavailable).
+        A ttl of None means the default; only 200 responses with a positive
+        ttl are stored.
+        """
+        try:
+            versions = self.backend.tag_versions(tags)
+            entry = self.backend.get(key)
+        except Exception:
+            logger.exception("Response cache unavailable; computing %s directly", key)
+            self.errors += 1
+            body, status, _ = compute()
+            return body, status, 'BYPASS'
+
+        stale = None
+        locked = False
+        if entry is not None and entry['versions'] == versions:
+            if time.time() < entry['expiresAt']:
+                self.hits += 1
+                return entry['body'], entry['status'], 'HIT'
+            stale = entry
+            locked = self._try_lock(key)
+            if not locked:
+                # Someone else is already recomputing this entry
+                self.stale_serves += 1
+                return stale['body'], stale['status'], 'STALE'
+
+        try:
+            try:
+                body, status, ttl = compute()
+            except Exception:
+                if stale is None:
+                    raise
+                logger.exception("Recomputing %s failed; serving the stale copy", key)
+                body, status, ttl = None, 500, None
+            if status >= 500 and stale is not None:
+                self.stale_serves += 1
+                return stale['body'], stale['status'], 'STALE'
+            self.misses += 1
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+            if status == 200 and ttl > 0:
+                entry = {'body': body, 'status': status, 'versions': versions, 'expiresAt': time.time() + ttl}
+                self._call(self.backend.set, key, entry, ttl + self.stale_ttl)
+            return body, status, 'MISS'
+        finally:
+            if locked:
+                self._call(self.backend.unlock, key)
+
+    def invalidate(self, *tags):
+        """Retire every entry stored under any of these tags"""
+        if tags:
+            self.invalidations += 1
+            self._call(self.backend.bump, tags)
+
+    def _try_lock(self, key):
+        try:
+            return self.backend.try_lock(key)
+        except Exception:
+            self.errors += 1
+            return True  # Recompute without a lock rather than serve stale forever
+
+    def _call(self, method, *args):
+        try:
+            method(*args)
+        except Exception:
+            logger.exception("Response cache %s failed", method.__name__)
+            self.errors += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale_serves
+        try:
+            backend = self.backend.stats()
+        except Exception:
+            backend = {}
+        return {
+            **backend,
+            'hits': self.hits,
+            'misses': self.misses,
+            'staleServes': self.stale_serves,
+            'hitRate': round((self.hits + self.stale_serves) / lookups, 3) if lookups else None,
+            'invalidations': self.invalidations,
+            'errors': self.errors
+        }
+
+
+def create_cache(backend=None):
+    """Build the configured cache (RESPONSE_CACHE_BACKEND defaults to lru)"""
+    backend = backend or os.getenv('RESPONSE_CACHE_BACKEND', 'lru')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown response cache backend: {backend}")
+    if backend == 'lru':
+        store = LRUBackend(max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '5000')))
+    else:
+        store = BACKENDS[backend]()
+    return ResponseCache(
+        store,
+        ttl=int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300')),
+        stale_ttl=int(os.getenv('RESPONSE_CACHE_STALE_SECONDS', '30'))
+    )
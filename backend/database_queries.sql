@@ -1,12 +1,13 @@
 -- Database Queries for Profile Functionality and Enhanced Features
 -- Run these queries if you need to manually update the database
 
--- 1. Ensure image columns can store large base64 data (if migration didn't work)
--- This should already be handled by the migration script, but here are the manual queries:
+-- 1. Images now live in the blob store and rows reference them by hash.
+-- migrate_database.py moves existing base64 data into the store; the legacy
+-- image columns are left nullable and can be dropped once it has run:
 
-ALTER TABLE products MODIFY COLUMN image LONGTEXT NOT NULL;
-ALTER TABLE order_items MODIFY COLUMN image LONGTEXT NOT NULL;
-ALTER TABLE cart MODIFY COLUMN image LONGTEXT NOT NULL;
+-- ALTER TABLE products DROP COLUMN image;
+-- ALTER TABLE order_items DROP COLUMN image;
+-- ALTER TABLE cart DROP COLUMN image;
 
 -- 2. Add any missing columns to users table (if needed)
 -- Check if these columns exist before running:
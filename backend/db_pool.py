@@ -0,0 +1,179 @@
+"""
+Database connection pool configuration and metrics.
+
+Engine options come from the environment:
+
+    DB_POOL_SIZE            connections kept open per worker (default 5)
+    DB_MAX_OVERFLOW         extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT         seconds a request waits for a connection (default 30)
+    DB_POOL_RECYCLE         reopen connections older than this many seconds (default 1800)
+    DB_POOL_PRE_PING        test connections on checkout (default true)
+
+Pre-ping and recycling keep connections that the server or a proxy closed
+while idle from surfacing as errors in the next request. The pool records
+how long each checkout waited, so /api/admin/metrics can show whether
+requests are queueing for connections.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the checkout wait histogram buckets; the last bucket is open-ended
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def engine_options_from_env(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}  # In-memory SQLite needs its single shared connection
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+
+
+class PoolStats:
+    """Counters and a checkout wait histogram for one pool (one worker process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, wait_ms, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'waitAvgMs': round(self.wait_total_ms / waits, 3) if waits else None,
+                'waitMaxMs': round(self.wait_max_ms, 3),
+                # upToMs None is everything slower than the last bound
+                'waitHistogram': [
+                    {'upToMs': bound, 'count': count}
+                    for bound, count in zip(WAIT_BUCKETS_MS + (None,), self.wait_buckets)
+                ]
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection"""
+
+    # Log as a SQLAlchemy pool (not under db_pool), so the sqlalchemy level and echo_pool apply to it
+    _sqla_logger_namespace = 'sqlalchemy.pool.impl.InstrumentedQueuePool'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats  # Keep counting across dispose()
+        return pool
+
+    def _create_connection(self):
+        self.stats.increment('connects')
+        return super()._create_connection()
+
+    def _invalidate(self, connection, exception=None, _checkin=True):
+        self.stats.increment('invalidations')
+        return super()._invalidate(connection, exception, _checkin)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            self.stats.record_wait((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        self.stats.record_wait((time.perf_counter() - started) * 1000)
+        return connection
+
+
+def pool_metrics(engine):
+    """Current pool state plus the instrumented counters for this worker"""
+    pool = engine.pool
+    metrics = {'pid': os.getpid(), 'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checkedOut=pool.checkedout(),
+            checkedIn=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            maxOverflow=pool._max_overflow,
+            timeout=pool.timeout()
+        )
+    stats = getattr(pool, 'stats', None)
+    if stats:
+        metrics.update(stats.snapshot())
+    return metrics
+
+
+def check_pool(engine, workers=None):
+    """Startup self-check: round-trip a connection and compare the pool with the server's limit
+
+    Returns a dict of findings; problems are listed under 'warnings' rather than raised.
+    """
+    workers = workers or int(os.getenv('GUNICORN_WORKERS', '2'))  # Same setting and default as gunicorn.conf.py
+    result = {'ok': False, 'warnings': []}
+    started = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            if engine.dialect.name == 'postgresql':
+                max_connections = int(connection.execute(text('SHOW max_connections')).scalar())
+                result['serverMaxConnections'] = max_connections
+                pool = engine.pool
+                if isinstance(pool, QueuePool):
+                    per_worker = pool.size() + max(pool._max_overflow, 0)
+                    needed = per_worker * workers
+                    result['poolCapacity'] = needed
+                    if needed > max_connections:
+                        result['warnings'].append(
+                            f"{workers} workers x {per_worker} connections exceeds max_connections={max_connections}"
+                        )
+        result['ok'] = True
+    except Exception as e:
+        result['warnings'].append(f"Could not connect: {e}")
+    result['latencyMs'] = round((time.perf_counter() - started) * 1000, 3)
+    if not engine.pool._pre_ping:
+        result['warnings'].append('pool_pre_ping is off; connections closed while idle will fail the next request')
+    for warning in result['warnings']:
+        logger.warning("Database pool check: %s", warning)
+    return result
@@ -0,0 +1,178 @@
+"""
+Publish/subscribe for the per-user Server-Sent Events stream.
+
+Request handlers publish small JSON events (new notifications, order status
+transitions, stock and expiry changes) to a channel per user, and every open
+/api/stream/<user_id> connection holds a subscription to its user's channel.
+
+The local broker only reaches subscribers in the same process, which is all a
+single-worker deployment needs. With several workers, the postgres backend
+fans events out through LISTEN/NOTIFY: publishers NOTIFY, and one listener
+thread per process delivers what it hears to its local subscribers.
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+NOTIFY_CHANNEL = 'f2c_events'
+NOTIFY_MAX_PAYLOAD = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+
+def format_sse(event, data):
+    """Encode one event in text/event-stream framing"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscription:
+    """A bounded queue of events for one stream connection
+
+    If the client falls too far behind, the oldest events are dropped and the
+    next read returns a 'resync' event so the client knows to refetch.
+    """
+
+    def __init__(self, broker, channel, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._overflowed = False
+
+    def put(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                self._overflowed = True
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Next (event, data) pair, or None if nothing arrived within timeout"""
+        if self._overflowed:
+            self._overflowed = False
+            return ('resync', {})
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process fan-out from channels to subscriptions"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put((event, data))
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+class PostgresBroker(LocalBroker):
+    """Fans events out to every process through Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, dsn, reconnect_delay=5):
+        super().__init__()
+        import psycopg2  # Only needed for this backend
+        self._psycopg2 = psycopg2
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+        self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+        self._listener.start()
+
+    def _connect(self):
+        conn = self._psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def publish(self, channel, event, data):
+        payload = json.dumps({'channel': channel, 'event': event, 'data': data}, default=str)
+        if len(payload.encode('utf-8')) > NOTIFY_MAX_PAYLOAD:
+            logger.warning("Event %s for %s is too large for NOTIFY; delivering locally only", event, channel)
+            super().publish(channel, event, data)
+            return
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_conn is None or self._publish_conn.closed:
+                        self._publish_conn = self._connect()
+                    with self._publish_conn.cursor() as cursor:
+                        cursor.execute('SELECT pg_notify(%s, %s)', (NOTIFY_CHANNEL, payload))
+                    return
+                except self._psycopg2.Error:
+                    self._publish_conn = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            message = json.loads(notify.payload)
+                            super().publish(message['channel'], message['event'], message['data'])
+                        except (ValueError, KeyError):
+                            logger.warning("Ignoring malformed event payload")
+            except Exception:
+                logger.exception("Event listener lost its connection; reconnecting")
+                time.sleep(self.reconnect_delay)
+
+
+BACKENDS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker,
+}
+
+
+def create_broker(backend=None, **options):
+    """Build the configured broker (EVENTS_BACKEND defaults to local)"""
+    backend = backend or os.getenv('EVENTS_BACKEND', 'local')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown events backend: {backend}")
+    if backend == 'local':
+        return LocalBroker()
+    return BACKENDS[backend](**options)
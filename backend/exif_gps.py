@@ -0,0 +1,209 @@
+"""
+GPS position and capture time from a JPEG's EXIF block.
+
+Only the file's header segments are read: read_geotag() walks the JPEG
+markers up to the APP1 "Exif" segment (which cameras write before the
+image data) and stops at the start of the compressed scan at the latest,
+so a 10MB photo costs a few kilobytes of reading and no pixel decoding.
+The TIFF structure inside the segment is parsed directly; only IFD0, the
+Exif IFD and the GPS IFD are visited.
+
+Malformed or truncated metadata is treated as absent rather than raised,
+since it comes straight from user uploads.
+"""
+
+import datetime
+import struct
+
+SOI = b'\xff\xd8'
+EXIF_HEADER = b'Exif\x00\x00'
+MAX_IFD_ENTRIES = 512
+
+# TIFF tags
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_GPS_LATITUDE_REF = 1
+TAG_GPS_LATITUDE = 2
+TAG_GPS_LONGITUDE_REF = 3
+TAG_GPS_LONGITUDE = 4
+
+# TIFF field type -> (struct code, size in bytes)
+_TYPES = {
+    1: ('B', 1),   # BYTE
+    2: ('s', 1),   # ASCII
+    3: ('H', 2),   # SHORT
+    4: ('L', 4),   # LONG
+    5: ('LL', 8),  # RATIONAL
+    7: ('s', 1),   # UNDEFINED
+    9: ('l', 4),   # SLONG
+    10: ('ll', 8), # SRATIONAL
+}
+
+
+class GeoTag:
+    """Where and when a photo was taken; any field may be None"""
+
+    __slots__ = ('latitude', 'longitude', 'taken_at')
+
+    def __init__(self, latitude=None, longitude=None, taken_at=None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.taken_at = taken_at
+
+    @property
+    def has_location(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def to_dict(self):
+        return {
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'takenAt': self.taken_at.isoformat() if self.taken_at else None
+        }
+
+    def __repr__(self):
+        return f"GeoTag({self.latitude!r}, {self.longitude!r}, {self.taken_at!r})"
+
+
+def _skip(stream, count):
+    if stream.seekable():
+        stream.seek(count, 1)
+        return
+    while count > 0:
+        chunk = stream.read(min(count, 65536))
+        if not chunk:
+            return
+        count -= len(chunk)
+
+
+def find_exif_segment(stream):
+    """TIFF bytes of a JPEG stream's EXIF segment, or None; reads no further than the first scan"""
+    if stream.read(2) != SOI:
+        return None
+    while True:
+        prefix = stream.read(1)
+        if prefix != b'\xff':
+            return None
+        marker = stream.read(1)
+        while marker == b'\xff':  # Fill bytes
+            marker = stream.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in (0xD9, 0xDA):  # End of image / start of scan: no metadata follows
+            return None
+        if code == 0x01 or 0xD0 <= code <= 0xD7:  # Markers without a length
+            continue
+        length_bytes = stream.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0] - 2
+        if length < 0:
+            return None
+        if code == 0xE1:
+            payload = stream.read(length)
+            if payload.startswith(EXIF_HEADER):
+                return payload[len(EXIF_HEADER):]
+            continue  # XMP also lives in APP1
+        _skip(stream, length)
+
+
+def _read_ifd(data, offset, order):
+    """{tag: value} for one IFD; values are str for ASCII and tuples otherwise"""
+    if offset < 8 or offset + 2 > len(data):
+        raise ValueError('IFD offset out of range')
+    count = struct.unpack_from(order + 'H', data, offset)[0]
+    if count > MAX_IFD_ENTRIES or offset + 2 + count * 12 > len(data):
+        raise ValueError('IFD out of range')
+    entries = {}
+    for index in range(count):
+        tag, field_type, items, raw = struct.unpack_from(order + 'HHL4s', data, offset + 2 + index * 12)
+        if field_type not in _TYPES:
+            continue
+        code, size = _TYPES[field_type]
+        length = size * items
+        if length <= 4:
+            value = raw[:length]
+        else:
+            start = struct.unpack(order + 'L', raw)[0]
+            if start + length > len(data):
+                continue
+            value = data[start:start + length]
+        if code == 's':
+            entries[tag] = value.split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+        else:
+            entries[tag] = struct.unpack(order + code * items, value)
+    return entries
+
+
+def _degrees(rationals, ref):
+    """Decimal degrees from (deg, min, sec) rationals and an N/S/E/W reference"""
+    if len(rationals) != 6:
+        return None
+    parts = []
+    for numerator, denominator in zip(rationals[::2], rationals[1::2]):
+        if denominator == 0:
+            return None
+        parts.append(numerator / denominator)
+    value = parts[0] + parts[1] / 60 + parts[2] / 3600
+    return -value if ref in ('S', 'W') else value
+
+
+def _timestamp(value, offset=None):
+    """EXIF 'YYYY:MM:DD HH:MM:SS' as a naive datetime, in UTC when the offset is known"""
+    if not isinstance(value, str):
+        return None
+    try:
+        taken_at = datetime.datetime.strptime(value[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+    if isinstance(offset, str) and offset:
+        try:
+            sign = -1 if offset.startswith('-') else 1
+            hours, minutes = offset.lstrip('+-').split(':')
+            taken_at -= sign * datetime.timedelta(hours=int(hours), minutes=int(minutes))
+        except ValueError:
+            pass
+    return taken_at
+
+
+def parse_exif(tiff):
+    """GeoTag from the TIFF structure of an EXIF segment; raises ValueError if it is malformed"""
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        raise ValueError('Not a TIFF header')
+    order = '<' if tiff[:2] == b'II' else '>'
+    magic, ifd0_offset = struct.unpack_from(order + 'HL', tiff, 2)
+    if magic != 42:
+        raise ValueError('Not a TIFF header')
+
+    ifd0 = _read_ifd(tiff, ifd0_offset, order)
+    geotag = GeoTag()
+
+    taken_at = None
+    if TAG_EXIF_IFD in ifd0:
+        exif = _read_ifd(tiff, ifd0[TAG_EXIF_IFD][0], order)
+        taken_at = _timestamp(exif.get(TAG_DATETIME_ORIGINAL), exif.get(TAG_OFFSET_TIME_ORIGINAL))
+    geotag.taken_at = taken_at or _timestamp(ifd0.get(TAG_DATETIME))
+
+    if TAG_GPS_IFD in ifd0:
+        gps = _read_ifd(tiff, ifd0[TAG_GPS_IFD][0], order)
+        latitude = _degrees(gps.get(TAG_GPS_LATITUDE, ()), gps.get(TAG_GPS_LATITUDE_REF))
+        longitude = _degrees(gps.get(TAG_GPS_LONGITUDE, ()), gps.get(TAG_GPS_LONGITUDE_REF))
+        # Cameras without a fix write zeros; out-of-range values are corrupt
+        if (latitude is not None and longitude is not None and (latitude, longitude) != (0.0, 0.0)
+                and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+            geotag.latitude = round(latitude, 7)
+            geotag.longitude = round(longitude, 7)
+    return geotag
+
+
+def read_geotag(stream):
+    """GeoTag for a JPEG file object, or None if it has no readable EXIF block"""
+    try:
+        tiff = find_exif_segment(stream)
+        return parse_exif(tiff) if tiff else None
+    except (ValueError, TypeError, IndexError, struct.error):
+        return None  # Tags of the wrong type or offsets pointing anywhere
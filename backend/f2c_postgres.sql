@@ -18,6 +18,10 @@ CREATE TABLE users (
     "underReview" BOOLEAN DEFAULT FALSE,
     "reviewReason" TEXT,
     "reviewDate" TIMESTAMP,
+    "largeOrderStreak" INT NOT NULL DEFAULT 0,
+    "unreadNotifications" INT NOT NULL DEFAULT 0,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
     "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -33,6 +37,42 @@ CREATE TABLE customer_notes (
   FOREIGN KEY ("customerId") REFERENCES users (id) ON DELETE CASCADE
 );
 
+-- Images table (content-addressed; bytes live in the blob store, keyed by SHA-256)
+CREATE TABLE images (
+    hash VARCHAR(64) PRIMARY KEY,
+    "contentType" VARCHAR(100) NOT NULL,
+    size INT NOT NULL,
+    width INT,
+    height INT,
+    "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Who uploaded each image, with the geotag read from their copy
+CREATE TABLE image_uploads (
+    "imageHash" VARCHAR(64) NOT NULL,
+    "userId" VARCHAR(255) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    "takenAt" TIMESTAMP,
+    "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY ("imageHash", "userId"),
+    FOREIGN KEY ("imageHash") REFERENCES images(hash),
+    FOREIGN KEY ("userId") REFERENCES users(id)
+);
+
+-- Smaller WebP renditions of each image, served from /api/images/<hash>/<variant>
+CREATE TABLE image_variants (
+    "imageHash" VARCHAR(64) NOT NULL,
+    variant VARCHAR(20) NOT NULL,
+    "blobHash" VARCHAR(64) NOT NULL,
+    "contentType" VARCHAR(100) NOT NULL,
+    size INT NOT NULL,
+    width INT NOT NULL,
+    height INT NOT NULL,
+    PRIMARY KEY ("imageHash", variant),
+    FOREIGN KEY ("imageHash") REFERENCES images(hash)
+);
+
 -- Products table
 CREATE TABLE products (
     id VARCHAR(255) PRIMARY KEY,
@@ -45,12 +85,21 @@ CREATE TABLE products (
     "cropName" VARCHAR(255) NOT NULL,
     "pricePerKg" DECIMAL(10,2) NOT NULL,
     "availableQuantity" INT NOT NULL,
-    image TEXT NOT NULL,
+    "imageHash" VARCHAR(64) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    geohash VARCHAR(12),
+    "photoTakenAt" TIMESTAMP,
     "seasonalMonths" VARCHAR(50) DEFAULT '1,2,3,4,5,6,7,8,9,10,11,12',
     "isSeasonal" BOOLEAN DEFAULT TRUE,
     "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     "publishDate" DATE DEFAULT CURRENT_DATE,
-    FOREIGN KEY ("farmerId") REFERENCES users(id) ON DELETE CASCADE
+    "priceStep" INT,
+    "currentPrice" DECIMAL(10,2),
+    "nextPriceChangeAt" TIMESTAMP,
+    "expiresAt" TIMESTAMP,
+    FOREIGN KEY ("farmerId") REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY ("imageHash") REFERENCES images(hash)
 );
 
 -- Orders table
@@ -64,6 +113,7 @@ CREATE TABLE orders (
     "deliveryType" delivery_type NOT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     status VARCHAR(50) DEFAULT 'placed',
+    "totalQuantity" INT,
     FOREIGN KEY ("userId") REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -75,9 +125,10 @@ CREATE TABLE order_items (
     quantity INT NOT NULL,
     "pricePerKg" DECIMAL(10,2) NOT NULL,
     "cropName" VARCHAR(255) NOT NULL,
-    image TEXT NOT NULL,
+    "imageHash" VARCHAR(64) NOT NULL,
     FOREIGN KEY ("orderId") REFERENCES orders(id) ON DELETE CASCADE,
-    FOREIGN KEY ("productId") REFERENCES products(id) ON DELETE CASCADE
+    FOREIGN KEY ("productId") REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY ("imageHash") REFERENCES images(hash)
 );
 
 -- Notifications table
@@ -87,9 +138,26 @@ CREATE TABLE notifications (
     message TEXT NOT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     read BOOLEAN DEFAULT FALSE,
+    kind VARCHAR(50),
+    "productId" VARCHAR(255),
+    "dedupeWindow" INT,
+    CONSTRAINT unique_notification_dedupe UNIQUE ("userId", kind, "productId", "dedupeWindow"),
     FOREIGN KEY ("userId") REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- Read notifications past the retention window, moved out by the archive job
+CREATE TABLE notifications_archive (
+    id VARCHAR(255) PRIMARY KEY,
+    "userId" VARCHAR(255) NOT NULL,
+    message TEXT NOT NULL,
+    timestamp TIMESTAMP,
+    read BOOLEAN DEFAULT TRUE,
+    kind VARCHAR(50),
+    "productId" VARCHAR(255),
+    "dedupeWindow" INT,
+    "archivedAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Cart table
 CREATE TABLE cart (
     id SERIAL PRIMARY KEY,
@@ -98,9 +166,10 @@ CREATE TABLE cart (
     quantity INT NOT NULL,
     "pricePerKg" DECIMAL(10,2) NOT NULL,
     "cropName" VARCHAR(255) NOT NULL,
-    image TEXT NOT NULL,
+    "imageHash" VARCHAR(64) NOT NULL,
     FOREIGN KEY ("userId") REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY ("productId") REFERENCES products(id) ON DELETE CASCADE
+    FOREIGN KEY ("productId") REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY ("imageHash") REFERENCES images(hash)
 );
 
 -- Search history table
@@ -129,6 +198,53 @@ CREATE TABLE purchase_history (
     FOREIGN KEY ("orderId") REFERENCES orders(id) ON DELETE CASCADE
 );
 
+-- Farmer-customer rollup for the Customer Contact Center
+-- (maintained on order placement/cancellation; POST /api/admin/farmer-customer-stats/rebuild recomputes it)
+CREATE TABLE farmer_customer_stats (
+    "farmerId" VARCHAR(255) NOT NULL,
+    "customerId" VARCHAR(255) NOT NULL,
+    "totalOrders" INT NOT NULL DEFAULT 0,
+    "totalSpent" DECIMAL(12,2) NOT NULL DEFAULT 0,
+    "totalQuantity" INT NOT NULL DEFAULT 0,
+    "lastOrderDate" TIMESTAMP,
+    "isRepeatCustomer" BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY ("farmerId", "customerId"),
+    FOREIGN KEY ("farmerId") REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY ("customerId") REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Scheduled job leases (one row per background job; see scheduler.py)
+CREATE TABLE job_leases (
+    name VARCHAR(100) PRIMARY KEY,
+    owner VARCHAR(255),
+    "leaseExpiresAt" TIMESTAMP,
+    "lastRunAt" TIMESTAMP,
+    "lastDurationMs" INT,
+    "lastStatus" VARCHAR(20),
+    "lastError" TEXT
+);
+
+-- First response per Idempotency-Key, replayed to client retries until it expires
+CREATE TABLE idempotency_keys (
+    "userId" VARCHAR(255) NOT NULL,
+    endpoint VARCHAR(100) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    "requestHash" VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'in_progress',
+    "responseStatus" INT,
+    "responseBody" TEXT,
+    "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    "expiresAt" TIMESTAMP NOT NULL,
+    PRIMARY KEY ("userId", endpoint, key)
+);
+
+-- Version counters behind the list endpoints' ETags ('catalog', 'cart:<userId>', ...)
+CREATE TABLE resource_versions (
+    resource VARCHAR(255) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    "updatedAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indexes
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_role ON users(role);
@@ -138,10 +254,19 @@ CREATE INDEX idx_products_farmerId ON products("farmerId");
 CREATE INDEX idx_products_cropCategory ON products("cropCategory");
 CREATE INDEX idx_products_cropName ON products("cropName");
 CREATE INDEX idx_products_publishDate ON products("publishDate");
+-- Expired-product sweep
+CREATE INDEX idx_products_expiresAt ON products("expiresAt") WHERE "availableQuantity" > 0;
+CREATE INDEX idx_products_nextPriceChangeAt ON products("nextPriceChangeAt") WHERE "availableQuantity" > 0;
+CREATE INDEX idx_products_low_stock ON products("availableQuantity") WHERE "availableQuantity" BETWEEN 1 AND 3;
+-- Keyset pagination for the catalog (GET /api/products)
+CREATE INDEX idx_products_available_createdAt_id ON products("createdAt" DESC, id DESC) WHERE "availableQuantity" > 0;
+-- Prefix scans for /api/products/nearby (geohash LIKE 'tdr1%')
+CREATE INDEX idx_products_geohash ON products(geohash varchar_pattern_ops) WHERE "availableQuantity" > 0;
 
 CREATE INDEX idx_orders_userId ON orders("userId");
 CREATE INDEX idx_orders_status ON orders(status);
 CREATE INDEX idx_orders_timestamp ON orders(timestamp);
+CREATE INDEX idx_orders_timestamp_id ON orders(timestamp DESC, id DESC);
 
 CREATE INDEX idx_order_items_orderId ON order_items("orderId");
 CREATE INDEX idx_order_items_productId ON order_items("productId");
@@ -149,12 +274,18 @@ CREATE INDEX idx_order_items_productId ON order_items("productId");
 CREATE INDEX idx_notifications_userId ON notifications("userId");
 CREATE INDEX idx_notifications_read ON notifications(read);
 CREATE INDEX idx_notifications_timestamp ON notifications(timestamp);
+-- Keyset pagination for a user's inbox (GET /api/notifications/<user_id>)
+CREATE INDEX idx_notifications_userId_timestamp_id ON notifications("userId", timestamp DESC, id DESC);
+CREATE INDEX idx_notifications_archive_userId ON notifications_archive("userId");
 
 CREATE INDEX idx_cart_userId ON cart("userId");
 CREATE INDEX idx_cart_productId ON cart("productId");
 
+CREATE INDEX idx_farmer_customer_stats_lastOrderDate ON farmer_customer_stats("farmerId", "lastOrderDate" DESC);
+
 CREATE INDEX idx_search_history_userId ON search_history("userId");
 CREATE INDEX idx_search_history_timestamp ON search_history(timestamp);
+CREATE INDEX idx_idempotency_keys_expiresAt ON idempotency_keys("expiresAt");
 
 -- Insert admin user (password: Admin@123 - hashed with bcrypt)
 INSERT INTO users (id, role, "fullName", email, phone, address, password, "createdAt") VALUES 
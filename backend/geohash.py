@@ -0,0 +1,125 @@
+"""
+Geohash cells and distance helpers for "near me" searches.
+
+A geohash interleaves longitude and latitude bits into a base-32 string;
+every extra character subdivides the cell, so all points inside a cell
+share its prefix and a btree index on the column answers "everything in
+this cell" as a range scan (geohash LIKE 'tdr1%').
+
+covering_prefixes() picks the longest prefix whose cells are at least as
+large as the search radius. The circle around a point then fits inside that
+point's cell and its eight neighbours, which is the candidate set;
+haversine_km() measures the exact distance of every candidate in one
+vectorized pass.
+"""
+
+import math
+
+import numpy as np
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # About 5m x 5m; what is stored on products
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON = 111.320  # At the equator
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash of a point"""
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError('Coordinates out of range')
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # Bits alternate, starting with longitude
+    while len(chars) < precision:
+        span, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a cell in degrees"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def decode(geohash):
+    """Centre of a cell as (latitude, longitude)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            span = lon_range if even else lat_range
+            middle = (span[0] + span[1]) / 2
+            if value >> shift & 1:
+                span[0] = middle
+            else:
+                span[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def neighbours(geohash):
+    """The cell and the (up to) eight cells around it, wrapping across the antimeridian"""
+    latitude, longitude = decode(geohash)
+    height, width = cell_size(len(geohash))
+    cells = []
+    for d_lat in (-height, 0, height):
+        lat = latitude + d_lat
+        if not -90 < lat < 90:
+            continue  # Nothing beyond the poles
+        for d_lon in (-width, 0, width):
+            lon = (longitude + d_lon + 180) % 360 - 180
+            cell = encode(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def covering_prefixes(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells together contain every point within radius_km; [] means no pruning"""
+    reach_lat = radius_km / KM_PER_DEGREE_LAT
+    if abs(latitude) + reach_lat >= 90:
+        return []  # The circle reaches a pole
+    # Cells are narrowest on the side of the circle nearest the pole
+    km_per_degree_lon = KM_PER_DEGREE_LON * math.cos(math.radians(abs(latitude) + reach_lat))
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height * KM_PER_DEGREE_LAT >= radius_km and width * km_per_degree_lon >= radius_km:
+            return neighbours(encode(latitude, longitude, precision))
+    return []  # Larger than the biggest cells
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points, in km"""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=float))
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(longitudes, dtype=float) - longitude)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_within(latitude, longitude, latitudes, longitudes, radius_km, limit=None):
+    """(indices, distances) of the points within radius_km, nearest first"""
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    within = np.flatnonzero(distances <= radius_km)
+    order = within[np.argsort(distances[within], kind='stable')][:limit]
+    return order.tolist(), distances[order].tolist()
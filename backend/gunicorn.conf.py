@@ -0,0 +1,26 @@
+"""
+Gunicorn settings; `gunicorn app:app` run from this directory picks them up.
+
+Server-Sent Events (/api/stream) keep a request open for up to
+STREAM_MAX_SECONDS, so with sync workers a handful of open dashboards would
+occupy every worker. gthread workers serve each request, open streams
+included, on a thread of their own. Streams don't hold a database
+connection, so threads can go well past DB_POOL_SIZE.
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '50'))  # Open streams plus regular requests, per worker
+# gthread heartbeats don't wait on request threads, so this only catches a hung worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # Background threads don't survive the fork from the master, so each worker starts its own
+    # once the app is loaded (see scheduler.py)
+    from app import start_background_jobs
+    start_background_jobs()
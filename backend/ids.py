@@ -0,0 +1,129 @@
+"""
+Time-ordered unique IDs for users, products, orders and notifications.
+
+IDs keep their readable prefixes ("order-", "prod-", ...) followed by 26
+Crockford base32 characters encoding 130 bits:
+
+    50 bits  milliseconds since the Unix epoch
+    30 bits  node: random per process, re-drawn in forked children
+    50 bits  sequence: per-process counter starting at a random offset
+
+The timestamp leads, so IDs sort by creation time and new rows land at the
+right edge of B-tree indexes instead of at random pages. Within a process
+IDs are strictly increasing even if the wall clock steps backwards (the
+timestamp is clamped to the last one issued), and the node plus sequence
+keep concurrent workers from colliding within the same millisecond.
+"""
+
+import os
+import secrets
+import threading
+import time
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ID_LENGTH = 26
+
+_TIME_BITS = 50
+_NODE_BITS = 30
+_SEQUENCE_BITS = 50
+_SEQUENCE_MASK = (1 << _SEQUENCE_BITS) - 1
+
+# Two base32 characters per 10-bit chunk
+_PAIRS = [ALPHABET[i >> 5] + ALPHABET[i & 31] for i in range(1024)]
+
+
+def _encode_50(value):
+    """Encode a 50-bit integer as 10 base32 characters"""
+    return (_PAIRS[(value >> 40) & 1023] + _PAIRS[(value >> 30) & 1023] + _PAIRS[(value >> 20) & 1023]
+            + _PAIRS[(value >> 10) & 1023] + _PAIRS[value & 1023])
+
+
+def _encode_30(value):
+    return _PAIRS[(value >> 20) & 1023] + _PAIRS[(value >> 10) & 1023] + _PAIRS[value & 1023]
+
+
+class IdGenerator:
+    """Per-process generator; use the module-level new_id()/new_ids()"""
+
+    def __init__(self):
+        self.reseed()
+
+    def reseed(self):
+        """Draw a fresh node and sequence offset (called again in forked children)"""
+        self._lock = threading.Lock()  # A lock held by another thread at fork time would never be released
+        self._node = _encode_30(secrets.randbits(_NODE_BITS))
+        self._sequence = secrets.randbits(_SEQUENCE_BITS - 1)  # Leave headroom before wrapping
+        self._last_ms = 0
+        self._time_prefix = ''
+        self._upper = None
+        self._upper_chars = ''
+
+    def _next(self, count):
+        """Reserve `count` sequence numbers; returns (time and node prefix, first eight sequence characters, first sequence)"""
+        now_ms = time.time_ns() // 1_000_000
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._time_prefix = _encode_50(now_ms) + self._node
+            start = self._sequence
+            self._sequence = (start + count) & _SEQUENCE_MASK
+            if self._sequence < start:
+                # Counter wrapped: move to the next millisecond so order is preserved
+                self._last_ms += 1
+                self._time_prefix = _encode_50(self._last_ms) + self._node
+                start, self._sequence = 0, count
+            upper = start >> 10
+            if upper != self._upper:
+                # Cache the first eight sequence characters; they change once per 1024 IDs
+                self._upper, self._upper_chars = upper, _encode_50(start)[:8]
+            return self._time_prefix, self._upper_chars, start
+
+    def new_id(self, prefix):
+        time_prefix, upper_chars, sequence = self._next(1)
+        return f"{prefix}-{time_prefix}{upper_chars}{_PAIRS[sequence & 1023]}"
+
+    def new_ids(self, prefix, count):
+        time_prefix, _, start = self._next(count)
+        head = f"{prefix}-{time_prefix}"
+        ids = []
+        append = ids.append
+        # Only the last two characters change within each run of 1024 sequence numbers
+        sequence = start
+        end = start + count
+        while sequence < end:
+            block_end = min(end, (sequence | 1023) + 1)
+            block_head = head + _encode_50(sequence)[:8]
+            for low in range(sequence & 1023, ((block_end - 1) & 1023) + 1):
+                append(block_head + _PAIRS[low])
+            sequence = block_end
+        return ids
+
+
+_generator = IdGenerator()
+if hasattr(os, 'register_at_fork'):
+    # Forked workers (e.g. gunicorn preload) must not share the parent's node and sequence
+    os.register_at_fork(after_in_child=_generator.reseed)
+
+
+def new_id(prefix):
+    """A new unique, time-ordered ID such as 'order-01JAB...'"""
+    return _generator.new_id(prefix)
+
+
+def new_ids(prefix, count):
+    """`count` unique, increasing IDs for a bulk insert"""
+    return _generator.new_ids(prefix, count)
+
+
+def id_timestamp(value):
+    """Creation time (epoch milliseconds) encoded in an ID from this module"""
+    encoded = value.rsplit('-', 1)[-1][:10]
+    if len(encoded) != 10:
+        raise ValueError('Not a generated ID')
+    ms = 0
+    for char in encoded:
+        index = ALPHABET.find(char)
+        if index < 0:
+            raise ValueError('Not a generated ID')
+        ms = (ms << 5) | index
+    return ms
@@ -0,0 +1,214 @@
+"""
+Server-side processing for uploaded product images.
+
+An upload is decoded once, checked (a real JPEG/PNG/WebP/GIF within the
+pixel limit), turned upright according to its EXIF orientation and then
+re-encoded as WebP at each size in VARIANT_SIZES, largest first, each one
+resized from the previous. Nothing from the original file's metadata
+(EXIF, GPS, ICC profiles, comments) is carried over.
+
+Uploads arrive either as bytes or as the path of the temp file the request
+body was streamed into; a path is opened by the worker itself, so large
+uploads are neither held in the web worker's memory nor pickled to the pool.
+
+Decoding and resizing are CPU-bound, so they run in a small process pool
+rather than on the request thread: the thread waits on a future without
+holding the GIL, and other requests on the same worker keep being served.
+Pool processes are started by a forkserver that has imported only this
+module, never forked from the web worker itself, whose scheduler, logging
+and event threads may hold locks at the moment of a fork.
+The pool is bounded; when max_pending uploads are already in flight,
+process() raises ImagePipelineUnavailable instead of queueing more.
+
+The same job reads the upload's GPS position and capture time (see
+exif_gps.py) from the original bytes, before re-encoding drops them.
+
+Pillow is optional. Without it `available` is False, process() returns no
+variants and callers store the upload unchanged, as before.
+"""
+
+import concurrent.futures
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from exif_gps import read_geotag
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # Images are stored as uploaded
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_CONTENT_TYPE = 'image/webp'
+ALLOWED_FORMATS = ('JPEG', 'MPO', 'PNG', 'WEBP', 'GIF')
+
+# Variant name -> longest side in pixels, largest first. 'full' replaces the
+# upload; the others are served from /api/images/<hash>/<variant>.
+VARIANT_SIZES = {
+    'full': 1600,
+    'card': 480,
+    'thumb': 160,
+}
+
+
+class ImagePipelineUnavailable(Exception):
+    """The upload could not be processed right now and can be retried"""
+
+
+def _open_source(source):
+    """Binary file object for upload bytes or a file path"""
+    return io.BytesIO(source) if isinstance(source, bytes) else open(source, 'rb')
+
+
+def render_variants(source, sizes, quality=80, max_pixels=40_000_000):
+    """Decode image bytes (or a file path) once and encode every size as WebP; runs in a worker process
+
+    Returns {variant: (bytes, width, height)}. Raises ValueError for anything
+    that is not an acceptable image.
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with _open_source(source) as stream, Image.open(stream) as original:
+            if original.format not in ALLOWED_FORMATS:
+                raise ValueError(f"Unsupported image format: {original.format}")
+            width, height = original.size
+            if width * height > max_pixels:
+                raise ValueError(f"Image is too large ({width}x{height})")
+            original.load()
+            image = ImageOps.exif_transpose(original)
+    except ValueError:
+        raise
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValueError('Image data is not a valid image')
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    for name, longest_side in sizes.items():
+        image = image.copy()
+        image.thumbnail((longest_side, longest_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', quality=quality, method=4)  # No exif=/icc_profile=, so no metadata
+        variants[name] = (buffer.getvalue(), image.width, image.height)
+    return variants
+
+
+def ingest(source, sizes, quality=80, max_pixels=40_000_000):
+    """(variants or None without Pillow, GeoTag or None) for upload bytes or a file path; runs in a worker process"""
+    with _open_source(source) as stream:
+        geotag = read_geotag(stream)
+    variants = render_variants(source, sizes, quality, max_pixels) if Image is not None else None
+    return variants, geotag
+
+
+class ImagePipeline:
+    """Runs ingest() in a bounded pool; see the module docstring"""
+
+    def __init__(self, max_workers=2, max_pending=8, timeout=30, quality=80, max_pixels=40_000_000,
+                 sizes=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self.sizes = dict(sizes or VARIANT_SIZES)
+        self.processed = 0
+        self.rejected = 0
+        self.unavailable = 0
+        self.total_ms = 0.0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _get_executor(self):
+        # A pool inherited from the parent is unusable in a forked web worker
+        if self._executor is not None and self._executor_pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    # The server is a fresh interpreter; preloading this module (instead of the
+                    # default __main__) keeps it from importing the app before forking workers
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload([__name__])
+                    self._executor = concurrent.futures.ProcessPoolExecutor(self.max_workers, mp_context=context)
+                else:
+                    # No forkserver on Windows; Pillow releases the GIL while it decodes and resizes
+                    self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers, 'images')
+                self._executor_pid = os.getpid()
+        return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def process(self, source):
+        """(variants, geotag) for upload bytes or a file path, as returned by ingest(); ValueError if it is not a usable image"""
+        if not self._slots.acquire(blocking=False):
+            self.unavailable += 1
+            raise ImagePipelineUnavailable('Too many images are being processed; try again shortly')
+        started = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(ingest, source, self.sizes, self.quality, self.max_pixels)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the work finishes, even if this request stops waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except ValueError:
+            self.rejected += 1
+            raise
+        except concurrent.futures.TimeoutError:
+            self.unavailable += 1
+            logger.warning("Image processing took longer than %ss", self.timeout)
+            raise ImagePipelineUnavailable('Image processing timed out; try again shortly')
+        except concurrent.futures.BrokenExecutor:
+            self.unavailable += 1
+            logger.exception("Image worker died; restarting the pool")
+            self._reset_executor(executor)
+            raise ImagePipelineUnavailable('Image processing failed; try again shortly')
+        self.processed += 1
+        self.total_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    def stats(self):
+        return {
+            'available': self.available,
+            'workers': self.max_workers,
+            'maxPending': self.max_pending,
+            'processed': self.processed,
+            'rejected': self.rejected,
+            'unavailable': self.unavailable,
+            'avgMs': round(self.total_ms / self.processed, 1) if self.processed else None
+        }
+
+
+def create_pipeline():
+    """Build the pipeline from IMAGE_* environment variables"""
+    workers = int(os.getenv('IMAGE_WORKERS', '2'))
+    pipeline = ImagePipeline(
+        max_workers=workers,
+        max_pending=int(os.getenv('IMAGE_MAX_PENDING', str(workers * 4))),
+        timeout=int(os.getenv('IMAGE_TIMEOUT_SECONDS', '30')),
+        quality=int(os.getenv('IMAGE_WEBP_QUALITY', '80')),
+        max_pixels=int(os.getenv('IMAGE_MAX_PIXELS', '40000000'))
+    )
+    if not pipeline.available:
+        logger.warning("Pillow is not installed; images are stored as uploaded, without resized variants")
+    return pipeline
@@ -8,6 +8,8 @@ import os
 import sys
 from dotenv import load_dotenv
 import pymysql
+from blob_store import create_blob_store, decode_data_url
+from geohash import encode as geohash_encode
 
 # Load environment variables
 load_dotenv()
@@ -43,6 +45,124 @@ def check_column_exists(cursor, table_name, column_name):
         print(f"Error checking column {column_name} in {table_name}: {e}")
         return False
 
+def add_column_if_missing(cursor, table_name, column_name, definition):
+    """Add a column to a table unless it is already there"""
+    if not check_column_exists(cursor, table_name, column_name):
+        print(f"Adding {column_name} column to {table_name} table...")
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN `{column_name}` {definition}")
+        print(f"✅ Added {column_name} column")
+    else:
+        print(f"✅ {column_name} column already exists")
+
+def migrate_inline_images(cursor, batch_size=100):
+    """Move base64 image data URLs into the blob store and reference them by hash"""
+    store = create_blob_store()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS images (
+            hash VARCHAR(64) PRIMARY KEY,
+            contentType VARCHAR(100) NOT NULL,
+            size INT NOT NULL,
+            createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    for table_name in ('products', 'cart', 'order_items'):
+        if not check_column_exists(cursor, table_name, 'imageHash'):
+            print(f"Adding imageHash column to {table_name} table...")
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN imageHash VARCHAR(64) NULL")
+            print("✅ Added imageHash column")
+
+        if not check_column_exists(cursor, table_name, 'image'):
+            print(f"✅ {table_name} has no inline images left to migrate")
+            continue
+
+        # Legacy column stays (nullable) until it is dropped by hand
+        cursor.execute(f"ALTER TABLE {table_name} MODIFY COLUMN image LONGTEXT NULL")
+
+        migrated = 0
+        while True:
+            cursor.execute(f"""
+                SELECT id, image FROM {table_name}
+                WHERE imageHash IS NULL AND image IS NOT NULL
+                LIMIT %s
+            """, (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            for row_id, data_url in rows:
+                try:
+                    data, content_type = decode_data_url(data_url)
+                except ValueError as e:
+                    print(f"ℹ️ Skipped {table_name} row {row_id}: {e}")
+                    cursor.execute(f"UPDATE {table_name} SET image = NULL WHERE id = %s", (row_id,))
+                    continue
+                image_hash = store.put(data)
+                cursor.execute(
+                    "INSERT IGNORE INTO images (hash, contentType, size) VALUES (%s, %s, %s)",
+                    (image_hash, content_type, len(data))
+                )
+                cursor.execute(
+                    f"UPDATE {table_name} SET imageHash = %s, image = NULL WHERE id = %s",
+                    (image_hash, row_id)
+                )
+                migrated += 1
+            cursor.connection.commit()
+
+        print(f"✅ Moved {migrated} images from {table_name} into the blob store")
+
+def backfill_large_order_streaks(cursor, large_order_kg=15):
+    """Fill orders.totalQuantity and users.largeOrderStreak from existing order lines"""
+    cursor.execute("""
+        UPDATE orders o
+        SET o.totalQuantity = (SELECT COALESCE(SUM(oi.quantity), 0) FROM order_items oi WHERE oi.orderId = o.id)
+        WHERE o.totalQuantity IS NULL
+    """)
+    print(f"✅ Backfilled totalQuantity for {cursor.rowcount} orders")
+
+    cursor.execute("""
+        SELECT userId, totalQuantity FROM orders
+        WHERE status = 'delivered'
+        ORDER BY userId, timestamp DESC
+    """)
+    streaks = {}
+    broken = set()
+    for user_id, quantity in cursor.fetchall():
+        if user_id in broken:
+            continue
+        if quantity >= large_order_kg:
+            streaks[user_id] = streaks.get(user_id, 0) + 1
+        else:
+            broken.add(user_id)
+    cursor.execute("UPDATE users SET largeOrderStreak = 0")
+    for user_id, streak in streaks.items():
+        cursor.execute("UPDATE users SET largeOrderStreak = %s WHERE id = %s", (streak, user_id))
+    print(f"✅ Backfilled large-order streaks for {len(streaks)} users")
+
+def backfill_unread_notification_counts(cursor):
+    """Fill users.unreadNotifications from the existing notifications"""
+    cursor.execute("""
+        UPDATE users u
+        SET u.unreadNotifications = (
+            SELECT COUNT(*) FROM notifications n
+            WHERE n.userId = u.id AND (n.`read` = FALSE OR n.`read` IS NULL)
+        )
+    """)
+    print(f"✅ Backfilled unread notification counts for {cursor.rowcount} users")
+
+def backfill_product_geohashes(cursor):
+    """Fill products.geohash from the stored photo coordinates"""
+    cursor.execute("""
+        SELECT id, latitude, longitude FROM products
+        WHERE geohash IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+    """)
+    rows = cursor.fetchall()
+    for product_id, latitude, longitude in rows:
+        cursor.execute("UPDATE products SET geohash = %s WHERE id = %s",
+                       (geohash_encode(latitude, longitude), product_id))
+    print(f"✅ Backfilled geohashes for {len(rows)} products")
+
 def add_missing_columns():
     """Add missing columns to database tables"""
     connection = get_db_connection()
@@ -119,34 +239,61 @@ def add_missing_columns():
         else:
             print("✅ reviewDate column already exists")
         
-        # Ensure large image columns can store base64 data URLs
+        # Precomputed price decay schedule (filled in by the expired-product sweep)
+        add_column_if_missing(cursor, 'products', 'priceStep', 'INT NULL')
+        add_column_if_missing(cursor, 'products', 'currentPrice', 'DECIMAL(10,2) NULL')
+        add_column_if_missing(cursor, 'products', 'nextPriceChangeAt', 'DATETIME NULL')
+        add_column_if_missing(cursor, 'products', 'expiresAt', 'DATETIME NULL')
+        
+        # Structured de-duplication key for system notifications
+        add_column_if_missing(cursor, 'notifications', 'kind', 'VARCHAR(50) NULL')
+        add_column_if_missing(cursor, 'notifications', 'productId', 'VARCHAR(255) NULL')
+        add_column_if_missing(cursor, 'notifications', 'dedupeWindow', 'INT NULL')
         try:
-            print("Checking and altering image columns to LONGTEXT if needed...")
             cursor.execute("""
-                ALTER TABLE products 
-                MODIFY COLUMN image LONGTEXT NOT NULL
+                ALTER TABLE notifications
+                ADD CONSTRAINT unique_notification_dedupe UNIQUE (userId, kind, productId, dedupeWindow)
             """)
-            print("✅ Updated products.image to LONGTEXT")
+            print("✅ Added notification de-duplication key")
         except Exception as e:
-            print(f"ℹ️ Skipped updating products.image: {e}")
+            print(f"ℹ️ Skipped notification de-duplication key: {e}")
+        
+        # Move inline base64 images into the blob store
+        migrate_inline_images(cursor)
+
+        # Dimensions recorded by the image pipeline; image_variants comes from db.create_all()
+        add_column_if_missing(cursor, 'images', 'width', 'INT NULL')
+        add_column_if_missing(cursor, 'images', 'height', 'INT NULL')
 
+        # Photo geotags read from EXIF at upload; image_uploads comes from db.create_all()
+        add_column_if_missing(cursor, 'products', 'latitude', 'DOUBLE NULL')
+        add_column_if_missing(cursor, 'products', 'longitude', 'DOUBLE NULL')
+        add_column_if_missing(cursor, 'products', 'photoTakenAt', 'DATETIME NULL')
+
+        # Geohash grid index for nearby search, and saved user locations
+        add_column_if_missing(cursor, 'products', 'geohash', 'VARCHAR(12) NULL')
+        add_column_if_missing(cursor, 'users', 'latitude', 'DOUBLE NULL')
+        add_column_if_missing(cursor, 'users', 'longitude', 'DOUBLE NULL')
+        backfill_product_geohashes(cursor)
         try:
-            cursor.execute("""
-                ALTER TABLE order_items 
-                MODIFY COLUMN image LONGTEXT NOT NULL
-            """)
-            print("✅ Updated order_items.image to LONGTEXT")
+            cursor.execute("CREATE INDEX idx_products_geohash ON products (geohash)")
+            print("✅ Added product geohash index")
         except Exception as e:
-            print(f"ℹ️ Skipped updating order_items.image: {e}")
+            print(f"ℹ️ Skipped product geohash index: {e}")
 
+        # Large-order review streak, maintained incrementally from now on
+        add_column_if_missing(cursor, 'orders', 'totalQuantity', 'INT NULL')
+        add_column_if_missing(cursor, 'users', 'largeOrderStreak', 'INT NOT NULL DEFAULT 0')
+        backfill_large_order_streaks(cursor)
+
+        # Unread counter and inbox pagination index; notifications_archive comes from db.create_all()
+        add_column_if_missing(cursor, 'users', 'unreadNotifications', 'INT NOT NULL DEFAULT 0')
+        backfill_unread_notification_counts(cursor)
         try:
-            cursor.execute("""
-                ALTER TABLE cart 
-                MODIFY COLUMN image LONGTEXT NOT NULL
-            """)
-            print("✅ Updated cart.image to LONGTEXT")
+            cursor.execute("CREATE INDEX idx_notifications_userId_timestamp_id ON notifications (userId, timestamp, id)")
+            print("✅ Added notification inbox index")
         except Exception as e:
-            print(f"ℹ️ Skipped updating cart.image: {e}")
+            print(f"ℹ️ Skipped notification inbox index: {e}")
 
         # Commit changes
         connection.commit()
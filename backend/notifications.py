@@ -0,0 +1,191 @@
+"""
+Notification fan-out service.
+
+Request handlers describe what happened with enqueue(user_id, kind, payload)
+and return; a background worker turns queued entries into notification rows
+and writes them in bulk. Entries of the same kind for the same user and order
+are coalesced into one message, so a farmer with five lines in an order gets
+one "order shipped" notification instead of five, and a status update costs
+the same whatever the number of order lines.
+
+Each kind is rendered from a list of payloads (one per coalesced entry) by
+the functions registered in KINDS.
+"""
+
+import datetime
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _crop_list(payloads):
+    return ', '.join(p['cropName'] for p in payloads)
+
+
+def _render_order_placed(payloads):
+    if len(payloads) == 1:
+        return f"Your {payloads[0]['cropName']} has been ordered. Quantity: {payloads[0]['quantity']}kg"
+    lines = ', '.join(f"{p['cropName']} ({p['quantity']}kg)" for p in payloads)
+    return f"Your {lines} have been ordered."
+
+
+def _render_order_processing(payloads):
+    lines = ', '.join(f"{p['quantity']}kg of {p['cropName']}" for p in payloads)
+    return f"⚙️ NEW ORDER! Please prepare {lines} for delivery"
+
+
+def _render_order_shipped(payloads):
+    verb = 'is' if len(payloads) == 1 else 'are'
+    return f"🚚 ORDER SHIPPED! Your {_crop_list(payloads)} {verb} on the way to the customer"
+
+
+def _render_order_delivered(payloads):
+    first = payloads[0]
+    if len(payloads) == 1:
+        return (f"🎉 DELIVERY SUCCESS! Your {first['cropName']} has been delivered to {first['consumerName']}. "
+                f"Quantity: {first['quantity']}kg, Amount: ₹{first['amount']:.2f}")
+    lines = '; '.join(f"{p['cropName']}: {p['quantity']}kg, ₹{p['amount']:.2f}" for p in payloads)
+    total = sum(p['amount'] for p in payloads)
+    return (f"🎉 DELIVERY SUCCESS! Order #{first['orderId'][-8:]} has been delivered to {first['consumerName']}. "
+            f"{lines}. Total: ₹{total:.2f}")
+
+
+def _render_product_sold_out(payloads):
+    return f"📦 Your {payloads[0]['cropName']} has been sold out! All available quantity has been ordered by customers."
+
+
+def _render_order_item_expired(payloads):
+    return f"⚠️ {payloads[0]['cropName']} was removed from your order because the price expired. It has been removed from the marketplace."
+
+
+# kind -> (payload field entries are coalesced on, or None; renderer)
+KINDS = {
+    'order_placed': ('orderId', _render_order_placed),
+    'order_processing': ('orderId', _render_order_processing),
+    'order_shipped': ('orderId', _render_order_shipped),
+    'order_delivered': ('orderId', _render_order_delivered),
+    'product_sold_out': (None, _render_product_sold_out),
+    'order_item_expired': (None, _render_order_item_expired),
+}
+
+
+def build_rows(entries):
+    """Coalesce (user_id, kind, payload, queued_at) entries into notification rows, keeping first-seen order"""
+    groups = {}
+    for index, (user_id, kind, payload, queued_at) in enumerate(entries):
+        coalesce_on = KINDS[kind][0]
+        key = (user_id, kind, payload.get(coalesce_on)) if coalesce_on else (user_id, kind, index)
+        groups.setdefault(key, (queued_at, []))[1].append(payload)
+    rows = []
+    for (user_id, kind, _), (queued_at, payloads) in groups.items():
+        rows.append({
+            'userId': user_id,
+            'kind': kind,
+            'productId': payloads[0].get('productId'),
+            'message': KINDS[kind][1](payloads),
+            'timestamp': queued_at  # When it happened, not when the batch was written
+        })
+    return rows
+
+
+class NotificationService:
+    """Queues notification requests and writes them from a background worker
+
+    write_rows(rows) persists a list of {'userId', 'kind', 'productId',
+    'message', 'timestamp'} dicts and runs inside `context()` (e.g. an app
+    context). The worker starts on first use, so each forked web worker gets
+    its own.
+    """
+
+    def __init__(self, write_rows, context=None, flush_interval=0.1, max_batch=500, max_attempts=3):
+        self.write_rows = write_rows
+        self.context = context
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._unfinished = 0
+        self._idle = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, user_id, kind, payload):
+        self.enqueue_many([(user_id, kind, payload)])
+
+    def enqueue_many(self, entries):
+        """Queue entries together so they are coalesced within one batch"""
+        queued_at = datetime.datetime.utcnow()
+        entries = [(user_id, kind, payload, queued_at) for user_id, kind, payload in entries]
+        if not entries:
+            return
+        for _, kind, _, _ in entries:
+            if kind not in KINDS:
+                raise ValueError(f"Unknown notification kind: {kind}")
+        with self._idle:
+            self._unfinished += 1
+        self._queue.put(entries)
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='notifications', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            groups = [self._queue.get()]
+            entries = list(groups[0])
+            deadline = time.monotonic() + self.flush_interval
+            while len(entries) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    group = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                groups.append(group)
+                entries.extend(group)
+            self._write(entries)
+            with self._idle:
+                self._unfinished -= len(groups)
+                self._idle.notify_all()
+
+    def _write(self, entries):
+        rows = build_rows(entries)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if self.context:
+                    with self.context():
+                        self.write_rows(rows)
+                else:
+                    self.write_rows(rows)
+                self.written += len(rows)
+                self.batches += 1
+                return
+            except Exception:
+                logger.exception("Writing %d notifications failed (attempt %d)", len(rows), attempt)
+                time.sleep(0.5 * attempt)
+        self.failed += len(rows)
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'failed': self.failed
+        }
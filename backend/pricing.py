@@ -0,0 +1,61 @@
+"""
+Listing price decay schedule.
+
+Consumers pay the farmer's price plus a 2% commission, and that price drops
+20% every 20 hours after a listing is created until it rounds to zero, at
+which point the listing expires. The whole schedule is a pure function of
+(pricePerKg, createdAt), so it is computed once, stored on the product and
+only recomputed when a price boundary is crossed.
+"""
+
+import datetime
+
+COMMISSION_MULTIPLIER = 1.02
+DECAY_MULTIPLIER = 0.8  # 20% off per interval
+DECAY_INTERVAL_HOURS = 20
+DECAY_INTERVAL = datetime.timedelta(hours=DECAY_INTERVAL_HOURS)
+
+
+def base_price(price_per_kg):
+    """Farmer price plus commission, before any decay"""
+    return float(price_per_kg) * COMMISSION_MULTIPLIER
+
+
+def price_at_step(price_per_kg, step):
+    """Consumer price after `step` decay intervals"""
+    return max(0, round(base_price(price_per_kg) * (DECAY_MULTIPLIER ** step), 2))
+
+
+def step_at(created_at, now):
+    """Number of whole decay intervals elapsed since a listing was created"""
+    hours_since = (now - created_at).total_seconds() / 3600
+    return max(0, int(hours_since / DECAY_INTERVAL_HOURS))
+
+
+def steps_until_zero(price_per_kg):
+    """First step at which the consumer price rounds to zero"""
+    step = 0
+    while price_at_step(price_per_kg, step) > 0:
+        step += 1
+    return step
+
+
+def tier_boundaries(created_at, price_per_kg):
+    """Every (starts_at, price) tier of a listing, ending with the zero-price tier"""
+    return [
+        (created_at + DECAY_INTERVAL * step, price_at_step(price_per_kg, step))
+        for step in range(steps_until_zero(price_per_kg) + 1)
+    ]
+
+
+def build_schedule(price_per_kg, created_at, now=None):
+    """Decay metadata stored on Product, valid until nextPriceChangeAt"""
+    now = now or datetime.datetime.utcnow()
+    zero_step = steps_until_zero(price_per_kg)
+    step = min(step_at(created_at, now), zero_step)
+    return {
+        'priceStep': step,
+        'currentPrice': price_at_step(price_per_kg, step),
+        'nextPriceChangeAt': created_at + DECAY_INTERVAL * (step + 1) if step < zero_step else None,
+        'expiresAt': created_at + DECAY_INTERVAL * zero_step
+    }
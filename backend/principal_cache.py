@@ -0,0 +1,85 @@
+"""
+Per-process cache of authenticated principals.
+
+token_required used to load the full User row on every authenticated request,
+including the cart and order polling the dashboards do every few seconds. A
+verified token now resolves to a small Principal (id, role, name, blocked)
+that is cached for a short TTL under (user_id, iat), so a user's requests
+within the TTL skip the users lookup entirely. The cache is bounded with LRU
+eviction, and a user's entries are dropped whenever their account changes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class Principal:
+    """The parts of a User that request handlers need, detached from any session"""
+
+    __slots__ = ('id', 'role', 'name', 'blocked')
+
+    def __init__(self, id, role, name=None, blocked=False):
+        self.id = id
+        self.role = role
+        self.name = name
+        self.blocked = bool(blocked)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.role, user.name, user.blocked)
+
+
+class PrincipalCache:
+    """TTL + LRU cache of principals keyed by (user_id, iat)"""
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, issued_at):
+        key = (user_id, issued_at)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, issued_at, principal):
+        key = (user_id, issued_at)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user (e.g. after they are blocked)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,151 @@
+"""
+Per-request SQL statement counting and slow-query reporting.
+
+Hooks the engine's before/after_cursor_execute events. Inside a request
+(between start() and finish()) every statement adds to the request's count
+and database time, and the slowest few are remembered. finish() logs the
+request when it ran more statements or spent more database time than the
+thresholds allow, which is how N+1 loops show up.
+
+Outside the thresholds a request costs two perf_counter() calls and a small
+heap update per statement. A sample of requests (sample_rate) additionally
+records the fingerprint of every statement (literals replaced by ?), which
+are aggregated per process for /api/admin/metrics and logged per request.
+"""
+
+import contextvars
+import heapq
+import logging
+import random
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """Statement text with literals and bind parameters collapsed, so repeats of one query group together"""
+    statement = _STRING.sub('?', statement)
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _IN_LIST.sub('(?+)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+class _RequestStats:
+    __slots__ = ('count', 'total_ms', 'slowest', 'fingerprints', 'started')
+
+    def __init__(self, sampled):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = []  # Min-heap of (ms, sequence, statement)
+        self.fingerprints = {} if sampled else None
+        self.started = None
+
+
+class QueryProfiler:
+    """Counts statements per request and reports requests over the thresholds"""
+
+    def __init__(self, max_queries=25, slow_request_ms=500, sample_rate=0.0, top_n=3,
+                 max_fingerprints=500, statement_chars=500):
+        self.max_queries = max_queries
+        self.slow_request_ms = slow_request_ms
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self.max_fingerprints = max_fingerprints
+        self.statement_chars = statement_chars
+        self.requests = 0
+        self.flagged = 0
+        self.sampled = 0
+        self._current = contextvars.ContextVar('query_profiler_request', default=None)
+        self._fingerprints = {}  # fingerprint -> [count, total ms]
+        self._lock = threading.Lock()
+
+    def install(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def start(self):
+        """Begin counting statements for the current request"""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        self._current.set(_RequestStats(sampled))
+
+    def finish(self, endpoint):
+        """Stop counting; returns (statement count, database ms) or None if start() wasn't called"""
+        stats = self._current.get()
+        if stats is None:
+            return None
+        self._current.set(None)
+        self.requests += 1
+        if stats.count > self.max_queries or stats.total_ms > self.slow_request_ms:
+            self.flagged += 1
+            slowest = sorted(stats.slowest, reverse=True)
+            logger.warning(
+                "%s ran %d statements in %.1fms; slowest: %s", endpoint, stats.count, stats.total_ms,
+                '; '.join(f"{ms:.1f}ms {_SPACE.sub(' ', statement)[:self.statement_chars]}" for ms, _, statement in slowest)
+            )
+        if stats.fingerprints is not None:
+            self.sampled += 1
+            self._aggregate(stats.fingerprints)
+            logger.info("%s statement profile: %s", endpoint, [
+                {'fingerprint': text[:self.statement_chars], 'count': count, 'ms': round(ms, 1)}
+                for text, (count, ms) in sorted(stats.fingerprints.items(), key=lambda item: -item[1][1])
+            ])
+        return stats.count, stats.total_ms
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current.get()
+        if stats is not None:
+            stats.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current.get()
+        if stats is None or stats.started is None:
+            return
+        elapsed_ms = (time.perf_counter() - stats.started) * 1000
+        stats.started = None
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+        entry = (elapsed_ms, stats.count, statement)
+        if len(stats.slowest) < self.top_n:
+            heapq.heappush(stats.slowest, entry)
+        elif elapsed_ms > stats.slowest[0][0]:
+            heapq.heapreplace(stats.slowest, entry)
+        if stats.fingerprints is not None:
+            totals = stats.fingerprints.setdefault(fingerprint(statement), [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed_ms
+
+    def _aggregate(self, fingerprints):
+        with self._lock:
+            for text, (count, ms) in fingerprints.items():
+                totals = self._fingerprints.get(text)
+                if totals is None:
+                    if len(self._fingerprints) >= self.max_fingerprints:
+                        continue
+                    totals = self._fingerprints[text] = [0, 0.0]
+                totals[0] += count
+                totals[1] += ms
+
+    def stats(self, top=20):
+        with self._lock:
+            heaviest = sorted(self._fingerprints.items(), key=lambda item: -item[1][1])[:top]
+        return {
+            'requests': self.requests,
+            'flagged': self.flagged,
+            'sampled': self.sampled,
+            'sampleRate': self.sample_rate,
+            'topFingerprints': [
+                {'fingerprint': text[:self.statement_chars], 'count': count, 'totalMs': round(ms, 1)}
+                for text, (count, ms) in heaviest
+            ]
+        }
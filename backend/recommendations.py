@@ -0,0 +1,127 @@
+"""
+Batch-scored product recommendations.
+
+The user's purchase history is loaded once as per-crop aggregates and every
+candidate product is scored in a single NumPy pass. The score for a product
+is the product of:
+
+- a 2x boost if any recent search term appears in its crop name or category
+- a purchase preference score: min(min(quantity / 10, 2) * (1 + 0.2 * recent
+  purchases), 3) for crops the user has bought before, 1 otherwise
+- a seasonal boost: 1.0 for non-seasonal products, 1.5 in season, 0.3 out of
+  season
+- a recency boost: max(0.8, 1 - days_old / 365)
+- an availability boost: min(1.2, 1 + quantity / 100)
+
+Each user's top-K is cached until their purchases or searches change, the
+catalog changes, or the entry's TTL expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SEARCH_MATCH_BOOST = 2.0
+IN_SEASON_BOOST = 1.5
+OUT_OF_SEASON_BOOST = 0.3
+RECENT_PURCHASE_DAYS = 90
+
+
+def purchase_preference_scores(crop_names, profile):
+    """Vectorized purchase preference score; profile maps cropName -> (total_quantity, recent_purchases)"""
+    totals = np.array([profile.get(name, (0, 0))[0] for name in crop_names], dtype=float)
+    recent = np.array([profile.get(name, (0, 0))[1] for name in crop_names], dtype=float)
+    purchased = np.array([name in profile for name in crop_names], dtype=bool)
+
+    quantity_score = np.minimum(totals / 10, 2.0)  # Cap at 2x boost
+    recency_score = 1.0 + recent * 0.2  # 20% boost per recent purchase
+    return np.where(purchased, np.minimum(quantity_score * recency_score, 3.0), 1.0)
+
+
+def seasonal_boosts(is_seasonal, in_season):
+    """Vectorized seasonal boost: neutral for non-seasonal products"""
+    return np.where(is_seasonal, np.where(in_season, IN_SEASON_BOOST, OUT_OF_SEASON_BOOST), 1.0)
+
+
+def search_matches(crop_names, crop_categories, terms):
+    """True where any search term is a substring of the crop name or category"""
+    if not terms:
+        return np.zeros(len(crop_names), dtype=bool)
+    return np.array([
+        any(term in (crop or '').lower() or term in (category or '').lower() for term in terms)
+        for crop, category in zip(crop_names, crop_categories)
+    ], dtype=bool)
+
+
+def score_candidates(candidates, terms, profile, now):
+    """Score candidate rows (cropName, cropCategory, isSeasonal, inSeason, createdAt, availableQuantity)"""
+    if not candidates:
+        return np.zeros(0)
+
+    crop_names = [c.cropName for c in candidates]
+    matches = search_matches(crop_names, [c.cropCategory for c in candidates], terms)
+    is_seasonal = np.array([bool(c.isSeasonal) for c in candidates], dtype=bool)
+    in_season = np.array([c.inSeason for c in candidates], dtype=bool)
+    days_old = np.array([(now - c.createdAt).days for c in candidates], dtype=float)
+    quantities = np.array([c.availableQuantity for c in candidates], dtype=float)
+
+    scores = np.where(matches, SEARCH_MATCH_BOOST, 1.0)
+    scores = scores * purchase_preference_scores(crop_names, profile)
+    scores = scores * seasonal_boosts(is_seasonal, in_season)
+    scores = scores * np.maximum(0.8, 1.0 - (days_old / 365.0))  # Decay over a year
+    scores = scores * np.minimum(1.2, 1.0 + (quantities / 100.0))
+    return scores
+
+
+def top_k(scores, k):
+    """Indices of the k best scores; ties keep candidate order"""
+    return np.argsort(-scores, kind='stable')[:k]
+
+
+class RecommendationCache:
+    """Per-process LRU of each user's top-K, keyed to the catalog version it was built from"""
+
+    def __init__(self, ttl=300, max_users=10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.catalog_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, month):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if (entry is None or entry[0] != self.catalog_version or entry[1] != month
+                    or entry[2] < time.monotonic()):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[3]
+
+    def set(self, user_id, month, recommendations, catalog_version):
+        with self._lock:
+            if catalog_version != self.catalog_version:
+                return  # Catalog changed while these were being computed
+            self._entries[user_id] = (catalog_version, month, time.monotonic() + self.ttl, recommendations)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def invalidate_catalog(self):
+        with self._lock:
+            self.catalog_version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'catalogVersion': self.catalog_version}
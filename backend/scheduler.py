@@ -0,0 +1,147 @@
+"""
+Background job scheduler.
+
+Jobs run on a daemon thread at a fixed cadence, outside the request path.
+Threads don't survive a fork, so the scheduler is started in each serving
+process (gunicorn worker) rather than at import. Every worker runs its own
+scheduler, so each job run is guarded by a lease: a worker only runs a job after taking its
+lease, and the lease is held for one interval. Whichever worker wins runs
+the job; the others keep polling and take over if that worker goes away.
+"""
+
+import contextlib
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A named callable run every `interval` seconds"""
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_run = 0.0
+        self.last_run_at = None
+        self.last_duration = None
+        self.last_error = None
+        self.run_count = 0
+
+    def to_dict(self):
+        return {
+            'interval': self.interval,
+            'lastRunAt': self.last_run_at.isoformat() if self.last_run_at else None,
+            'lastDurationMs': round(self.last_duration * 1000) if self.last_duration is not None else None,
+            'lastError': self.last_error,
+            'runCount': self.run_count
+        }
+
+
+class Scheduler:
+    """Runs registered jobs on a background thread
+
+    acquire_lease(job_name, owner, ttl_seconds) -> bool decides whether this
+    process may run a job now; record_run(job_name, started_at, duration,
+    error) persists the outcome. Both are optional, and both run inside
+    `context()` (e.g. an app context) together with the job itself.
+    """
+
+    def __init__(self, acquire_lease=None, record_run=None, context=None, poll_interval=30):
+        self.acquire_lease = acquire_lease
+        self.record_run = record_run
+        self.context = context
+        self.poll_interval = poll_interval
+        self.owner = self._new_owner()
+        self.jobs = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @staticmethod
+    def _new_owner():
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def add_job(self, name, func, interval):
+        self.jobs[name] = Job(name, func, interval)
+        return self.jobs[name]
+
+    def start(self):
+        """Start the loop in this process; a no-op while it runs, so it can be called on every request"""
+        if self.running:
+            return
+        with self._start_lock:
+            if self.running:
+                return
+            # A forked worker must not share its parent's lease owner
+            self.owner = self._new_owner()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _loop(self):
+        while not self._stop.is_set():
+            for job in list(self.jobs.values()):
+                if self._stop.is_set():
+                    break
+                if time.monotonic() >= job.next_run:
+                    self.run_job(job.name)
+            self._stop.wait(min([self.poll_interval] + [job.interval for job in self.jobs.values()]))
+
+    def run_job(self, name):
+        """Run a job now if this process can take its lease; returns True if it ran"""
+        job = self.jobs[name]
+        try:
+            with self.context() if self.context else contextlib.nullcontext():
+                if self.acquire_lease and not self.acquire_lease(job.name, self.owner, job.interval):
+                    job.next_run = time.monotonic() + self.poll_interval
+                    return False
+
+                started_at = datetime.datetime.utcnow()
+                started = time.perf_counter()
+                error = None
+                try:
+                    job.func()
+                except Exception as e:
+                    error = e
+                    logger.exception("Scheduled job %s failed", job.name)
+                duration = time.perf_counter() - started
+
+                job.next_run = time.monotonic() + job.interval
+                job.last_run_at = started_at
+                job.last_duration = duration
+                job.last_error = str(error) if error else None
+                job.run_count += 1
+                logger.info("Scheduled job %s finished in %.1fms", job.name, duration * 1000)
+
+                if self.record_run:
+                    self.record_run(job.name, started_at, duration, error)
+                return True
+        except Exception:
+            # Lease bookkeeping failed (e.g. database unavailable); try again next poll
+            logger.exception("Scheduler could not run job %s", job.name)
+            job.next_run = time.monotonic() + self.poll_interval
+            return False
+
+    def status(self):
+        return {
+            'running': self.running,
+            'owner': self.owner,
+            'jobs': {name: job.to_dict() for name, job in self.jobs.items()}
+        }
+
@@ -0,0 +1,245 @@
+"""
+Structured, asynchronous logging.
+
+Records are written as one JSON object per line. Request threads only
+enqueue them: a bounded queue feeds a listener thread that formats and
+writes, so slow stdout (or a full pipe on the host) never adds latency to a
+request. When the queue is full, records are dropped and counted instead of
+blocking.
+
+Levels can be raised or lowered per Flask endpoint at runtime
+(LogControl.set_route_level, or LOG_ROUTE_LEVELS="place_order=DEBUG,..." at
+startup). Overrides apply to the process that receives them; with several
+workers, set them through the environment or repeat the call.
+
+Request bodies are only logged through log_request_body(), which is off
+unless the route logs at DEBUG, is sampled, and redacts passwords, tokens
+and images and truncates long values before anything is enqueued.
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+REDACTED_KEYS = ('password', 'token', 'authorization', 'secret')
+IMAGE_KEYS = ('image',)
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+def _levelno(level):
+    levelno = logging.getLevelName(str(level).upper())
+    if not isinstance(levelno, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return levelno
+
+
+def redact(value, max_chars=200):
+    """Copy of a decoded JSON value that is safe and small enough to log"""
+    if isinstance(value, dict):
+        cleaned = {}
+        for key, item in value.items():
+            lowered = str(key).lower()
+            if any(name in lowered for name in REDACTED_KEYS):
+                cleaned[key] = '[redacted]'
+            elif lowered in IMAGE_KEYS and isinstance(item, str):
+                cleaned[key] = f"[image, {len(item)} chars]"
+            else:
+                cleaned[key] = redact(item, max_chars)
+        return cleaned
+    if isinstance(value, list):
+        items = [redact(item, max_chars) for item in value[:20]]
+        if len(value) > 20:
+            items.append(f"[{len(value) - 20} more]")
+        return items
+    if isinstance(value, str):
+        if value.startswith('data:'):
+            return f"[data URL, {len(value)} chars]"
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}...[{len(value)} chars]"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed with extra= are included"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message and traceback now (arguments may change after the call returns),
+        # but keep the traceback out of the message so it lands in its own field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RouteLevelFilter(logging.Filter):
+    """Applies the default level, or the current endpoint's override"""
+
+    def __init__(self, control):
+        super().__init__()
+        self.control = control
+
+    def filter(self, record):
+        if record.levelno < self.control.level_for_current_route():
+            return False
+        route = self.control.current_route()
+        if route and not hasattr(record, 'route'):
+            record.route = route
+        return True
+
+
+class LogControl:
+    """The configured logging pipeline: levels, sampling and queue statistics"""
+
+    def __init__(self, level='INFO', queue_size=10000, route=None, body_sample_rate=1.0,
+                 field_max_chars=200, stream=None):
+        self.level = _levelno(level)
+        self.route_levels = {}
+        self.route = route or (lambda: None)
+        self.body_sample_rate = body_sample_rate
+        self.field_max_chars = field_max_chars
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._output = logging.StreamHandler(stream)
+        self._output.setFormatter(JsonFormatter())
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(RouteLevelFilter(self))
+        self._listener = None
+        self._start_listener()
+        if hasattr(os, 'register_at_fork'):
+            # Forked workers don't inherit the listener thread
+            os.register_at_fork(after_in_child=self._restart_in_child)
+        atexit.register(self.stop)
+
+    def _start_listener(self):
+        self._listener = logging.handlers.QueueListener(self.handler.queue, self._output, respect_handler_level=True)
+        self._listener.start()
+
+    def _restart_in_child(self):
+        self._lock = threading.Lock()
+        self.handler.queue = queue.Queue(self.queue_size)
+        self._start_listener()
+
+    def stop(self):
+        """Flush queued records (called at exit)"""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+    def current_route(self):
+        try:
+            return self.route()
+        except Exception:
+            return None
+
+    def level_for_current_route(self):
+        if self.route_levels:
+            route = self.current_route()
+            if route in self.route_levels:
+                return self.route_levels[route]
+        return self.level
+
+    def enabled_for(self, level):
+        """Whether a record at this level would be written for the current route"""
+        return level >= self.level_for_current_route()
+
+    def set_route_level(self, route, level):
+        """Override the level for one endpoint; None removes the override"""
+        with self._lock:
+            if level is None:
+                self.route_levels.pop(route, None)
+            else:
+                self.route_levels[route] = _levelno(level)
+            self._apply_root_level()
+
+    def set_default_level(self, level):
+        with self._lock:
+            self.level = _levelno(level)
+            self._apply_root_level()
+
+    def _apply_root_level(self):
+        # Records below the root level are never created, so lower it to the most verbose override
+        logging.getLogger().setLevel(min([self.level, *self.route_levels.values()]))
+
+    def log_request_body(self, logger, body, content_type=None, message='Request body'):
+        """Log a decoded request body at DEBUG, redacted and truncated, for sampled requests"""
+        if not self.enabled_for(logging.DEBUG) or random.random() >= self.body_sample_rate:
+            return
+        if isinstance(body, (dict, list)):
+            payload = redact(body, self.field_max_chars)
+        else:
+            payload = f"[{content_type or 'unknown'} body, {len(body or b'')} bytes]"
+        logger.debug(message, extra={'body': payload})
+
+    def stats(self):
+        return {
+            'level': logging.getLevelName(self.level),
+            'routeLevels': {route: logging.getLevelName(level) for route, level in self.route_levels.items()},
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'bodySampleRate': self.body_sample_rate
+        }
+
+
+def configure_logging(route=None):
+    """Send every logger through the JSON queue pipeline, configured from LOG_* environment variables"""
+    control = LogControl(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+        route=route,
+        body_sample_rate=float(os.getenv('LOG_BODY_SAMPLE_RATE', '0.1')),
+        field_max_chars=int(os.getenv('LOG_FIELD_MAX_CHARS', '200'))
+    )
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(control.handler)
+    # Library chatter stays at WARNING even when a route is turned up to DEBUG
+    for name in ('sqlalchemy', 'urllib3', 'PIL'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    for assignment in filter(None, os.getenv('LOG_ROUTE_LEVELS', '').split(',')):
+        route_name, _, level = assignment.partition('=')
+        control.set_route_level(route_name.strip(), level.strip())
+    control._apply_root_level()
+    return control
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Search, Filter, ShoppingCart, MessageCircle, MapPin, Truck, Clock, User, CreditCard as Edit, Save, X, History, Bell, Star } from 'lucide-react';
-import { getProducts, addToCart, getCart, getRecommendations, updateSearchHistory, getUserOrders, updateUserProfile, getOrderStatus } from '../utils/database';
+import { getProducts, addToCart, getCart, getRecommendations, updateSearchHistory, getUserOrders, updateUserProfile, getOrderStatus, subscribeToUpdates } from '../utils/database';
 import Cart from './Cart';
 import Chatbot from './Chatbot';
 import notify from '../utils/notify';
@@ -93,7 +93,41 @@ const ConsumerDashboard: React.FC<ConsumerDashboardProps> = ({ user }) => {
     };
     
     loadData();
-    const interval = setInterval(async () => {
+
+    const announceStatusChange = (orderId: string, newStatus: string) => {
+      let notificationMessage = '';
+      let notificationType = 'info';
+      switch (newStatus) {
+        case 'processing':
+          notificationMessage = `⚙️ Your order #${orderId.slice(-8)} is being prepared by the farmer`;
+          notificationType = 'processing';
+          break;
+        case 'shipped':
+          notificationMessage = `🚚 Your order #${orderId.slice(-8)} is on the way!`;
+          notificationType = 'shipped';
+          break;
+        case 'delivered':
+          notificationMessage = `🎉 Your order #${orderId.slice(-8)} has been delivered!`;
+          notificationType = 'delivered';
+          break;
+        default:
+          notificationMessage = `📦 Order #${orderId.slice(-8)} status updated to ${newStatus}`;
+          notificationType = 'info';
+      }
+      showNotification(notificationMessage);
+
+      // Add to order notifications
+      setOrderNotifications(prev => [...prev, {
+        id: `${orderId}-${newStatus}-${Date.now()}`,
+        orderId,
+        message: notificationMessage,
+        type: notificationType,
+        timestamp: new Date()
+      }]);
+    };
+
+    // Full refresh of order statuses; runs on (re)connect and as a slow fallback
+    const refreshOrders = async () => {
       try {
         const currentOrders = await getUserOrders(user.id);
         const statusUpdates: { [key: string]: string } = {};
@@ -109,41 +143,27 @@ const ConsumerDashboard: React.FC<ConsumerDashboardProps> = ({ user }) => {
           Object.entries(statusUpdates).forEach(([orderId, newStatus]) => {
             const order = currentOrders.find(o => o.id === orderId);
             if (order && order.status !== newStatus) {
-              let notificationMessage = '';
-              let notificationType = 'info';
-              switch (newStatus) {
-                case 'processing':
-                  notificationMessage = `⚙️ Your order #${orderId.slice(-8)} is being prepared by the farmer`;
-                  notificationType = 'processing';
-                  break;
-                case 'shipped':
-                  notificationMessage = `🚚 Your order #${orderId.slice(-8)} is on the way!`;
-                  notificationType = 'shipped';
-                  break;
-                case 'delivered':
-                  notificationMessage = `🎉 Your order #${orderId.slice(-8)} has been delivered!`;
-                  notificationType = 'delivered';
-                  break;
-                default:
-                  notificationMessage = `📦 Order #${orderId.slice(-8)} status updated to ${newStatus}`;
-                  notificationType = 'info';
-              }
-              showNotification(notificationMessage);
-              
-              // Add to order notifications
-              setOrderNotifications(prev => [...prev, {
-                id: `${orderId}-${newStatus}-${Date.now()}`,
-                orderId,
-                message: notificationMessage,
-                type: notificationType,
-                timestamp: new Date()
-              }]);
+              announceStatusChange(orderId, newStatus);
             }
           });
         }
       } catch {}
-    }, 5000);
-    return () => clearInterval(interval);
+    };
+
+    // Order status changes are pushed over the event stream
+    const unsubscribe = subscribeToUpdates(user.id, {
+      onOrderStatus: ({ orderId, status }) => {
+        setTrackingStatuses(prev => ({ ...prev, [orderId]: status }));
+        setOrders(prev => prev.map(o => (o.id === orderId ? { ...o, status } : o)));
+        announceStatusChange(orderId, status);
+      },
+      onResync: refreshOrders
+    });
+    const interval = setInterval(refreshOrders, 60000);
+    return () => {
+      unsubscribe();
+      clearInterval(interval);
+    };
   }, [user.id]);
 
   useEffect(() => {
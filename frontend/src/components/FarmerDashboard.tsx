@@ -1,7 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Plus, Package, Bell, TrendingUp, IndianRupee, Upload, ShoppingBag, MessageCircle, AlertCircle, Trash2, Edit3, XCircle, User, Save, X, Phone, Users, FileText, History } from 'lucide-react';
-import { addProduct, getProducts, getNotifications, markNotificationRead, getFarmerOrders, updateUserProfile, getFarmerCustomers, getCustomerOrders, saveCustomerNote, deleteCustomerNote, Customer } from '../utils/database';
-import EXIF from 'exif-js';
+import { addProduct, uploadImage, getProducts, getNotifications, markNotificationRead, markNotificationsRead, getFarmerOrders, updateUserProfile, getFarmerCustomers, getCustomerOrders, saveCustomerNote, deleteCustomerNote, subscribeToUpdates, Customer } from '../utils/database';
 import Chatbot from './Chatbot';
 import notify from '../utils/notify';
 
@@ -24,491 +23,8 @@ interface FarmerDashboardProps {
   user: any;
 }
 
-// Check if image contains geotag data (strict verification)
-const checkImageGeoTag = (file: File): Promise<{ hasGeoTag: boolean; error?: string }> => {
-  return new Promise((resolve) => {
-    const reader = new FileReader();
-    reader.onload = () => {
-      const img = document.createElement('img');
-      img.src = reader.result as string;
-      
-      // Set timeout to prevent hanging
-      const timeout = setTimeout(() => {
-        console.warn('EXIF reading timeout');
-        resolve({ 
-          hasGeoTag: false, 
-          error: 'Geotag verification timeout. Please ensure your image contains GPS location data.' 
-        });
-      }, 8000);
-      
-      img.onload = () => {
-        try {
-          EXIF.getData(img as any, function(this: any) {
-            clearTimeout(timeout);
-            try {
-              // Get GPS coordinates - these are the primary indicators
-              const gpsLatitude = EXIF.getTag(this, 'GPSLatitude');
-              const gpsLatitudeRef = EXIF.getTag(this, 'GPSLatitudeRef');
-              const gpsLongitude = EXIF.getTag(this, 'GPSLongitude');
-              const gpsLongitudeRef = EXIF.getTag(this, 'GPSLongitudeRef');
-              
-              // Get all EXIF data for comprehensive checking
-              const allExifData = EXIF.getAllTags(this);
-              const gpsInfo = EXIF.getTag(this, 'GPS');
-              
-              // Debug logging
-              console.log('EXIF GPSLatitude:', gpsLatitude);
-              console.log('EXIF GPSLongitude:', gpsLongitude);
-              console.log('EXIF GPSLatitudeRef:', gpsLatitudeRef);
-              console.log('EXIF GPSLongitudeRef:', gpsLongitudeRef);
-              console.log('EXIF GPS Info:', gpsInfo);
-              
-              // Strict check: Must have actual GPS coordinates
-              let hasGeoTag = false;
-              
-              // Primary check: Valid GPS coordinates exist
-              if (gpsLatitude && gpsLongitude) {
-                // Verify coordinates are in valid format (array with numbers)
-                if (Array.isArray(gpsLatitude) && Array.isArray(gpsLongitude)) {
-                  // Check if arrays contain valid numeric values
-                  const latValid = gpsLatitude.length > 0 && gpsLatitude.some(v => typeof v === 'number');
-                  const longValid = gpsLongitude.length > 0 && gpsLongitude.some(v => typeof v === 'number');
-                  
-                  if (latValid && longValid) {
-                    hasGeoTag = true;
-                    console.log('✅ Valid GPS coordinates found');
-                  }
-                } else if (typeof gpsLatitude === 'number' && typeof gpsLongitude === 'number') {
-                  // Sometimes coordinates are direct numbers
-                  hasGeoTag = true;
-                  console.log('✅ Valid GPS coordinates found (numeric format)');
-                }
-              }
-              
-              // Secondary check: GPS info object exists with location data
-              if (!hasGeoTag && gpsInfo && typeof gpsInfo === 'object') {
-                // Check if GPS object has coordinate-related properties
-                const gpsKeys = Object.keys(gpsInfo);
-                const hasCoordinateKeys = gpsKeys.some(key => 
-                  key.includes('Latitude') || key.includes('Longitude') || key.includes('GPS')
-                );
-                if (hasCoordinateKeys) {
-                  hasGeoTag = true;
-                  console.log('✅ GPS location data found in GPS object');
-                }
-              }
-              
-              // Tertiary check: Look for GPS Map Camera metadata patterns
-              // GPS Map Camera apps often embed location in custom EXIF tags
-              if (!hasGeoTag && allExifData) {
-                const exifKeys = Object.keys(allExifData);
-                // Check for location-related tags
-                const locationIndicators = exifKeys.filter(key => 
-                  key.toLowerCase().includes('gps') || 
-                  key.toLowerCase().includes('location') ||
-                  key.toLowerCase().includes('latitude') ||
-                  key.toLowerCase().includes('longitude') ||
-                  key.toLowerCase().includes('coordinate')
-                );
-                
-                if (locationIndicators.length > 0) {
-                  // Verify that these tags actually contain meaningful data
-                  const hasValidLocationData = locationIndicators.some(key => {
-                    const value = allExifData[key];
-                    // Check if value is not null/undefined and has meaningful content
-                    return value !== null && value !== undefined && 
-                           (typeof value === 'number' || 
-                            (Array.isArray(value) && value.length > 0) ||
-                            (typeof value === 'string' && value.length > 0));
-                  });
-                  
-                  if (hasValidLocationData) {
-                    hasGeoTag = true;
-                    console.log('✅ Location metadata found in EXIF tags:', locationIndicators);
-                  }
-                }
-                
-                // Also check raw EXIF data for GPS IFD (Image File Directory)
-                // Some cameras store GPS data in a separate IFD
-                try {
-                  // Try to access GPS IFD directly if available
-                  const gpsIfd = (this as any).exifdata?.GPS;
-                  if (gpsIfd && typeof gpsIfd === 'object') {
-                    const gpsKeys = Object.keys(gpsIfd);
-                    if (gpsKeys.length > 0) {
-                      // Check for coordinate data in GPS IFD
-                      const hasCoordData = gpsKeys.some(key => {
-                        const val = gpsIfd[key];
-                        return val !== null && val !== undefined && 
-                               (Array.isArray(val) || typeof val === 'number' || typeof val === 'string');
-                      });
-                      if (hasCoordData) {
-                        hasGeoTag = true;
-                        console.log('✅ GPS IFD data found:', gpsKeys);
-                      }
-                    }
-                  }
-                } catch (e) {
-                  // Ignore errors accessing GPS IFD
-                }
-              }
-              
-              // Visual check: Try to detect GPS Map Camera overlay
-              // Strong visual overlay detection (high confidence) indicates GPS Map Camera overlay
-              // This helps identify GPS-geotagged images even when file content is binary/unreadable
-              let hasVisualOverlay = false;
-              let visualOverlayConfidence = 0;
-              
-              if (!hasGeoTag) {
-                try {
-                  const canvas = document.createElement('canvas');
-                  const ctx = canvas.getContext('2d');
-                  if (ctx) {
-                    canvas.width = img.width;
-                    canvas.height = img.height;
-                    ctx.drawImage(img, 0, 0);
-                    
-                    // Focus ONLY on bottom 15% where GPS Map Camera overlays are placed
-                    // GPS Map Camera overlays are typically:
-                    // 1. Horizontal dark bands/boxes at the very bottom
-                    // 2. Contain text (coordinates, location names)
-                    // 3. Have consistent dark background with lighter text
-                    const bottomRegionHeight = Math.floor(img.height * 0.15); // Bottom 15% only
-                    const bottomRegion = {
-                      x: 0,
-                      y: img.height - bottomRegionHeight,
-                      width: img.width,
-                      height: bottomRegionHeight
-                    };
-                    
-                    const imageData = ctx.getImageData(bottomRegion.x, bottomRegion.y, bottomRegion.width, bottomRegion.height);
-                    const totalPixels = imageData.data.length / 4;
-                    
-                    // Analyze bottom region for GPS overlay characteristics
-                    let veryDarkPixelCount = 0; // Very dark background pixels
-                    let darkPixelCount = 0;
-                    let lightPixelCount = 0; // Light text pixels
-                    let horizontalBandCount = 0; // Horizontal dark bands (typical of GPS overlays)
-                    
-                    // Check for horizontal bands (GPS overlays have horizontal dark bands)
-                    const rowHeight = Math.floor(bottomRegion.height / 10); // Divide into 10 horizontal bands
-                    const darkBandThreshold = 0.4; // 40% of row must be dark
-                    
-                    for (let band = 0; band < 10; band++) {
-                      let bandDarkCount = 0;
-                      const bandStartY = band * rowHeight;
-                      const bandEndY = Math.min((band + 1) * rowHeight, bottomRegion.height);
-                      
-                      for (let y = bandStartY; y < bandEndY; y++) {
-                        for (let x = 0; x < bottomRegion.width; x++) {
-                          const pixelIndex = (y * bottomRegion.width + x) * 4;
-                          const r = imageData.data[pixelIndex];
-                          const g = imageData.data[pixelIndex + 1];
-                          const b = imageData.data[pixelIndex + 2];
-                          const brightness = (r + g + b) / 3;
-                          
-                          if (brightness < 50) {
-                            bandDarkCount++;
-                          }
-                        }
-                      }
-                      
-                      const bandDarkRatio = bandDarkCount / (bottomRegion.width * (bandEndY - bandStartY));
-                      if (bandDarkRatio > darkBandThreshold) {
-                        horizontalBandCount++;
-                      }
-                    }
-                    
-                    // Analyze all pixels in bottom region
-                    for (let i = 0; i < imageData.data.length; i += 4) {
-                      const r = imageData.data[i];
-                      const g = imageData.data[i + 1];
-                      const b = imageData.data[i + 2];
-                      const brightness = (r + g + b) / 3;
-                      
-                      // Very dark pixels (overlay background)
-                      if (brightness < 30) {
-                        veryDarkPixelCount++;
-                        darkPixelCount++;
-                      } else if (brightness < 60) {
-                        darkPixelCount++;
-                      } else if (brightness > 180) {
-                        lightPixelCount++; // Light text on dark background
-                      }
-                    }
-                    
-                    const veryDarkRatio = veryDarkPixelCount / totalPixels;
-                    const darkRatio = darkPixelCount / totalPixels;
-                    const lightRatio = lightPixelCount / totalPixels;
-                    const contrastRatio = lightRatio > 0 && darkRatio > 0 ? (lightRatio + darkRatio) : 0;
-                    
-                    // STRICT criteria for GPS overlay detection:
-                    // 1. Must have significant very dark regions (overlay background)
-                    // 2. Must have horizontal band patterns (typical of GPS overlays)
-                    // 3. Must have contrast (dark background + light text)
-                    // 4. High threshold to avoid false positives from regular image content
-                    
-                    // More balanced thresholds - strict enough to reject false positives but lenient for real GPS overlays
-                    const hasStrongDarkBackground = veryDarkRatio > 0.10 && darkRatio > 0.20; // Lowered from 0.15/0.25
-                    const hasModerateDarkBackground = veryDarkRatio > 0.05 || darkRatio > 0.15; // Moderate dark region
-                    const hasHorizontalBands = horizontalBandCount >= 1; // At least 1 dark horizontal band (lowered from 2)
-                    const hasTextContrast = contrastRatio > 0.08 && lightRatio > 0.03; // Lowered thresholds
-                    
-                    // Calculate confidence score with more flexible criteria
-                    if (hasStrongDarkBackground) visualOverlayConfidence += 3;
-                    else if (hasModerateDarkBackground) visualOverlayConfidence += 1; // Partial credit for moderate dark
-                    
-                    if (hasHorizontalBands) {
-                      visualOverlayConfidence += 2;
-                      if (horizontalBandCount >= 2) visualOverlayConfidence += 1; // Bonus for multiple bands
-                    }
-                    
-                    if (hasTextContrast) visualOverlayConfidence += 2;
-                    if (veryDarkRatio > 0.20) visualOverlayConfidence += 1; // Extra dark background (lowered from 0.25)
-                    
-                    // Lowered threshold from 5 to 3 - accept if we have reasonable indicators
-                    // This allows GPS Map Camera images with overlays to pass while still rejecting false positives
-                    if (visualOverlayConfidence >= 3) {
-                      hasVisualOverlay = true;
-                      console.log(`📸 GPS overlay indicators detected in bottom region:`);
-                      console.log(`   Very dark ratio: ${(veryDarkRatio * 100).toFixed(1)}%, Dark ratio: ${(darkRatio * 100).toFixed(1)}%`);
-                      console.log(`   Horizontal bands: ${horizontalBandCount}, Text contrast: ${(contrastRatio * 100).toFixed(1)}%`);
-                      console.log(`   Confidence score: ${visualOverlayConfidence}`);
-                    } else {
-                      console.log(`⚠️ Weak visual indicators (confidence: ${visualOverlayConfidence})`);
-                      console.log(`   Very dark: ${(veryDarkRatio * 100).toFixed(1)}%, Bands: ${horizontalBandCount}, Contrast: ${(contrastRatio * 100).toFixed(1)}%`);
-                    }
-                  }
-                } catch (canvasError) {
-                  console.warn('Canvas detection error:', canvasError);
-                }
-              }
-              
-              // Final resolution: Check file content for GPS data
-              // Accept if we find GPS indicators in file content (whether visual overlay detected or not)
-              if (hasGeoTag) {
-                // Standard EXIF GPS data found - accept immediately
-                resolve({ hasGeoTag: true });
-              } else {
-                // Check file content for GPS data (whether visual overlay detected or not)
-                console.log(`🔍 Checking file content for GPS location data... (Visual overlay: ${hasVisualOverlay ? 'detected' : 'not detected'})`);
-                file.arrayBuffer().then(arrayBuffer => {
-                  try {
-                    const uint8Array = new Uint8Array(arrayBuffer);
-                    // Read larger portions of the file - check start, middle, and end
-                    // GPS Map Camera data can be embedded anywhere in the file
-                    const fileSize = uint8Array.length;
-                    const checkSize = Math.min(fileSize, 500000); // Check up to 500KB
-                    
-                    // Read from multiple sections: start, middle sections, and end
-                    const sections: string[] = [];
-                    const numSections = 5;
-                    for (let i = 0; i < numSections; i++) {
-                      const start = Math.floor((fileSize / numSections) * i);
-                      const end = Math.min(start + (checkSize / numSections), fileSize);
-                      const section = Array.from(uint8Array.slice(start, end))
-                        .map(byte => {
-                          // Keep printable ASCII and common whitespace, convert others to space
-                          if (byte >= 32 && byte <= 126) return String.fromCharCode(byte);
-                          if (byte === 9 || byte === 10 || byte === 13) return ' '; // Tab, LF, CR -> space
-                          return ' '; // Other non-printable -> space
-                        })
-                        .join('');
-                      sections.push(section);
-                    }
-                    const fileString = sections.join(' ');
-                    
-                    // Debug: Log a sample of what we found
-                    const sample = fileString.substring(0, 500).replace(/\s+/g, ' ');
-                    console.log('📄 File content sample (first 500 chars):', sample);
-                    
-                    // Very flexible location patterns - look for GPS data in many formats
-                    const locationPatterns = [
-                      /GPS\s*Map\s*Camera/i, // GPS Map Camera app signature (strongest indicator)
-                      /GPS.*Camera/i, // Any GPS Camera reference
-                      /Lat\s*[:\s]*[\d]+\.[\d]+/i, // "Lat 13.05" or "Lat 13.053006"
-                      /Long\s*[:\s]*[\d]+\.[\d]+/i, // "Long 77.71" or "Long 77.718094"
-                      /Latitude\s*[:\s]*[\d]+\.[\d]+/i,
-                      /Longitude\s*[:\s]*[\d]+\.[\d]+/i,
-                      /Coordinates?\s*[:\s]*[\d]+\.[\d]+/i,
-                      /Location\s*[:\s]*[A-Z][a-z]+/i, // "Location: City"
-                      /[\d]+\.[\d]+\s*[°]?\s*Long/i, // "13.0530° Long"
-                      /[\d]+\.[\d]+\s*[°]?\s*Lat/i, // "77.7180° Lat"
-                      /Bengaluru|Karnataka|India/i, // Location names from the apple image
-                      /Plus\s*Code/i, // "Plus Code" from GPS Map Camera
-                      /GMT\s*\+/i, // Timezone indicator
-                    ];
-                    
-                    const matches = locationPatterns.filter(pattern => pattern.test(fileString));
-                    const hasGPSMapCamera = /GPS\s*Map\s*Camera/i.test(fileString);
-                    
-                    // Look for coordinate patterns - very flexible
-                    // Find decimal numbers that look like coordinates
-                    // Pattern: 1-3 digits, decimal point, 1-8 digits (e.g., "13.053006", "77.718094")
-                    const coordinatePattern = /[\d]{1,3}\.[\d]{1,8}/g;
-                    const allNumbers = fileString.match(coordinatePattern) || [];
-                    
-                    // Also look for coordinates without word boundaries (might be embedded in text)
-                    const allNumbers2 = fileString.match(/[\d]+\.[\d]+/g) || [];
-                    const combinedNumbers = [...new Set([...allNumbers, ...allNumbers2])]; // Remove duplicates
-                    
-                    // Filter to likely coordinates - be very lenient
-                    // Accept any decimal number that could be a coordinate (0-180 range)
-                    const likelyCoordinates = combinedNumbers.filter(num => {
-                      try {
-                        const value = parseFloat(num);
-                        // Latitude: -90 to 90, Longitude: -180 to 180
-                        // Accept any value in this range, or close to it
-                        // Also accept if it has at least 2 decimal places (more likely to be a coordinate)
-                        const hasDecimal = num.includes('.');
-                        const decimalPlaces = hasDecimal ? num.split('.')[1].length : 0;
-                        return (value >= 0 && value <= 200) && (hasDecimal && decimalPlaces >= 1);
-                      } catch (e) {
-                        return false;
-                      }
-                    });
-                    
-                    // Check for Lat/Long labels
-                    const hasLat = /Lat/i.test(fileString);
-                    const hasLong = /Long/i.test(fileString);
-                    const hasLatLongLabels = hasLat && hasLong;
-                    
-                    // Check if we have coordinates near Lat/Long text
-                    // Look for patterns like "Lat 13.0530" or "13.0530 Long"
-                    const hasCoordinatePattern = (hasLat || hasLong) && likelyCoordinates.length >= 1;
-                    const hasTwoCoordinates = likelyCoordinates.length >= 2;
-                    
-                    const hasLocationText = /Location\s*[:\s]*[A-Z][a-z]+/i.test(fileString);
-                    const hasLocationName = /Bengaluru|Karnataka|India|City|State|Country/i.test(fileString);
-                    
-                    // Debug logging
-                    console.log('🔍 GPS Detection Results:');
-                    console.log(`   GPS Map Camera: ${hasGPSMapCamera}`);
-                    console.log(`   Pattern matches: ${matches.length}`);
-                    console.log(`   All numbers found: ${allNumbers.length}`);
-                    console.log(`   Likely coordinates: ${likelyCoordinates.length} (${likelyCoordinates.slice(0, 5).join(', ')})`);
-                    console.log(`   Has Lat: ${hasLat}, Has Long: ${hasLong}`);
-                    console.log(`   Has location text: ${hasLocationText || hasLocationName}`);
-                    console.log(`   Matched patterns:`, matches.map(m => m.toString()).slice(0, 5));
-                    
-                    // Very lenient matching - accept if we find ANY GPS indicators:
-                    // Option 1: Strong visual overlay detected (confidence >= 5) - GPS Map Camera overlays are visible
-                    // Option 2: GPS Map Camera signature in file (strongest - accept immediately)
-                    // Option 3: Any location name (Bengaluru, India, etc.) - strong indicator
-                    // Option 4: Coordinates (2+ decimal numbers) with Lat/Long labels
-                    // Option 5: Any coordinate + location text/name
-                    // Option 6: Multiple pattern matches (2+)
-                    // Option 7: Single coordinate with Lat or Long label
-                    // Option 8: Plus Code or GMT indicators (GPS Map Camera features)
-                    const hasPlusCode = /Plus\s*Code/i.test(fileString);
-                    const hasGMT = /GMT\s*\+/i.test(fileString);
-                    
-                    // If visual overlay was detected, accept it
-                    // GPS Map Camera apps add visible overlays with location data - if we can see it, it's geotagged
-                    // We set hasVisualOverlay = true when confidence >= 3, so if it's true, we should accept it
-                    // High confidence (>= 5) is even stronger evidence
-                    const strongVisualOverlay = hasVisualOverlay; // Accept if visual overlay was detected (confidence >= 3)
-                    const veryStrongVisualOverlay = hasVisualOverlay && visualOverlayConfidence >= 5; // Extra confidence for high scores
-                    
-                    // Debug: Log visual overlay status
-                    console.log(`🔍 Visual Overlay Check: hasVisualOverlay=${hasVisualOverlay}, confidence=${visualOverlayConfidence}`);
-                    console.log(`🔍 Visual Overlay Decision: strongVisualOverlay=${strongVisualOverlay}, veryStrongVisualOverlay=${veryStrongVisualOverlay}`);
-                    
-                    const shouldAccept = strongVisualOverlay || // Strong visual overlay = GPS Map Camera image
-                                       hasGPSMapCamera || 
-                                       hasLocationName || // Location names are strong indicators
-                                       hasPlusCode || // Plus Code is GPS Map Camera feature
-                                       (hasTwoCoordinates && hasLatLongLabels) ||
-                                       (hasCoordinatePattern && (hasLocationText || hasLocationName)) ||
-                                       (likelyCoordinates.length >= 1 && (hasLocationText || hasLocationName)) ||
-                                       (likelyCoordinates.length >= 1 && (hasLat || hasLong)) ||
-                                       matches.length >= 2 ||
-                                       (hasGMT && (hasLat || hasLong || likelyCoordinates.length >= 1));
-                    
-                    console.log(`🔍 Acceptance Check: shouldAccept=${shouldAccept}, strongVisualOverlay=${strongVisualOverlay}, fileContentMatches=${matches.length}`);
-                    
-                    if (shouldAccept) {
-                      console.log('✅ GPS location data FOUND');
-                      const reason = strongVisualOverlay ? `Visual overlay detected (confidence: ${visualOverlayConfidence}) - GPS Map Camera overlay visible` :
-                                    hasGPSMapCamera ? 'GPS Map Camera signature' : 
-                                    hasLocationName ? 'Location name found' :
-                                    hasPlusCode ? 'Plus Code found' :
-                                    hasTwoCoordinates && hasLatLongLabels ? 'Coordinates with Lat/Long labels' :
-                                    hasCoordinatePattern && (hasLocationText || hasLocationName) ? 'Coordinate pattern + location' :
-                                    likelyCoordinates.length >= 1 && (hasLocationText || hasLocationName) ? 'Coordinate + location text' :
-                                    likelyCoordinates.length >= 1 && (hasLat || hasLong) ? 'Coordinate + Lat/Long label' :
-                                    matches.length >= 2 ? 'Multiple pattern matches' :
-                                    hasGMT && (hasLat || hasLong || likelyCoordinates.length >= 1) ? 'GMT + GPS indicators' :
-                                    'GPS indicators found';
-                      console.log(`   Reason: ${reason}`);
-                      resolve({ hasGeoTag: true });
-                    } else {
-                      console.log('❌ No GPS location data found');
-                      console.log(`   Visual overlay: ${hasVisualOverlay ? `detected (confidence: ${visualOverlayConfidence})` : 'not detected'}`);
-                      console.log(`   File content - GPS Map Camera=${hasGPSMapCamera}, Location Name=${hasLocationName}, Plus Code=${hasPlusCode}`);
-                      console.log(`   File content - Coordinates=${likelyCoordinates.length}, Lat=${hasLat}, Long=${hasLong}, Matches=${matches.length}`);
-                      if (hasVisualOverlay && visualOverlayConfidence < 5) {
-                        console.log(`   ⚠️ Visual overlay detected but confidence too low (${visualOverlayConfidence} < 5)`);
-                      }
-                      resolve({ 
-                        hasGeoTag: false, 
-                        error: 'No GPS location data found in image. Please upload an image taken with GPS-enabled camera or GPS Map Camera app that includes location metadata.' 
-                      });
-                    }
-                  } catch (fileReadError) {
-                    console.warn('File string search error:', fileReadError);
-                    resolve({ 
-                      hasGeoTag: false, 
-                      error: 'No GPS location data found in image. Please upload an image taken with GPS-enabled camera or GPS Map Camera app that includes location metadata.' 
-                    });
-                  }
-                }).catch(() => {
-                  resolve({ 
-                    hasGeoTag: false, 
-                    error: 'No GPS location data found in image. Please upload an image taken with GPS-enabled camera or GPS Map Camera app that includes location metadata.' 
-                  });
-                });
-              }
-            } catch (error) {
-              clearTimeout(timeout);
-              console.error('Error reading EXIF tags:', error);
-              resolve({ 
-                hasGeoTag: false, 
-                error: 'Error reading image metadata. Please ensure your image contains GPS location data.' 
-              });
-            }
-          });
-        } catch (error) {
-          clearTimeout(timeout);
-          console.error('Error getting EXIF data:', error);
-          resolve({ 
-            hasGeoTag: false, 
-            error: 'Failed to read image metadata. Please upload a geotagged image with GPS location data.' 
-          });
-        }
-      };
-      
-      img.onerror = () => {
-        clearTimeout(timeout);
-        console.error('Error loading image');
-        resolve({ 
-          hasGeoTag: false, 
-          error: 'Failed to load image. Please try a different image file.' 
-        });
-      };
-    };
-    
-    reader.onerror = () => {
-      console.error('Error reading file');
-      resolve({ 
-        hasGeoTag: false, 
-        error: 'Error reading image file. Please try again.' 
-      });
-    };
-    
-    reader.readAsDataURL(file);
-  });
-};
+// The dashboard only shows recent activity; older notifications stay on the server
+const NOTIFICATION_PAGE_SIZE = 20;
 
 // Calculate effective price with 20% discount every 20 hours
 const getEffectivePrice = (product: any) => {
@@ -548,6 +64,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
     pricePerKg: '',
     availableQuantity: '',
     image: '',
+    imageId: '',
     isSeasonal: true,
     seasonalMonths: '1,2,3,4,5,6,7,8,9,10,11,12' // Default to year-round
   });
@@ -658,7 +175,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
       try {
         // Try to load products with error handling
         try {
-          const allProducts = await getProducts();
+          const allProducts = await getProducts({ farmerId: user.id });
           // Filter products that belong to this farmer and are still available
           const farmerProducts = allProducts.filter(p => p.farmerId === user.id && p.availableQuantity > 0);
           setProducts(farmerProducts);
@@ -669,7 +186,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
         
         // Try to load notifications with error handling
         try {
-          const response = await getNotifications(user.id);
+          const response = await getNotifications(user.id, { limit: NOTIFICATION_PAGE_SIZE });
           const farmerNotifications = (response as unknown as APINotification[]);
           setNotifications(farmerNotifications.map(n => ({
             id: n.id,
@@ -728,16 +245,19 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
     checkBackendStatus();
   }, [user.id]);
 
-  // Add effect to refresh orders periodically
+  // Keep orders, notifications and stock live from the event stream
   useEffect(() => {
-    const interval = setInterval(async () => {
+    const applyOrders = (farmerOrders: any[]) => {
+      setOrders(farmerOrders);
+      const activeCount = farmerOrders.filter(order => order.status === 'pending' || order.status === 'confirmed').length;
+      setActiveOrdersCount(activeCount);
+    };
+
+    // Full refresh; runs on (re)connect and as a slow fallback
+    const refreshAll = async () => {
       try {
-        const farmerOrders = await getFarmerOrders(user.id);
-        setOrders(farmerOrders);
-        const activeCount = farmerOrders.filter(order => order.status === 'pending' || order.status === 'confirmed').length;
-        setActiveOrdersCount(activeCount);
-        // Refresh notifications to include delivery updates
-        const response = await getNotifications(user.id);
+        applyOrders(await getFarmerOrders(user.id));
+        const response = await getNotifications(user.id, { limit: NOTIFICATION_PAGE_SIZE });
         const farmerNotifications = (response as unknown as APINotification[]);
         setNotifications(farmerNotifications.map(n => ({
           id: n.id,
@@ -746,30 +266,46 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
           read: n.read
         })));
         // Refresh products to remove expired ones (price = 0)
-        const allProducts = await getProducts();
-        const farmerProducts = allProducts.filter(p => {
+        const allProducts = await getProducts({ farmerId: user.id });
+        setProducts(allProducts.filter(p => {
           const { price } = getEffectivePrice(p);
           return p.farmerId === user.id && p.availableQuantity > 0 && price > 0;
-        });
-        setProducts(farmerProducts);
-        // If products count has decreased, check notifications for zero-price removals
-        if (farmerProducts.length < products.length) {
-          const newNotifs = farmerNotifications.filter(n => 
-            n.message.includes('automatically removed') && 
-            !n.read &&
-            new Date(n.timestamp) > new Date(Date.now() - 5000) // Only show notifications from last 5 seconds
-          );
-          newNotifs.forEach(notification => {
-            notify(notification.message, { variant: 'warning' });
-          });
-        }
+        }));
       } catch (error) {
         console.warn('Error refreshing orders (backend may be down):', error);
         // Don't clear existing data, just skip this refresh
       }
-    }, 5000); // Refresh every 5 seconds
-    
-    return () => clearInterval(interval);
+    };
+
+    const unsubscribe = subscribeToUpdates(user.id, {
+      onNotification: async (n) => {
+        setNotifications(prev => [{ id: n.id, message: n.message, timestamp: n.timestamp, read: n.read }, ...prev.filter(x => x.id !== n.id)]);
+        if (n.message.includes('automatically removed')) {
+          notify(n.message, { variant: 'warning' });
+        }
+        // New orders arrive as notifications; pick up their order rows
+        applyOrders(await getFarmerOrders(user.id));
+      },
+      onOrderStatus: ({ orderId, status }) => {
+        setOrders(prev => {
+          const updated = prev.map(o => (o.id === orderId ? { ...o, status } : o));
+          setActiveOrdersCount(updated.filter(order => order.status === 'pending' || order.status === 'confirmed').length);
+          return updated;
+        });
+      },
+      onProduct: (update) => {
+        setProducts(prev => prev
+          .map(p => (p.id === update.id ? { ...p, availableQuantity: update.availableQuantity } : p))
+          .filter(p => !(p.id === update.id && (update.deleted || update.availableQuantity <= 0))));
+      },
+      onResync: refreshAll
+    });
+    const interval = setInterval(refreshAll, 60000);
+
+    return () => {
+      unsubscribe();
+      clearInterval(interval);
+    };
   }, [user.id]);
 
   const handleImageUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
@@ -777,7 +313,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
     setImageError('');
     
     // Clear any previously selected image
-    setProductForm(prev => ({ ...prev, image: '' }));
+    setProductForm(prev => ({ ...prev, image: '', imageId: '' }));
     
     if (file) {
       // Basic file validations
@@ -790,37 +326,21 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
         return;
       }
       
-      // Check if image has geotag - STRICT VERIFICATION
+      // The server reads the GPS position from the photo's EXIF data while storing it
       try {
-        const result = await checkImageGeoTag(file);
-        
-        if (!result.hasGeoTag) {
-          // Reject image - no GPS data found
-          setImageError(result.error || 'Image does not contain GPS location data. Please upload a geotagged image taken with GPS-enabled camera or GPS Map Camera app.');
-          notify(result.error || 'Geotag verification failed. Please upload an image with GPS location data.', { variant: 'error' });
-          return; // Don't proceed with image upload
-        } else {
-          // GPS data found - proceed with image upload
-          console.log('✅ GPS location verified in image');
-          setImageError(''); // Clear any previous errors
-          
-          // Save image if it passes all checks
-          const reader = new FileReader();
-          reader.onload = (event) => {
-            const base64String = event.target?.result as string;
-            setProductForm(prev => ({ ...prev, image: base64String }));
-            notify('Image uploaded successfully! GPS location verified.', { variant: 'success' });
-          };
-          reader.onerror = () => {
-            setImageError('Failed to read image file. Please try again.');
-            notify('Failed to read image file', { variant: 'error' });
-          };
-          reader.readAsDataURL(file);
+        const uploaded = await uploadImage(file);
+        if (uploaded.geotag?.latitude == null || uploaded.geotag?.longitude == null) {
+          const message = 'No GPS location data found in image. Please upload a photo taken with location enabled on your camera.';
+          setImageError(message);
+          notify(message, { variant: 'error' });
+          return;
         }
+        setProductForm(prev => ({ ...prev, image: uploaded.url, imageId: uploaded.id }));
+        notify('Image uploaded successfully! GPS location verified.', { variant: 'success' });
       } catch (error) {
-        console.error('Error checking geotag:', error);
-        setImageError('Error verifying geotag. Please ensure your image contains GPS location data.');
-        notify('Geotag verification error. Please upload a geotagged image.', { variant: 'error' });
+        console.error('Image upload failed:', error);
+        setImageError(error instanceof Error ? error.message : 'Failed to upload image. Please try again.');
+        notify('Failed to upload image', { variant: 'error' });
       }
     }
   };
@@ -856,7 +376,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
       return;
     }
     
-    if (!productForm.image) {
+    if (!productForm.imageId) {
       notify('Please upload a product image. Image upload is mandatory.', { variant: 'warning' });
       return;
     }
@@ -868,6 +388,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
 
     const newProduct = {
       ...productForm,
+      image: undefined, // Preview URL only; the product references imageId
       farmerId: user.id,
       farmerName: user.name || user.fullName,
       farmerPhone: user.phone,
@@ -889,6 +410,7 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
           pricePerKg: '',
           availableQuantity: '',
           image: '',
+          imageId: '',
           isSeasonal: true,
           seasonalMonths: '1,2,3,4,5,6,7,8,9,10,11,12'
         });
@@ -906,6 +428,13 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
     setNotifications(prev => prev.map(n => n.id === notificationId ? { ...n, read: true } : n));
   };
 
+  const handleMarkAllRead = () => {
+    // Notifications are newest first, so the first one bounds everything loaded so far
+    if (notifications.length === 0) return;
+    markNotificationsRead(user.id, notifications[0].id);
+    setNotifications(prev => prev.map(n => ({ ...n, read: true })));
+  };
+
   const toggleSelectProduct = (productId: string) => {
     setSelectedProductIds(prev => {
       const next = new Set(prev);
@@ -1075,6 +604,14 @@ const FarmerDashboard: React.FC<FarmerDashboardProps> = ({ user }) => {
         <div className="flex items-center space-x-3 mb-6">
           <Bell className="h-6 w-6 text-blue-600" />
           <h3 className="text-2xl font-bold text-gray-900">Recent Activity</h3>
+          {notifications.some(n => !n.read) && (
+            <button
+              onClick={handleMarkAllRead}
+              className="ml-auto text-sm font-medium text-blue-600 hover:text-blue-800"
+            >
+              Mark all as read
+            </button>
+          )}
         </div>
         <div className="space-y-3">
           {notifications.slice(0, 5).map(notification => {
@@ -10,6 +10,8 @@ interface User {
   phone: string;
   whatsapp?: string;
   address: string;
+  latitude?: number | null;
+  longitude?: number | null;
   password: string;
   isBlocked?: boolean;
   createdAt?: string;
@@ -32,6 +34,9 @@ interface Product {
   seasonalMonths?: string;
   inSeason?: boolean;
   recommendationScore?: number;
+  latitude?: number | null;
+  longitude?: number | null;
+  distanceKm?: number;  // Only from getNearbyProducts
   createdAt?: string;
 }
 
@@ -102,6 +107,26 @@ async function authenticatedApiCall(endpoint: string, token: string, options: Re
   });
 }
 
+// Authenticated call for non-idempotent writes: every retry reuses one Idempotency-Key,
+// so a request that reached the server before the connection dropped is not applied twice
+async function idempotentApiCall(endpoint: string, token: string, options: RequestInit = {}, retries = 2) {
+  const key = typeof crypto !== 'undefined' && 'randomUUID' in crypto
+    ? crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await authenticatedApiCall(endpoint, token, {
+        ...options,
+        headers: { 'Idempotency-Key': key, ...options.headers },
+      });
+    } catch (error) {
+      // fetch() rejects with a TypeError on network failures; HTTP errors are not retried
+      if (!(error instanceof TypeError) || attempt >= retries) throw error;
+      await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+    }
+  }
+}
+
 // Authentication Functions
 export async function loginUser(email: string, password: string): Promise<User | null> {
   try {
@@ -183,10 +208,36 @@ export async function applyNewPassword(phone: string, newPassword: string): Prom
 
 
 // Product Functions
-export async function getProducts(): Promise<Product[]> {
+export interface ProductFilters {
+  farmerId?: string;
+  cropCategory?: string;
+  inSeason?: boolean;
+  minPrice?: number;
+  maxPrice?: number;
+  fields?: string[];
+}
+
+const PRODUCT_PAGE_SIZE = 100;
+
+export async function getProducts(filters: ProductFilters = {}): Promise<Product[]> {
   try {
-    const response = await apiCall('/products');
-    const products = response.products || [];
+    const params = new URLSearchParams({ limit: String(PRODUCT_PAGE_SIZE) });
+    if (filters.farmerId) params.set('farmerId', filters.farmerId);
+    if (filters.cropCategory) params.set('cropCategory', filters.cropCategory);
+    if (filters.inSeason !== undefined) params.set('inSeason', String(filters.inSeason));
+    if (filters.minPrice !== undefined) params.set('minPrice', String(filters.minPrice));
+    if (filters.maxPrice !== undefined) params.set('maxPrice', String(filters.maxPrice));
+    if (filters.fields?.length) params.set('fields', filters.fields.join(','));
+
+    // Follow keyset cursors until the catalog is exhausted
+    const products: Product[] = [];
+    let cursor: string | null = null;
+    do {
+      if (cursor) params.set('cursor', cursor);
+      const response = await apiCall(`/products?${params.toString()}`);
+      products.push(...(response.products || []));
+      cursor = response.nextCursor || null;
+    } while (cursor);
 
     // Filter out and handle zero-price products
     return products.filter((product: Product) => {
@@ -204,7 +255,64 @@ export async function getProducts(): Promise<Product[]> {
   }
 }
 
-export async function addProduct(productData: Partial<Product>): Promise<Product | null> {
+// Available products within radiusKm of a point, nearest first
+export async function getNearbyProducts(
+  latitude: number,
+  longitude: number,
+  radiusKm = 10,
+  filters: Pick<ProductFilters, 'cropCategory' | 'fields'> = {}
+): Promise<Product[]> {
+  try {
+    const params = new URLSearchParams({
+      lat: String(latitude),
+      lon: String(longitude),
+      radius_km: String(radiusKm),
+      limit: String(PRODUCT_PAGE_SIZE)
+    });
+    if (filters.cropCategory) params.set('cropCategory', filters.cropCategory);
+    if (filters.fields?.length) params.set('fields', filters.fields.join(','));
+    const response = await apiCall(`/products/nearby?${params.toString()}`);
+    return response.products || [];
+  } catch (error) {
+    console.error('Failed to fetch nearby products:', error);
+    return [];
+  }
+}
+
+export interface ImageHandle {
+  id: string;
+  url: string;
+  width?: number;
+  height?: number;
+  // Read from the photo's EXIF data; null fields when it has none
+  geotag?: {
+    latitude: number | null;
+    longitude: number | null;
+    takenAt: string | null;
+  };
+}
+
+// Streams the file as multipart/form-data; pass the returned id to addProduct as imageId
+export async function uploadImage(file: File): Promise<ImageHandle> {
+  const token = localStorage.getItem('authToken');
+  if (!token) throw new Error('Authentication required');
+
+  const body = new FormData();
+  body.append('image', file);
+  // No Content-Type header: the browser sets the multipart boundary
+  const response = await fetch(`${API_BASE_URL}/images`, {
+    method: 'POST',
+    headers: { 'Authorization': `Bearer ${token}` },
+    body,
+  });
+  const data = await response.json();
+  if (!response.ok) {
+    throw new Error(data.message || `HTTP error! status: ${response.status}`);
+  }
+  return data.image;
+}
+
+export async function addProduct(productData: Partial<Product> & { imageId?: string }): Promise<Product | null> {
   try {
     const token = localStorage.getItem('authToken');
     if (!token) throw new Error('Authentication required');
@@ -281,7 +389,7 @@ export async function addToCart(userId: string, productId: string, quantity: num
     console.log('Sending cart add request:', requestData);
     console.log('Token present:', !!token);
 
-    const response = await authenticatedApiCall('/cart/add', token, {
+    const response = await idempotentApiCall('/cart/add', token, {
       method: 'POST',
       body: JSON.stringify(requestData),
     });
@@ -347,7 +455,7 @@ export async function placeOrder(userId: string, items: CartItem[], deliveryAddr
 
     console.log('Placing order with data:', orderData);
 
-    const response = await authenticatedApiCall('/orders', token, {
+    const response = await idempotentApiCall('/orders', token, {
       method: 'POST',
       body: JSON.stringify(orderData),
     });
@@ -384,12 +492,26 @@ export async function getOrders(userId: string): Promise<Order[]> {
 }
 
 // Notification Functions
-export async function getNotifications(userId: string): Promise<Notification[]> {
+export interface NotificationQuery {
+  limit?: number;
+  cursor?: string;
+  since?: string; // ISO timestamp; only newer notifications are returned
+  unreadFirst?: boolean;
+}
+
+export async function getNotifications(userId: string, query: NotificationQuery = {}): Promise<Notification[]> {
   try {
     const token = localStorage.getItem('authToken');
     if (!token) throw new Error('Authentication required');
 
-    const response = await authenticatedApiCall(`/notifications/${userId}`, token);
+    const params = new URLSearchParams();
+    if (query.limit) params.set('limit', String(query.limit));
+    if (query.cursor) params.set('cursor', query.cursor);
+    if (query.since) params.set('since', query.since);
+    if (query.unreadFirst) params.set('unreadFirst', 'true');
+    const qs = params.toString();
+
+    const response = await authenticatedApiCall(`/notifications/${userId}${qs ? `?${qs}` : ''}`, token);
     return response.notifications || [];
   } catch (error) {
     console.error('Failed to fetch notifications:', error);
@@ -397,6 +519,37 @@ export async function getNotifications(userId: string): Promise<Notification[]>
   }
 }
 
+export async function getUnreadNotificationCount(userId: string): Promise<number> {
+  try {
+    const token = localStorage.getItem('authToken');
+    if (!token) throw new Error('Authentication required');
+
+    const response = await authenticatedApiCall(`/notifications/${userId}/unread-count`, token);
+    return response.unreadCount || 0;
+  } catch (error) {
+    console.error('Failed to fetch unread notification count:', error);
+    return 0;
+  }
+}
+
+// Marks every notification up to and including `upTo` (all of them if omitted) as read
+export async function markNotificationsRead(userId: string, upTo?: string): Promise<boolean> {
+  try {
+    const token = localStorage.getItem('authToken');
+    if (!token) throw new Error('Authentication required');
+
+    const response = await authenticatedApiCall(`/notifications/${userId}/read-all`, token, {
+      method: 'PUT',
+      body: JSON.stringify(upTo ? { upTo } : {}),
+    });
+
+    return response.success;
+  } catch (error) {
+    console.error('Failed to mark notifications as read:', error);
+    return false;
+  }
+}
+
 export async function markNotificationRead(notificationId: string): Promise<boolean> {
   try {
     const token = localStorage.getItem('authToken');
@@ -686,13 +839,24 @@ export function getAuthToken(): string | null {
 }
 
 // Additional functions needed for the updated components
+const FARMER_ORDER_PAGE_SIZE = 100;
+
 export async function getFarmerOrders(farmerId: string): Promise<Order[]> {
   try {
     const token = localStorage.getItem('authToken');
     if (!token) throw new Error('Authentication required');
 
-    const response = await authenticatedApiCall(`/orders/farmer/${farmerId}`, token);
-    return response.orders || [];
+    // The dashboard totals need every order, so follow keyset cursors to the end
+    const params = new URLSearchParams({ limit: String(FARMER_ORDER_PAGE_SIZE) });
+    const orders: Order[] = [];
+    let cursor: string | null = null;
+    do {
+      if (cursor) params.set('cursor', cursor);
+      const response = await authenticatedApiCall(`/orders/farmer/${farmerId}?${params.toString()}`, token);
+      orders.push(...(response.orders || []));
+      cursor = response.nextCursor || null;
+    } while (cursor);
+    return orders;
   } catch (error) {
     console.error('Failed to fetch farmer orders:', error);
     return [];
@@ -755,3 +919,42 @@ export async function updateUserProfile(userId: string, profileData: Partial<Use
     return { success: false };
   }
 }
+
+// Live updates (Server-Sent Events)
+export interface StreamHandlers {
+  onNotification?: (notification: { id: string; userId: string; message: string; timestamp: string; read: boolean }) => void;
+  onOrderStatus?: (update: { orderId: string; status: string; previousStatus: string }) => void;
+  onProduct?: (update: { id: string; availableQuantity: number; expiresAt: string | null; deleted: boolean }) => void;
+  // Called when the stream (re)connects or events were dropped; refetch anything that may be stale
+  onResync?: () => void;
+}
+
+export function subscribeToUpdates(userId: string, handlers: StreamHandlers): () => void {
+  const token = localStorage.getItem('authToken');
+  if (!token || typeof EventSource === 'undefined') return () => {};
+
+  const source = new EventSource(`${API_BASE_URL}/stream/${userId}?token=${encodeURIComponent(token)}`);
+  let connectedOnce = false;
+  const listen = (event: string, handler?: (data: any) => void) => {
+    if (!handler) return;
+    source.addEventListener(event, (e) => {
+      try {
+        handler(JSON.parse((e as MessageEvent).data));
+      } catch (error) {
+        console.error(`Failed to handle ${event} event:`, error);
+      }
+    });
+  };
+
+  listen('notification', handlers.onNotification);
+  listen('order_status', handlers.onOrderStatus);
+  listen('product', handlers.onProduct);
+  listen('resync', handlers.onResync);
+  // The server closes streams periodically; events published while reconnecting are caught up by a resync
+  source.addEventListener('ready', () => {
+    if (connectedOnce) handlers.onResync?.();
+    connectedOnce = true;
+  });
+
+  return () => source.close();
+}